@@ -4,19 +4,57 @@
 #Date: April 16, 2018
 #Purpose: Class for handling testbeam bar data
 
-import os,sys, argparse
-from ROOT import gROOT, TH1D, TFile, TTree, TChain, TCanvas, TH2D, TLegend, gStyle, TLatex, TProfile, TF1, TGraph, TMath
+import os,sys, argparse, inspect, time
+import multiprocessing
+import numpy
+from ROOT import gROOT, TH1, TH1D, TNamed, TFile, TTree, TChain, TCanvas, TH2D, TLegend, gStyle, TLatex, TProfile, TF1, TGraph, TMath
+from treeIO import readChunks, readWaveforms, mergeFields, branchProfiles, setBranchProfile, getBytesRead, printIOReport, getTreeFiles, buildChain, skimType, writeSkimRows
+from waveformTools import findFirstCrossing, findPercentCrossing, findCrossingTime, findCrossingTimes
+from edgeFitter import fitLeadingEdges, evaluateEdge
+from ratioTiming import recoWaveforms, getChannelDRS, readRatioCalibration
+from timingCache import timingCache, getFileIdentity
+from histRegistry import bookHistograms, getBarFillRules, applyFillRules
+from stageTimers import stageTimers
+from renderPlots import getPlotId, getPlotHashes, readRenderState, writeRenderState, isUnchanged, getRenderGroups
+from waveformStore import waveformStore
+from snapshotServer import snapshotServer
+from barGeometry import barGeometry, vetoOptions
+
+# veto options stored as bits of skim column vetoBits, in this order
+skimVetoOptions = vetoOptions
+
+def processShard(shard):
+    """ function run in worker processes: fill histograms for one entry range of the tree and save them to a file. returns (events processed, bytes read, stage timers, edge fit counts)"""
+    files, treeName, runType, topDir, vetoOpt, signalThreshold, engine, chunkSize, fitEngine, entryRange, storeDir, ratioCalibration, histFile, cacheDir, timeStages = shard
+    shardBar = barClass(buildChain(files, treeName), runType, topDir, vetoOpt, signalThreshold=signalThreshold, engine=engine, chunkSize=chunkSize, fitEngine=fitEngine, entryRange=entryRange, histFile=histFile,
+                        cacheDir=cacheDir, timeStages=timeStages, storeDir=storeDir, ratioCalibration=ratioCalibration)
+
+    return shardBar.nEvents, shardBar.bytesRead, shardBar.timers.getStats(), shardBar.edgeFitCounts
+
+def renderPlotGroup(group):
+    """ function run in worker processes: draw plots of one group from histograms saved in histFile, in ROOT batch mode. returns list of (plot id, printed file)"""
+    runType, topDir, histFile, plots = group
+    gROOT.SetBatch(True)
+    renderBar = barClass(None, runType, topDir, None, runAnalysis=False)
+    renderBar.addHistograms(histFile)
+
+    return [(getPlotId(plot), renderBar.drawPlot(plot)) for plot in plots]
 
 class barClass:
-    def __init__(self, tree, runType, topDir, vetoOpt, test=False):
+    def __init__(self, tree, runType, topDir, vetoOpt, test=False, engine='event', chunkSize=1000, fitEngine='root', nWorkers=1, entryRange=None, histFile=None, signalThreshold=None, configs=None, runAnalysis=True, cacheDir=None, checkpointEvery=0, resume=False, timeStages=False, skimFile=None, storeDir=None, ratioCalibration=None, snapshotPort=None):
         self.tree = tree
         self.topDir = topDir
-        self.signalThreshold = 0
-        self.vetoThreshold = 0
-        self.xBoundaries = []
-        self.yBoundaries = []
-        self.yIntegralOffset = 0
-        self.setVarsByRunType(runType)
+        self.baseDir = topDir
+        self.runType = runType
+        self.geometry = self.getGeometry(runType) # bars, channels, boundaries, and thresholds of run type, see barGeometry
+        self.bars = self.geometry.bars
+        self.signalThreshold = self.geometry.signalThreshold
+        self.vetoThreshold = self.geometry.vetoThreshold
+        self.xBoundaries = self.geometry.xBoundaries
+        self.yBoundaries = self.geometry.yBoundaries
+        self.yIntegralOffset = self.geometry.yIntegralOffset
+        if signalThreshold is not None: # override run type default
+            self.signalThreshold = signalThreshold
         self.vetoOpt = vetoOpt
         self.isTest = test
         self.fitPercentThreshold = 0.06
@@ -30,71 +68,51 @@ class barClass:
         self.fitTimeWindow = 7
         self.fitMCPTimeWindow = 4
         self.fitFunction = "landau"
-
-        self.h_b1 = TH2D("h_b1", "h_b1", 40, -5, 35, 35, 0, 35)
-        self.h_b2 = TH2D("h_b2", "h_b2", 40, -5, 35, 35, 0, 35)
-        self.h_b3 = TH2D("h_b3", "h_b3", 40, -5, 35, 35, 0, 35)
-        self.h_b4 = TH2D("h_b4", "h_b4", 40, -5, 35, 35, 0, 35)
-        self.h_b5 = TH2D("h_b5", "h_b5", 40, -5, 35, 35, 0, 35)
-        self.h_b1_t = TH2D("h_b1_t", "h_b1_t", 40, -5, 35, 35, 0, 35)
-        self.h_b2_t = TH2D("h_b2_t", "h_b2_t", 40, -5, 35, 35, 0, 35)
-        self.h_b3_t = TH2D("h_b3_t", "h_b3_t", 40, -5, 35, 35, 0, 35)
-        self.h_b4_t = TH2D("h_b4_t", "h_b4_t", 40, -5, 35, 35, 0, 35)
-        self.h_b5_t = TH2D("h_b5_t", "h_b5_t", 40, -5, 35, 35, 0, 35)
-        
-        self.h_mcp0_ch1 = TH1D("h_mcp0_bar1", "h_mcp0_ch1", 25, 0, 500);
-        self.h_mcp0_ch3 = TH1D("h_mcp0_bar3", "h_mcp0_ch3", 25, 0, 500);
-        self.h_mcp0_ch5 = TH1D("h_mcp0_bar5", "h_mcp0_ch5", 25, 0, 500);
-        self.h_mcp1_ch10 = TH1D("h_mcp1_ch10", "h_mcp1_ch10", 25, 0, 500);
-        self.h_mcp1_ch12 = TH1D("h_mcp1_ch12", "h_mcp1_ch12", 25, 0, 500);
-        
-        self.h_ch1_vs_ch2 = TH2D("h_ch1_vs_ch2", "h_ch1_vs_ch2", 22, 0, 1100, 22, 0, 1100)
-        self.h_ch3_vs_ch4 = TH2D("h_ch3_vs_ch4", "h_ch3_vs_ch4", 22, 0, 1100, 22, 0, 1100)
-        self.h_ch5_vs_ch6 = TH2D("h_ch5_vs_ch6", "h_ch5_vs_ch6", 22, 0, 1100, 22, 0, 1100)
-        self.h_ch10_vs_ch11 = TH2D("h_ch10_vs_ch11", "h_ch10_vs_ch11", 22, 0, 1100, 22, 0, 1100)
-        self.h_ch12_vs_ch13 = TH2D("h_ch12_vs_ch13", "h_ch12_vs_ch13", 22, 0, 1100, 22, 0, 1100)
-        
-        self.h_ch1_ch2_x_vs_ratio = TProfile("h_ch1_ch2_x_vs_ratio", "h_ch1_ch2_x_vs_ratio", 40, -5, 35, 0, 2)
-        self.h_ch3_ch4_x_vs_ratio = TProfile("h_ch3_ch4_x_vs_ratio", "h_ch3_ch4_x_vs_ratio", 40, -5, 35, 0, 2)
-        self.h_ch5_ch6_x_vs_ratio = TProfile("h_ch5_ch6_x_vs_ratio", "h_ch5_ch6_x_vs_ratio", 40, -5, 35, 0, 2)
-        self.h_ch10_ch11_x_vs_ratio = TProfile("h_ch10_ch11_x_vs_ratio", "h_ch10_ch11_x_vs_ratio", 40, -5, 35, 0, 2)
-        self.h_ch12_ch13_x_vs_ratio = TProfile("h_ch12_ch13_x_vs_ratio", "h_ch12_ch13_x_vs_ratio", 40, -5, 35, 0, 2)
-
-        self.h_ch1_x_vs_amp = TProfile("h_ch1_x_vs_amp", "h_ch1_x_vs_amp", 40, -5, 35, 0, 1000)
-        self.h_ch2_x_vs_amp = TProfile("h_ch2_x_vs_amp", "h_ch2_x_vs_amp", 40, -5, 35, 0, 1000)
-        self.h_ch3_x_vs_amp = TProfile("h_ch3_x_vs_amp", "h_ch3_x_vs_amp", 40, -5, 35, 0, 1000)
-        self.h_ch4_x_vs_amp = TProfile("h_ch4_x_vs_amp", "h_ch4_x_vs_amp", 40, -5, 35, 0, 1000)
-        self.h_ch5_x_vs_amp = TProfile("h_ch5_x_vs_amp", "h_ch5_x_vs_amp", 40, -5, 35, 0, 1000)
-        self.h_ch6_x_vs_amp = TProfile("h_ch6_x_vs_amp", "h_ch6_x_vs_amp", 40, -5, 35, 0, 1000)
-        self.h_ch10_x_vs_amp = TProfile("h_ch10_x_vs_amp", "h_ch10_x_vs_amp", 40, -5, 35, 0, 1000)
-        self.h_ch11_x_vs_amp = TProfile("h_ch11_x_vs_amp", "h_ch11_x_vs_amp", 40, -5, 35, 0, 1000)
-        self.h_ch12_x_vs_amp = TProfile("h_ch12_x_vs_amp", "h_ch12_x_vs_amp", 40, -5, 35, 0, 1000)
-        self.h_ch13_x_vs_amp = TProfile("h_ch13_x_vs_amp", "h_ch13_x_vs_amp", 40, -5, 35, 0, 1000)
-
-        self.h_ch1_x_vs_time = TProfile("h_ch1_x_vs_time", "h_ch1_x_vs_time", 40, -5, 35, 0, 100)
-        self.h_ch2_x_vs_time = TProfile("h_ch2_x_vs_time", "h_ch2_x_vs_time", 40, -5, 35, 0, 100)
-        self.h_ch3_x_vs_time = TProfile("h_ch3_x_vs_time", "h_ch3_x_vs_time", 40, -5, 35, 0, 100)
-        self.h_ch4_x_vs_time = TProfile("h_ch4_x_vs_time", "h_ch4_x_vs_time", 40, -5, 35, 0, 100)
-        self.h_ch5_x_vs_time = TProfile("h_ch5_x_vs_time", "h_ch5_x_vs_time", 40, -5, 35, 0, 100)
-        self.h_ch6_x_vs_time = TProfile("h_ch6_x_vs_time", "h_ch6_x_vs_time", 40, -5, 35, 0, 100)
-        self.h_ch10_x_vs_time = TProfile("h_ch10_x_vs_time", "h_ch10_x_vs_time", 40, -5, 35, 0, 100)
-        self.h_ch11_x_vs_time = TProfile("h_ch11_x_vs_time", "h_ch11_x_vs_time", 40, -5, 35, 0, 100)
-        self.h_ch12_x_vs_time = TProfile("h_ch12_x_vs_time", "h_ch12_x_vs_time", 40, -5, 35, 0, 100)
-        self.h_ch13_x_vs_time = TProfile("h_ch13_x_vs_time", "h_ch13_x_vs_time", 40, -5, 35, 0, 100)
-
-        self.h_allChannel_timing = TH1D("h_allChannel_timing", "h_allChannel_timing", 60, 0, 60)
-        self.h_allChannel_timingRes = TH1D("h_allChannel_timingRes", "h_allChannel_timingRes", 300, -1500, 1500)
-        self.h_allChannel_timingLogic = TH1D("h_allChannel_timingLogic", "h_allChannel_timingLogic", 4, 0, 4)
-        #self.h_allChannel_mcpRef_timingRes = TH1D("h_allChannel_mcpRef_timingRes", "h_allChannel_mcpRef_timingRes", 300, -1500, 1500)
-        self.h_allChannel_mcpRef_timingRes = TH1D("h_allChannel_mcpRef_timingRes", "h_allChannel_mcpRef_timingRes", 350, -3500, 0)
-        self.h_allCh_x_vs_timingRes = TProfile("h_allCh_x_vs_timingRes", "h_allCh_x_vs_timingRes", 40, -5, 35, -1500, 1500)
-        #self.h_allCh_x_vs_mcpRef_timingRes = TProfile("h_allCh_x_vs_mcpRef_timingRes", "h_allCh_x_vs_mcpRef_timingRes", 40, -5, 35, -1500, 1500)
-        self.h_allCh_x_vs_mcpRef_timingRes = TProfile("h_allCh_x_vs_mcpRef_timingRes", "h_allCh_x_vs_mcpRef_timingRes", 40, -5, 35, -2500, 0)
-
-        self.c1 = TCanvas("c1", "c1", 800, 800)
-        self.c2 = TCanvas("c2", "c2", 800, 800)
-        self.c3 = TCanvas("c3", "c3", 800, 800)
-        self.c4 = TCanvas("c4", "c4", 800, 800)
+        self.fitTimeStep = 0.1 # in ns, step used to bracket threshold crossing of fitted function
+        self.fitTimeTolerance = 0.0001 # in ns, precision of threshold crossing time
+        self.ratioChannel = getChannelDRS() # T(R) and A(R) calibration of SiPM waveforms for fitEngine ratio, see ratioTiming
+        self.ratioCalibration = ratioCalibration # calibration file (or directory of versioned files, latest is used) from calibrateRatios.py, replacing ratioChannel per DRS channel
+        self.ratioChannels = {}
+        if ratioCalibration is not None:
+            self.ratioChannels, calibrationFile = readRatioCalibration(ratioCalibration)
+            print "-- ratio calibration {0}: channels {1}".format(calibrationFile, ', '.join(str(c) for c in sorted(self.ratioChannels)))
+        self.engine = engine # event: PyROOT loop over events, batch: numpy arrays in chunks of chunkSize events, twoPass: batch with waveforms read only for selected events, skim: tree is a skim written with skimFile
+        self.chunkSize = chunkSize
+        self.fitEngine = fitEngine # root: TGraph + TF1 fit per waveform, batch: edgeFitter on all selected waveforms of a chunk, ratio: sample-ratio method of RecoWaveForm on all selected waveforms of a chunk (batch/twoPass engines only)
+        self.nWorkers = nWorkers # >1: split entries into nWorkers shards filled in parallel worker processes
+        self.entryRange = entryRange # (first, last) entries to process, None for all
+        self.histFile = histFile # if set, save histograms to this file instead of drawing plots (used by worker processes)
+        self.configs = configs if configs is not None else [] # extra (vetoOpt, signalThreshold, topDir) configurations filled in the same pass, sharing waveform timing
+        self.configBars = [] # barClass instances holding histograms of self.configs
+        self.cacheDir = cacheDir # if set, reconstructed times are read from/written to a timingCache in this directory
+        self.timingCache = None
+        self.entry = -1 # tree entry of current event (loopEvents)
+        self.chunkEntries = numpy.zeros(0, dtype=numpy.int64) # tree entry of each row of current chunk (batch engines)
+        self.checkpointEvery = checkpointEvery # if > 0, save histograms and next entry to topDir/checkpoint.root every checkpointEvery events and at the end
+        self.resume = resume # continue from checkpoint: after a crash, or to add only entries of run files appended to the chain since
+        self.resumeEntry = 0 # first entry not in checkpoint
+        self.skimFile = skimFile # if set, batch engine also writes one row per event and bar with times and selection flags to this file, see getSkimRows
+        self.skimRowsWritten = 0
+        self.storeDir = storeDir # if set, batch/twoPass engines read time and channel from the waveformStore in this directory instead of the tree
+        self.waveformStore = None
+        self.branches = branchProfiles['skim'] if self.engine == 'skim' else branchProfiles['timing'] # only branches read by this class
+        self.timers = stageTimers(timeStages) # wall time and calls of hot-path stages, reported at end of run if timeStages
+        self.edgeFitCounts = {'fitted' : 0, 'notConverged' : 0} # leading-edge fits of fitEngine batch, non-converged ones get time 0. reported at end of run
+        self.snapshotPort = snapshotPort # if set, serve JSON snapshots of histograms and counters on localhost:snapshotPort while looping, see snapshotServer
+        self.snapshotServer = None
+
+        # histograms are owned by this instance, not gDirectory, so several configurations can book the same names
+        addDirectory = TH1.AddDirectoryStatus()
+        TH1.AddDirectory(False)
+
+        # all histograms declared in histRegistry, booked once per bar
+        self.histograms = bookHistograms( dict((barNum, self.getChannelsForBar(barNum)) for barNum in self.bars) )
+        for name, h in self.histograms.items(): # attribute aliases, e.g. self.h_ch1_x_vs_amp
+            setattr(self, name, h)
+        self.barFillRules = dict( (barNum, getBarFillRules(self.histograms, barNum, self.getChannelsForBar(barNum))) for barNum in self.bars )
+        for iBin, label in enumerate(["Both", "R only", "L only", "None"]): # fixed bin order so histograms of different shards can be added
+            self.h_allChannel_timingLogic.GetXaxis().SetBinLabel(iBin + 1, label)
+        TH1.AddDirectory(addDirectory)
 
         gStyle.SetOptStat(0000)
 
@@ -105,174 +123,371 @@ class barClass:
         if not os.path.isdir( '{0}/{1}'.format(topDir, runType) ):
             os.system( 'mkdir {0}'.format(self.topDir) )
 
-        # run analysis
-        self.loopEvents()
+        self.checkpointFile = '{0}/checkpoint.root'.format(self.topDir)
+        self.plotHistFile = '{0}/histograms.root'.format(self.topDir) # histograms read by render stage, see renderPlots
+
+        if not runAnalysis: # histograms filled by another instance, see loopEventsMultiConfig
+            return
+
+        # run analysis, reading only needed branches
+        runStart = time.time()
+        self.nEvents, self.bytesRead = self.processEvents()
+        printIOReport(self.tree, self.branches, self.nEvents, self.bytesRead)
+        self.printEdgeFitReport()
+
+        if self.histFile is None:
+            for bar in [self] + self.configBars:
+                bar.saveHistograms(bar.plotHistFile)
+                bar.renderPlots()
+            if self.timers.enabled:
+                self.timers.printReport(self.nEvents, time.time() - runStart)
+                self.timers.writeReport('{0}/stageTimers.json'.format(self.topDir), self.nEvents, time.time() - runStart, {'runType' : self.runType, 'engine' : self.engine, 'fitEngine' : self.fitEngine, 'nWorkers' : self.nWorkers, 'chunkSize' : self.chunkSize, 'nConfigs' : 1 + len(self.configs)})
+        else:
+            self.saveHistograms(self.histFile)
+
+    # =============================
+
+    def processEvents(self):
+        """ function to fill all histograms with the chosen engine, in parallel shards if nWorkers > 1. returns (events processed, bytes read)"""
+        if (self.checkpointEvery > 0 or self.resume) and (self.nWorkers > 1 or len(self.configs) > 0 or self.histFile is not None):
+            print "#### checkpoints are only supported for single configuration runs without --nWorkers, not saving checkpoints ####"
+            self.checkpointEvery = 0
+            self.resume = False
+        if self.checkpointEvery > 0 and self.engine == 'twoPass':
+            print "#### twoPass engine only saves a checkpoint at the end, not every {0} events ####".format(self.checkpointEvery)
+        if self.skimFile is not None and self.engine == 'skim':
+            print "#### tree is already a skim, not writing {0} ####".format(self.skimFile)
+            self.skimFile = None
+        if self.skimFile is not None:
+            if self.engine != 'batch' or self.nWorkers > 1 or len(self.configs) > 0 or self.checkpointEvery > 0 or self.resume:
+                print "#### skims are written by one batch engine process without checkpoints ####"
+            self.engine, self.nWorkers, self.configs, self.checkpointEvery, self.resume = 'batch', 1, [], 0, False
+        if self.snapshotPort is not None and self.nWorkers > 1:
+            print "#### histograms of --nWorkers shards are only added at the end, not serving snapshots ####"
+        if self.nWorkers > 1:
+            return self.loopEventsParallel()
+
+        if self.resume:
+            self.resumeEntry = self.loadCheckpoint()
+        if self.storeDir is not None:
+            self.waveformStore = self.openWaveformStore()
+        if self.cacheDir is not None and self.engine != 'skim': # skims already hold times
+            self.timingCache = timingCache(self.cacheDir, getTreeFiles(self.tree), self.getFitConfig())
+
+        if self.snapshotPort is not None:
+            self.snapshotServer = snapshotServer(self.snapshotPort, self.histograms.keys())
+
+        setBranchProfile(self.tree, self.branches)
+        bytesAtStart = getBytesRead()
+        if len(self.configs) > 0 and self.engine != 'skim':
+            nEvents = self.loopEventsMultiConfig()
+        elif self.engine == 'batch':
+            nEvents = self.loopEventsBatch()
+        elif self.engine == 'twoPass':
+            nEvents = self.loopEventsTwoPass()
+        elif self.engine == 'skim':
+            nEvents = self.loopEventsSkim()
+        else:
+            nEvents = self.loopEvents()
+        if self.snapshotServer is not None:
+            self.snapshotServer.close()
+
+        if self.timingCache is not None:
+            self.timingCache.save()
+        if self.skimFile is not None:
+            self.writeSkimMetadata()
+        if self.checkpointEvery > 0:
+            self.saveCheckpoint( self.getEntryRange()[1] )
+        return nEvents, getBytesRead() - bytesAtStart
+
+    # =============================
+
+    def getFitConfig(self):
+        """ function to return dictionary of all parameters reconstructed times depend on, used as timing cache key"""
+        fitConfig = {'fitFunction' : self.fitFunction, 'fitEngine' : self.fitEngine,
+                     'fitVoltageThreshold' : self.fitVoltageThreshold, 'fitVoltageForTiming' : self.fitVoltageForTiming, 'fitTimeWindow' : self.fitTimeWindow,
+                     'fitMCPVoltageThreshold' : self.fitMCPVoltageThreshold, 'fitMCPVoltageForTiming' : self.fitMCPVoltageForTiming, 'fitMCPTimeWindow' : self.fitMCPTimeWindow,
+                     'fitTimeStep' : self.fitTimeStep, 'fitTimeTolerance' : self.fitTimeTolerance}
+        if self.fitEngine == 'ratio':
+            fitConfig['ratioCalibration'] = repr(sorted(self.ratioChannel.getCalibration().items()))
+            for channel, ch in sorted(self.ratioChannels.items()):
+                fitConfig['ratioCalibration_ch{0}'.format(channel)] = repr(sorted(ch.getCalibration().items()))
+        return fitConfig
+
+    # =============================
+
+    def getEntryRange(self):
+        """ function to return (first, last) entries to process, applying entryRange and the 10k event limit of test mode"""
+        first, last = 0, self.tree.GetEntries()
+        if self.engine == 'skim': # entries are events, skim has one row per event for each bar
+            last = last/self.geometry.nBars
+        if self.entryRange is not None:
+            first, last = self.entryRange[0], min(self.entryRange[1], last)
+        first = max(first, self.resumeEntry)
+        if self.isTest:
+            last = min(last, 10001) # same 10k events as old loopEvents
+
+        return first, max(first, last)
 
     # =============================
 
-    def setVarsByRunType(self, runType):
-        """ set various constants as function of runType"""
+    def openWaveformStore(self):
+        """ function to return waveformStore of self.storeDir for batch/twoPass engines, None for other engines. exits if store was written from other files"""
+        if self.engine not in ('batch', 'twoPass'):
+            print "#### waveform store is only read by the batch/twoPass engines, reading {0} engine input from tree ####".format(self.engine)
+            return None
 
-        if runType == "all5exposure":
-            self.signalThreshold = 800
-            self.vetoThreshold   = 100
-            self.xBoundaries = [-2, 6, 15, 24, 33]
-            self.yBoundaries = [7.5, 12.5, 16.5, 20.5, 24.5]
-            self.yIntegralOffset = 2.5
-        elif runType == "bottomBars_66V":
-            self.signalThreshold = 30
-            self.vetoThreshold   = 30
-            self.xBoundaries = [17, 19, 21, 23, 25]
-            self.yBoundaries = [4.5, 9.5, 13.5, 16.5, 20.5] #5, 9, 13
-            self.yIntegralOffset = 2.5
-        elif runType == "topBars_66V":
-            self.signalThreshold = 30
-            self.vetoThreshold   = 30
-            self.xBoundaries = [17, 19, 21, 23, 25]
-            self.yBoundaries = [25, 25, 2.5, 7.5, 11.5] # 6-9, 1-4 (bins) 10-13
-            self.yIntegralOffset = 1.5
+        store = waveformStore(self.storeDir)
+        if not store.isValidFor(self.tree):
+            sys.exit( "#### waveform store {0} was written from other input files. please rewrite store ####\nEXITING".format(self.storeDir) )
+        print "-- reading waveforms from store {0} ({1} events)".format(self.storeDir, store.nEvents)
+        return store
+
+    # =============================
+
+    def readEventChunks(self, first, last):
+        """ generator returning self.branches of entries [first, last) in chunks of self.chunkSize events, with time and channel from waveform store if there is one"""
+        if self.waveformStore is None:
+            for chunk in readChunks(self.tree, self.branches, self.chunkSize, first, last):
+                yield chunk
+            return
+
+        scalarBranches = [branch for branch in self.branches if branch not in ('time', 'channel')]
+        entry = first
+        for chunk in readChunks(self.tree, scalarBranches, self.chunkSize, first, last):
+            yield mergeFields(chunk, self.waveformStore.getChunk(entry, entry + len(chunk), ['time', 'channel']))
+            entry += len(chunk)
+
+    # =============================
+
+    def loopEventsParallel(self):
+        """ function to split entries into nWorkers shards, fill histograms of each shard in a worker process, and add shard histograms into this instance.
+        workers print the every-500-event waveform snapshots of their own events into the same topDir. snapshot names only depend on channel and i_evt,
+        so the set of snapshots is the same as for a serial run"""
+        first, last = self.getEntryRange()
+        files = getTreeFiles(self.tree)
+        shardSize = (last - first + self.nWorkers - 1) / self.nWorkers
+
+        shards = []
+        for shardFirst in range(first, last, max(shardSize, 1)):
+            histFile = '{0}/shard{1}_hists.root'.format(self.topDir, len(shards))
+            shards.append( (files, self.tree.GetName(), self.runType, self.baseDir, self.vetoOpt, self.signalThreshold, self.engine, self.chunkSize, self.fitEngine, (shardFirst, min(shardFirst + shardSize, last)), self.storeDir, self.ratioCalibration, histFile, self.cacheDir, self.timers.enabled) )
+        if len(shards) == 0:
+            return 0, 0
+
+        print "processing entries {0}-{1} in {2} shards".format(first, last, len(shards))
+        pool = multiprocessing.Pool(len(shards))
+        results = pool.map(processShard, shards)
+        pool.close()
+        pool.join()
+
+        # merge histograms and profiles of all shards before draw stage
+        for shard in shards:
+            self.addHistograms(shard[-3])
+            os.remove(shard[-3])
+        for nEvents, bytesRead, stats, edgeFitCounts in results:
+            self.timers.addStats(stats)
+            for key in self.edgeFitCounts:
+                self.edgeFitCounts[key] += edgeFitCounts[key]
+
+        return sum(result[0] for result in results), sum(result[1] for result in results)
+
+    # =============================
+
+    def publishSnapshot(self, nTotal):
+        """ function called between events/chunks of the event loops: copy histograms and counters requested from the snapshot server, if there is one"""
+        if self.snapshotServer is not None:
+            self.snapshotServer.publish(self.histograms, lambda: self.getSnapshotCounters(nTotal))
+
+    # =============================
+
+    def getSnapshotCounters(self, nTotal):
+        """ function to return dictionary of run settings, events processed, leading-edge fits, and stage timers (seconds, calls, items) served as snapshot counters"""
+        first, last = self.getEntryRange()
+        return {'runType' : self.runType, 'vetoOpt' : self.vetoOpt, 'engine' : self.engine, 'fitEngine' : self.fitEngine, 'entryRange' : [first, last],
+                'eventsProcessed' : nTotal, 'edgeFits' : dict(self.edgeFitCounts), 'timeStages' : self.timers.enabled, 'stages' : dict( (stage, {'seconds' : seconds, 'calls' : calls, 'items' : items}) for stage, seconds, calls, items in self.timers.getStats() )}
+
+    # =============================
+
+    def printEdgeFitReport(self):
+        """ function to print how many leading-edge fits of fitEngine batch did not converge. their waveforms get time 0 like wonky ones"""
+        if self.fitEngine != 'batch' or self.edgeFitCounts['fitted'] == 0:
+            return
+
+        fitted, notConverged = self.edgeFitCounts['fitted'], self.edgeFitCounts['notConverged']
+        print "==== edge fit report ({0} {1} fits) ====".format(fitted, self.fitFunction)
+        print "not converged:      {0:10d} fits ({1:0.2f}%), times set to 0".format(notConverged, 100.*notConverged/fitted)
+
+    # =============================
+
+    def getHistograms(self):
+        """ function to return list of (attribute name, histogram) for all booked histograms and profiles"""
+        return sorted(self.histograms.items())
+
+    # =============================
+
+    def saveHistograms(self, fileName, metadata={}):
+        """ function to write all booked histograms to fileName, keyed by attribute name, plus TNamed(key, value) of metadata"""
+        f = TFile(fileName, 'RECREATE')
+        for name, h in self.getHistograms():
+            h.Write(name)
+        for key, value in metadata.items():
+            TNamed(key, value).Write()
+        f.Close()
+
+    # =============================
+
+    def getCheckpointKey(self):
+        """ function to return string of all settings histograms depend on, checkpoints are only resumed with same settings"""
+        settings = dict(self.getFitConfig())
+        settings.update( {'runType' : self.runType, 'vetoOpt' : self.vetoOpt, 'signalThreshold' : self.signalThreshold, 'vetoThreshold' : self.vetoThreshold, 'test' : self.isTest} )
+        return repr(sorted(settings.items()))
+
+    # =============================
+
+    def saveCheckpoint(self, nextEntry):
+        """ function to save all histograms, input files, and first entry not yet processed (nextEntry) to checkpoint file. file is replaced atomically"""
+        start = self.timers.start()
+        tmpName = '{0}.tmp'.format(self.checkpointFile)
+        self.saveHistograms(tmpName, {'nextEntry' : str(nextEntry), 'files' : '\n'.join(getFileIdentity(getTreeFiles(self.tree))), 'checkpointKey' : self.getCheckpointKey()})
+        os.rename(tmpName, self.checkpointFile)
+        self.timers.stop('checkpoint', start)
+
+    # =============================
+
+    def loadCheckpoint(self):
+        """ function to add histograms of checkpoint file to booked histograms and return first entry not yet processed, 0 if there is no checkpoint.
+        checkpoint must have same settings, and input files must be unchanged except for files appended to the chain"""
+        if not os.path.isfile(self.checkpointFile):
+            print "-- no checkpoint {0}, starting from first entry".format(self.checkpointFile)
+            return 0
+
+        f = TFile(self.checkpointFile, 'READ')
+        nextEntry = int( f.Get('nextEntry').GetTitle() )
+        files = f.Get('files').GetTitle().split('\n')
+        checkpointKey = f.Get('checkpointKey').GetTitle()
+        f.Close()
+
+        currentFiles = getFileIdentity(getTreeFiles(self.tree))
+        if checkpointKey != self.getCheckpointKey():
+            sys.exit( "#### checkpoint {0} was made with different settings: {1} ####\nEXITING".format(self.checkpointFile, checkpointKey) )
+        if currentFiles[:len(files)] != files:
+            sys.exit( "#### input files changed since checkpoint {0}, can only resume when files are appended to the chain ####\nEXITING".format(self.checkpointFile) )
+
+        self.addHistograms(self.checkpointFile)
+        print "-- resuming from checkpoint {0} at entry {1} ({2} new files)".format(self.checkpointFile, nextEntry, len(currentFiles) - len(files))
+        return nextEntry
+
+    # =============================
+
+    def addHistograms(self, fileName):
+        """ function to add histograms written by saveHistograms in fileName to booked histograms"""
+        f = TFile(fileName, 'READ')
+        for name, h in self.getHistograms():
+            h.Add( f.Get(name) )
+        f.Close()
+
+    # =============================
+
+    def getGeometry(self, runType):
+        """ function to return barGeometry of runType. exits for run types without geometry"""
+        try:
+            return barGeometry(runType)
+        except KeyError as error:
+            sys.exit( "#### {0} ####\nEXITING".format(error.args[0]) )
 
     # =============================
     
     def returnVetoDecision(self, event, barNum, vetoOption):
         """ function to return veto decision given option vetoOption = 'None'/'singleAdj'/'doubleAdj'/'allAdj'/'all'"""
+        if vetoOption not in self.geometry.vetoChannels: # no logic settled. veto event
+            return True
 
-        if vetoOption == 'none':
-            return False
-
-        if vetoOption == 'singleAdj':
-            if barNum == 1 and event.amp[3] < self.vetoThreshold:
-                return False
-            if barNum == 2 and event.amp[5] < self.vetoThreshold:
-                return False
-            if barNum == 3 and event.amp[10] < self.vetoThreshold:
-                return False
-            if barNum == 4 and event.amp[5] < self.vetoThreshold:
-                return False
-            if barNum == 5 and event.amp[10] < self.vetoThreshold:
-                return False
-        if vetoOption == 'doubleAdj':
-            if barNum == 1 and event.amp[3] < self.vetoThreshold and event.amp[4] < self.vetoThreshold:
-                return False
-            if barNum == 2 and event.amp[5] < self.vetoThreshold and event.amp[6] < self.vetoThreshold:
-                return False
-            if barNum == 3 and event.amp[10] < self.vetoThreshold and event.amp[11] < self.vetoThreshold:
-                return False
-            if barNum == 4 and event.amp[5] < self.vetoThreshold and event.amp[6] < self.vetoThreshold:
-                return False
-            if barNum == 5 and event.amp[10] < self.vetoThreshold and event.amp[11] < self.vetoThreshold:
-                return False
-
-        if vetoOption == 'allAdj':
-            if barNum == 1 and event.amp[3] < self.vetoThreshold and event.amp[4] < self.vetoThreshold:
-                return False
-            if barNum == 2 and event.amp[5] < self.vetoThreshold and event.amp[6] < self.vetoThreshold and event.amp[1] < self.vetoThreshold and event.amp[2] < self.vetoThreshold:
-                return False
-            if barNum == 3 and event.amp[10] < self.vetoThreshold and event.amp[11] < self.vetoThreshold and event.amp[3] < self.vetoThreshold and event.amp[4] < self.vetoThreshold:
-                return False
-            if barNum == 4 and event.amp[5] < self.vetoThreshold and event.amp[6] < self.vetoThreshold and event.amp[12] < self.vetoThreshold and event.amp[13] < self.vetoThreshold:
-                return False
-            if barNum == 5 and event.amp[10] < self.vetoThreshold and event.amp[11] < self.vetoThreshold:
-                return False
-
-        if vetoOption == 'all':
-            if barNum == 1 and event.amp[3] < self.vetoThreshold and event.amp[4] < self.vetoThreshold and event.amp[5] < self.vetoThreshold and event.amp[6] < self.vetoThreshold and event.amp[10] < self.vetoThreshold and event.amp[11] < self.vetoThreshold and event.amp[12] < self.vetoThreshold and event.amp[13] < self.vetoThreshold:
-                return False
-            if barNum == 2 and event.amp[1] < self.vetoThreshold and event.amp[2] < self.vetoThreshold and event.amp[5] < self.vetoThreshold and event.amp[6] < self.vetoThreshold and event.amp[10] < self.vetoThreshold and event.amp[11] < self.vetoThreshold and event.amp[12] < self.vetoThreshold and event.amp[13] < self.vetoThreshold:
-                return False
-            if barNum == 3 and event.amp[1] < self.vetoThreshold and event.amp[2] < self.vetoThreshold and event.amp[3] < self.vetoThreshold and event.amp[4] < self.vetoThreshold and event.amp[10] < self.vetoThreshold and event.amp[11] < self.vetoThreshold and event.amp[12] < self.vetoThreshold and event.amp[13] < self.vetoThreshold:
-                return False
-            if barNum == 4 and event.amp[1] < self.vetoThreshold and event.amp[2] < self.vetoThreshold and event.amp[3] < self.vetoThreshold and event.amp[4] < self.vetoThreshold and event.amp[5] < self.vetoThreshold and event.amp[6] < self.vetoThreshold and event.amp[12] < self.vetoThreshold and event.amp[13] < self.vetoThreshold:
-                return False
-            if barNum == 5 and event.amp[1] < self.vetoThreshold and event.amp[2] < self.vetoThreshold and event.amp[3] < self.vetoThreshold and event.amp[4] < self.vetoThreshold and event.amp[5] < self.vetoThreshold and event.amp[6] < self.vetoThreshold and event.amp[10] < self.vetoThreshold and event.amp[11] < self.vetoThreshold:
-                return False
-
-
-        # if it gets here, means nothing returned, i.e. no logic was settled. veto event
-        return True
+        return not all( event.amp[c] < self.vetoThreshold for c in self.geometry.vetoChannels[vetoOption][barNum] )
 
-    
-    
     # =============================
 
-    def fillChannelPlots(self, event, barNum, h_b, h_mcp, h_r_vs_l, h_lr_x_vs_ratio, h_b_test, h_r_x_vs_amp, h_l_x_vs_amp, h_r_x_vs_time, h_l_x_vs_time, h_all_time, h_all_timeRes, h_all_timeLogic, h_mcpRef_timeRes, h_all_x_vs_timeRes, h_all_x_vs_mcpRef_timeRes):
-        """ function to fill bar-specific plots"""
+    def fillChannelPlots(self, event, barNum, inBar):
+        """ function to fill bar-specific plots. inBar: track is inside in-bar area of the bar (barGeometry.getFiducial)"""
         
-        # calculate channel numbers given bar number --> there is probably a smarter way to automate this with fewer lines
-        leftSiPMchannel = rightSiPMchannel = mcpChannel = timeChannel = -1
-        if barNum == 1 or barNum == 2 or barNum == 3:
-            rightSiPMchannel = 2*barNum - 1
-            leftSiPMchannel  = 2*barNum
-            mcpChannel  = 0
-            timeChannel = 0
-                            
-        elif barNum == 4 or barNum == 5:
-            rightSiPMchannel = 2*barNum + 2
-            leftSiPMchannel  = 2*barNum + 3
-            mcpChannel = 9
-            timeChannel = 1
-            
+        # calculate channel numbers given bar number
+        rightSiPMchannel, leftSiPMchannel, mcpChannel, timeChannel = self.getChannelsForBar(barNum)
+
         # logic to see if event should be vetoed based on signals in other bars
         doVetoEvent = self.returnVetoDecision(event, barNum, self.vetoOpt) # vetoOpt = none, singleAdj, doubleAdj, allAdj, all
 
         if (event.amp[rightSiPMchannel] > self.signalThreshold and event.amp[leftSiPMchannel] > self.signalThreshold and not doVetoEvent and abs(event.xSlope) < 0.0004 and abs(event.ySlope) < 0.0004):
             # leakage histograms and profiles
-            h_b.Fill(event.x_dut[2], event.y_dut[2])
-            h_mcp.Fill( event.amp[mcpChannel] )
-            h_r_vs_l.Fill( event.amp[rightSiPMchannel], event.amp[leftSiPMchannel] )
-            h_lr_x_vs_ratio.Fill(event.x_dut[2], event.amp[rightSiPMchannel] / event.amp[leftSiPMchannel] )
-            h_r_x_vs_amp.Fill(event.x_dut[2], event.amp[rightSiPMchannel] )
-            h_l_x_vs_amp.Fill(event.x_dut[2], event.amp[leftSiPMchannel] )
-
-            # test area for hit integral defintion
-            if (abs(event.y_dut[2] - self.yBoundaries[barNum - 1]) <= self.yIntegralOffset and event.x_dut[2]>=self.xBoundaries[0] and event.x_dut[2]<=self.xBoundaries[ len(self.xBoundaries)-1 ]):
-                h_b_test.Fill(event.x_dut[2], event.y_dut[2])
-                    
+            x = numpy.array([event.x_dut[2]])
+            ampMCP = numpy.array([event.amp[mcpChannel]])
+            self.fillBarPlots(barNum, 'leakage', {'x' : x, 'y' : numpy.array([event.y_dut[2]]), 'ampR' : numpy.array([event.amp[rightSiPMchannel]]), 'ampL' : numpy.array([event.amp[leftSiPMchannel]]), 'ampMCP' : ampMCP, 'fiducial' : numpy.array([inBar])})
+
             # timing stuff
             #print len(event.time), len(event.channel)
-            mipTime_R = self.getTimingForChannel(event.time, event.channel, timeChannel, rightSiPMchannel, event.i_evt)
-            mipTime_L = self.getTimingForChannel(event.time, event.channel, timeChannel, leftSiPMchannel, event.i_evt)
+            mipTime_R, mipTime_L = self.getTimingForEvent(event, timeChannel, rightSiPMchannel, leftSiPMchannel)
             #mipTime_MCP = self.getTimingForChannel(event.time, event.channel, timeChannel, mcpChannel, event.i_evt)
             mipTime_MCP = event.t_peak[mcpChannel]
 
-            if mipTime_R != 0 and mipTime_L != 0:
-                h_r_x_vs_time.Fill(event.x_dut[2], mipTime_R)
-                h_l_x_vs_time.Fill(event.x_dut[2], mipTime_L)
+            self.fillBarPlots(barNum, 'timing', {'x' : x, 'ampMCP' : ampMCP, 'timeR' : numpy.array([mipTime_R]), 'timeL' : numpy.array([mipTime_L]), 'timeMCP' : numpy.array([mipTime_MCP]), 'i_evt' : numpy.array([event.i_evt])})
 
-                h_all_timeLogic.Fill("Both",1)
+    # =============================
 
-                deltaT = 1000*(mipTime_L - mipTime_R) # multiple by 1000 to transfer from ns to ps
-                h_all_x_vs_timeRes.Fill(event.x_dut[2], deltaT)
-                #if event.x_dut[2] > 5 and event.x_dut[2] < 25 and event.amp[rightSiPMchannel] > self.fitSignalThreshold: # keep it central
-                h_all_timeRes.Fill( deltaT ) 
-                h_all_time.Fill(mipTime_L)
-                h_all_time.Fill(mipTime_R)
-                
-                if mipTime_MCP != 0 and event.amp[mcpChannel] > 80 and event.amp[mcpChannel] < 160:
-                    deltaT_mcp = 1000*(((mipTime_R + mipTime_L)/2) - mipTime_MCP) # multiple by 1000 to transfer from ns to ps
-                    h_all_x_vs_mcpRef_timeRes.Fill(event.x_dut[2], deltaT_mcp)
-                    #if event.x_dut[2] > 5 and event.x_dut[2] < 25 and event.amp[rightSiPMchannel] > self.fitSignalThreshold: # keep it central
-                    h_mcpRef_timeRes.Fill( deltaT_mcp )
-                    h_all_time.Fill(mipTime_MCP)
-                if mipTime_R == mipTime_L and mipTime_MCP != 0 and event.amp[mcpChannel] > 80 and event.amp[mcpChannel] < 160:
-                    print 'mipTime_R = {0}, mipTime_L = {1}, event: {2}'.format(mipTime_R, mipTime_L, event.i_evt)
+    def getTimingForEvent(self, event, timeChannel, rightSiPMchannel, leftSiPMchannel):
+        """ function to return (right, left) SiPM times of current event (self.entry), from timing cache if available"""
+        if self.timingCache is not None:
+            cached, found = self.timingCache.lookup([self.entry, self.entry], [rightSiPMchannel, leftSiPMchannel])
+            if found.all():
+                return cached[0], cached[1]
 
-            if mipTime_R != 0 and mipTime_L == 0:
-                h_all_timeLogic.Fill("R only",1)
-            if mipTime_R == 0 and mipTime_L != 0:
-                h_all_timeLogic.Fill("L only",1)
-            if mipTime_R == 0 and mipTime_L == 0:
-                h_all_timeLogic.Fill("None",1)
+        mipTime_R = self.getTimingForChannel(event.time, event.channel, timeChannel, rightSiPMchannel, event.i_evt)
+        mipTime_L = self.getTimingForChannel(event.time, event.channel, timeChannel, leftSiPMchannel, event.i_evt)
+        if self.timingCache is not None:
+            self.timingCache.store([self.entry, self.entry], [rightSiPMchannel, leftSiPMchannel], [mipTime_R, mipTime_L])
 
-        return h_b, h_mcp, h_r_vs_l, h_lr_x_vs_ratio, h_b_test, h_r_x_vs_amp, h_l_x_vs_amp, h_r_x_vs_time, h_l_x_vs_time, h_all_time, h_all_timeRes, h_all_timeLogic, h_mcpRef_timeRes, h_all_x_vs_timeRes, h_all_x_vs_mcpRef_timeRes
+        return mipTime_R, mipTime_L
 
     # =============================
 
-    def getTimingForChannel(self, time, channel, drs_time, drs_channel, i_evt):
+    def getChannelsForBar(self, barNum):
+        """ function to return (right SiPM, left SiPM, MCP, DRS time group) channel numbers for bar barNum"""
+        return self.geometry.channels[barNum]
+
+    # =============================
+
+    def fillBarPlots(self, barNum, stage, columns):
+        """ function to fill histograms of bar barNum for all rows of columns (name -> array) following histRegistry.fillRules of stage
+        'leakage' (columns x, y, ampR, ampL, ampMCP, fiducial of events passing cuts) or 'timing' (columns x, ampMCP, timeR, timeL, timeMCP, i_evt)"""
+        nRows = len(columns['x'])
+        if nRows == 0:
+            return
+
+        start = self.timers.start()
+        if stage == 'leakage':
+            columns['ratio'] = columns['ampR'] / columns['ampL']
+            # test area for hit integral defintion, assigned with the track by barGeometry.getFiducial
+            selections = {'signal' : numpy.ones(nRows, dtype=bool), 'test' : columns['fiducial']}
+        else:
+            mipTime_R, mipTime_L, mipTime_MCP, ampMCP = columns['timeR'], columns['timeL'], columns['timeMCP'], columns['ampMCP']
+            both = (mipTime_R != 0) & (mipTime_L != 0)
+            mcpRef = both & (mipTime_MCP != 0) & (ampMCP > 80) & (ampMCP < 160)
+            columns['deltaT'] = 1000*(mipTime_L - mipTime_R) # multiple by 1000 to transfer from ns to ps
+            columns['deltaT_mcp'] = 1000*(((mipTime_R + mipTime_L)/2) - mipTime_MCP) # multiple by 1000 to transfer from ns to ps
+            # centers of h_allChannel_timingLogic bins Both, R only, L only, None
+            columns['logicBin'] = numpy.where(both, 0.5, numpy.where(mipTime_R != 0, 1.5, numpy.where(mipTime_L != 0, 2.5, 3.5)))
+            selections = {'both' : both, 'mcpRef' : mcpRef, 'all' : numpy.ones(nRows, dtype=bool)}
+
+            for i in numpy.flatnonzero(mcpRef & (mipTime_R == mipTime_L)):
+                print 'mipTime_R = {0}, mipTime_L = {1}, event: {2}'.format(mipTime_R[i], mipTime_L[i], columns['i_evt'][i])
+
+        applyFillRules(self.barFillRules[barNum][stage], columns, selections)
+        self.timers.stop('histFill', start, nRows)
+
+    # =============================
+
+    def getTimingForChannel(self, time, channel, drs_time, drs_channel, i_evt, startFit=None):
         """ function to calculate and return information about waveform for fitting"""
-        voltageFromFunction = 0
         timeStep = 0
-        evalFit = 0
+        start = self.timers.start()
         i = 0
         l_time = []
         l_channel = []
@@ -288,23 +503,30 @@ class barClass:
         while i < 1024:
             g.SetPoint(i, l_time[i], l_channel[i])        
             i=i+1
+        self.timers.stop('waveformCopy', start)
 
         fn1 = TF1("fn1", self.fitFunction) # first degree polynomial --> this is just a choice atm
         #fn1 = TF1('fn1', 'gaus(0)') # first degree polynomial --> this is just a choice atm
-        startFit = self.getWaveformInfo_TOFPET(l_time, l_channel)
         timeWindow = self.fitTimeWindow
-        if drs_channel == 0 or drs_channel == 9:
-            startFit = self.getWaveformInfo_MCP(l_time, l_channel)
+        if drs_channel in self.geometry.mcpDRSChannels:
             timeWindow = self.fitMCPTimeWindow
+        if startFit is None: # not already found for whole chunk
+            start = self.timers.start()
+            startFit = self.getWaveformInfo_TOFPET(l_time, l_channel)
+            if drs_channel in self.geometry.mcpDRSChannels:
+                startFit = self.getWaveformInfo_MCP(l_time, l_channel)
+            self.timers.stop('thresholdSearch', start)
         #if i_evt%500 == 0:
         #    print 'channel {0}, startFit: {1}, l_time[startFit]: {2}'.format(drs_channel, startFit, l_time[startFit])
-        #    if drs_channel == 0 or drs_channel == 9:
+        #    if drs_channel in self.geometry.mcpDRSChannels:
         #        c5 = TCanvas("c5", "c5", 800, 800)
         #        g.Draw()
         #        c5.Print( "{0}/waveformPlusPol1Fit_Ch{1}_Evt{2}.png".format(self.topDir, drs_channel, i_evt) )
         if startFit > 1 and (startFit + timeWindow) < 1024: # protection against weird waveforms
             fn1.SetRange(l_time[startFit], l_time[startFit + timeWindow])
+            start = self.timers.start()
             g.Fit("fn1", "QR")
+            self.timers.stop('fit', start)
 
             fnR = g.GetFunction("fn1")
             if i_evt%500 == 0:
@@ -312,113 +534,81 @@ class barClass:
                 g.Draw()
                 c5.Print( "{0}/waveformPlusPol1Fit_Ch{1}_Evt{2}.png".format(self.topDir, drs_channel, i_evt) )
                 print 'Chi2 / NDF = {0:0.1f} / {1:0.1f} = {2:0.1f}'.format(fnR.GetChisquare(), fnR.GetNDF(), fnR.GetChisquare()/fnR.GetNDF() ) 
-            # numerical solution for timing info
+            # bracketed root finding for timing info
             fitStop = self.fitVoltageForTiming
-            timeStep = l_time[startFit] # timestamp to start at (use startFit cuz... duh)
-
-            if fnR.Eval(timeStep) > self.fitVoltageThreshold: # sometimes we need to push back start when first point of fit is waay beyond fitThresholdVoltage due to steep risetime
-                #if i_evt == 1855:
-                #    print "REWIND, evt {0}, timeStep: ({1:0.3f}, {2:0.3f})".format(i_evt, timeStep, fnR.Eval(timeStep))
-                while fnR.Eval(timeStep) > self.fitVoltageThreshold: 
-                    timeStep = timeStep - 0.001 
-                    if timeStep < 0:
-                        break
-                #if i_evt == 1855:
-                #    print "REWIND, evt {0}, evalFit: ({1:0.3f}, {2:0.3f})".format(i_evt, timeStep, fnR.Eval(timeStep))
-            evalFit = timeStep
-
-
-            if drs_channel == 0 or drs_channel == 9:
+            if drs_channel in self.geometry.mcpDRSChannels:
                 fitStop = self.fitMCPVoltageForTiming
-                
-
-            while abs(voltageFromFunction) < abs(fitStop):
-                store = voltageFromFunction
-                voltageFromFunction = fnR.Eval(timeStep)
-                #if i_evt%500 == 0:
-                #    print 'old: {0}, new: {1}'.format(store, voltageFromFunction)
-                timeStep += 0.001
-                #if timeStep > l_time[startFit] + 20: # scan over window of 20 ps
-                if timeStep > evalFit + 30: # scan over window of 20 ps
-                    break
-
-            #if (timeStep - l_time[startFit]) < 0.002:
-            #    print "only one step, evt {0}, startFit: ({1:0.3f}, {2:0.3f}), fitted: ({3:0.3f}, {4:0.3f})".format(i_evt, l_time[startFit], l_channel[startFit], timeStep, fnR.Eval(timeStep))
-            if (timeStep - evalFit) < 0.002:
+            start = self.timers.start()
+            evalFit, timeStep = self.solveThresholdTime(fnR, l_time[startFit], fitStop) # start at startFit cuz... duh
+            self.timers.stop('evalScan', start)
+
+            if timeStep == evalFit:
                 print "only one step, evt {0}, startFit: ({1:0.3f}, {2:0.3f}), fitted: ({3:0.3f}, {4:0.3f})".format(i_evt, evalFit, fnR.Eval(evalFit), timeStep, fnR.Eval(timeStep))
 
-        if timeStep <= evalFit or timeStep >= evalFit + 30: # something wonky --> not good
+        if timeStep is None or timeStep == 0: # something wonky --> not good
             return 0
         else: # good timing result!
-            #print timeStep
             return timeStep
+
+    # =============================
+
+    def solveThresholdTime(self, fnR, tStart, fitStop):
+        """ function to return (evalFit, time where |fnR| first reaches |fitStop| within 30 ns of evalFit or None) for fitted function fnR"""
+
+        # sometimes we need to push back start when first point of fit is waay beyond fitThresholdVoltage due to steep risetime
+        evalFit = tStart
+        if self.fitFunction == "pol1": # closed form for straight line
+            p0, p1 = fnR.GetParameter(0), fnR.GetParameter(1)
+            if p1 == 0:
+                return evalFit, None
+            if p0 + p1*evalFit > self.fitVoltageThreshold:
+                evalFit = max( (self.fitVoltageThreshold - p0)/p1, 0 ) if p1 > 0 else 0
+            if abs(p0 + p1*evalFit) >= abs(fitStop):
+                return evalFit, evalFit
+            timeStep = min( t for t in ((abs(fitStop) - p0)/p1, (-abs(fitStop) - p0)/p1) if t >= evalFit )
+            if timeStep >= evalFit + 30:
+                return evalFit, None
+            return evalFit, timeStep
+
+        if fnR.Eval(evalFit) > self.fitVoltageThreshold:
+            evalFit = findCrossingTime(lambda t: fnR.Eval(t) <= self.fitVoltageThreshold, evalFit, 0, self.fitTimeStep, self.fitTimeTolerance)
+            if evalFit is None: # never drops below threshold before t = 0
+                evalFit = 0
+
+        return evalFit, findCrossingTime(lambda t: abs(fnR.Eval(t)) >= abs(fitStop), evalFit, evalFit + 30, self.fitTimeStep, self.fitTimeTolerance)
         
     # =============================
 
     def getWaveformInfo(self, time, channel):
         """ function to calculate and return information about waveform for fitting"""
 
-        # there are probably better ways to do all of this in python...
-        maxADC = maxADC_stamp = threshold_stamp = -1
-        i = 0
-
-        # first find max
-        for reading in channel:
-            if reading > maxADC:
-                maxADC = reading
-                maxADC_stamp = i
-            i += 1
-
-        print maxADC, 'at', maxADC_stamp
-        
-        i=0
-        # second find first reading above percent threshold i.e. place to start fit
-        for reading in channel:
-            if reading/maxADC > self.fitPercentThreshold and threshold_stamp == -1:
-                threshold_stamp = i
-            i += 1
-
-        #print 'thresh met at', threshold_stamp, 'with', channel[threshold_stamp]
-
-        return threshold_stamp
+        # first reading above percent of max i.e. place to start fit
+        return int( findPercentCrossing(channel, self.fitPercentThreshold)[0] )
 
     # =============================
 
     def getWaveformInfo_TOFPET(self, time, channel):
         """ function to calculate and return information about waveform for fitting"""
 
-        # there are probably better ways to do all of this in python...
-        threshold_stamp = -1
-        i = 0
-
-        # find first reading above voltage threshold i.e. place to start fit
-        for reading in channel:
-            if abs(reading) > self.fitVoltageThreshold and threshold_stamp == -1:
-                threshold_stamp = i
-            i = i + 1
-
-        #print 'thresh met at', threshold_stamp, 'with', channel[threshold_stamp]
-
-        return threshold_stamp
+        # first reading above voltage threshold i.e. place to start fit
+        return int( findFirstCrossing(channel, self.fitVoltageThreshold)[0] )
 
     # =============================
 
     def getWaveformInfo_MCP(self, time, channel):
         """ function to calculate and return information about waveform for fitting"""
 
-        # there are probably better ways to do all of this in python...
-        threshold_stamp = -1
-        i = 0
+        # first reading above voltage threshold i.e. place to start fit
+        return int( findFirstCrossing(channel, self.fitMCPVoltageThreshold)[0] )
 
-        # find first reading above voltage threshold i.e. place to start fit
-        for reading in channel:
-            if abs(reading) > self.fitMCPVoltageThreshold and threshold_stamp == -1:
-                threshold_stamp = i
-            i = i + 1
+    # =============================
 
-        #print 'thresh met at', threshold_stamp, 'with', channel[threshold_stamp]
+    def getStartFitForChunk(self, channels, drs_channels):
+        """ function to return place to start fit for a chunk of waveforms (events x 1024) read from DRS channels drs_channels"""
+        isMCP = self.geometry.isMCPChannel(drs_channels)
+        threshold = numpy.where(isMCP, self.fitMCPVoltageThreshold, self.fitVoltageThreshold)
 
-        return threshold_stamp
+        return findFirstCrossing(channels, threshold)
 
     # =============================
     
@@ -426,133 +616,631 @@ class barClass:
         """ function looping over all events in file"""
 
         print self.tree.GetEntries()
+        first, last = self.getEntryRange()
         nTotal=0
 
-        for event in self.tree:        
-            if nTotal > 10000 and self.isTest:
-                break
+        for iEntry in xrange(first, last):
+            start = self.timers.start()
+            self.tree.GetEntry(iEntry)
+            self.timers.stop('treeRead', start)
+            self.entry = iEntry
+            event = self.tree
 
             nTotal += 1
             if (nTotal % 10000 == 0):
                 print nTotal, "processed"
 
-            # bar 1
-            self.h_b1, self.h_mcp0_ch1, self.h_ch1_vs_ch2, self.h_ch1_ch2_x_vs_ratio, self.h_b1_t, self.h_ch1_x_vs_amp, self.h_ch2_x_vs_amp, self.h_ch1_x_vs_time, self.h_ch2_x_vs_time, self.h_allChannel_timing, self.h_allChannel_timingRes, self.h_allChannel_timingLogic, self.h_allChannel_mcpRef_timingRes, self.h_allCh_x_vs_timingRes, self.h_allCh_x_vs_mcpRef_timingRes = self.fillChannelPlots(event, 1, self.h_b1, self.h_mcp0_ch1, self.h_ch1_vs_ch2, self.h_ch1_ch2_x_vs_ratio, self.h_b1_t, self.h_ch1_x_vs_amp, self.h_ch2_x_vs_amp, self.h_ch1_x_vs_time, self.h_ch2_x_vs_time, self.h_allChannel_timing, self.h_allChannel_timingRes, self.h_allChannel_timingLogic, self.h_allChannel_mcpRef_timingRes, self.h_allCh_x_vs_timingRes, self.h_allCh_x_vs_mcpRef_timingRes)
-            # bar 2
-            self.h_b2, self.h_mcp0_ch3, self.h_ch3_vs_ch4, self.h_ch3_ch4_x_vs_ratio, self.h_b2_t, self.h_ch3_x_vs_amp, self.h_ch4_x_vs_amp, self.h_ch3_x_vs_time, self.h_ch4_x_vs_time, self.h_allChannel_timing, self.h_allChannel_timingRes, self.h_allChannel_timingLogic, self.h_allChannel_mcpRef_timingRes, self.h_allCh_x_vs_timingRes, self.h_allCh_x_vs_mcpRef_timingRes = self.fillChannelPlots(event, 2, self.h_b2, self.h_mcp0_ch3, self.h_ch3_vs_ch4, self.h_ch3_ch4_x_vs_ratio, self.h_b2_t, self.h_ch3_x_vs_amp, self.h_ch4_x_vs_amp, self.h_ch3_x_vs_time, self.h_ch4_x_vs_time, self.h_allChannel_timing, self.h_allChannel_timingRes, self.h_allChannel_timingLogic, self.h_allChannel_mcpRef_timingRes, self.h_allCh_x_vs_timingRes, self.h_allCh_x_vs_mcpRef_timingRes)
-            # bar 3
-            self.h_b3, self.h_mcp0_ch5, self.h_ch5_vs_ch6, self.h_ch5_ch6_x_vs_ratio, self.h_b3_t, self.h_ch5_x_vs_amp, self.h_ch6_x_vs_amp, self.h_ch5_x_vs_time, self.h_ch6_x_vs_time, self.h_allChannel_timing, self.h_allChannel_timingRes, self.h_allChannel_timingLogic, self.h_allChannel_mcpRef_timingRes, self.h_allCh_x_vs_timingRes, self.h_allCh_x_vs_mcpRef_timingRes = self.fillChannelPlots(event, 3, self.h_b3, self.h_mcp0_ch5, self.h_ch5_vs_ch6, self.h_ch5_ch6_x_vs_ratio, self.h_b3_t, self.h_ch5_x_vs_amp, self.h_ch6_x_vs_amp, self.h_ch5_x_vs_time, self.h_ch6_x_vs_time, self.h_allChannel_timing, self.h_allChannel_timingRes, self.h_allChannel_timingLogic, self.h_allChannel_mcpRef_timingRes, self.h_allCh_x_vs_timingRes, self.h_allCh_x_vs_mcpRef_timingRes)
-            # bar 4
-            self.h_b4, self.h_mcp1_ch10, self.h_ch10_vs_ch11, self.h_ch10_ch11_x_vs_ratio, self.h_b4_t, self.h_ch10_x_vs_amp, self.h_ch11_x_vs_amp, self.h_ch10_x_vs_time, self.h_ch11_x_vs_time, self.h_allChannel_timing, self.h_allChannel_timingRes, self.h_allChannel_timingLogic, self.h_allChannel_mcpRef_timingRes, self.h_allCh_x_vs_timingRes, self.h_allCh_x_vs_mcpRef_timingRes = self.fillChannelPlots(event, 4, self.h_b4, self.h_mcp1_ch10, self.h_ch10_vs_ch11, self.h_ch10_ch11_x_vs_ratio, self.h_b4_t, self.h_ch10_x_vs_amp, self.h_ch11_x_vs_amp, self.h_ch10_x_vs_time, self.h_ch11_x_vs_time, self.h_allChannel_timing, self.h_allChannel_timingRes, self.h_allChannel_timingLogic, self.h_allChannel_mcpRef_timingRes, self.h_allCh_x_vs_timingRes, self.h_allCh_x_vs_mcpRef_timingRes)
-            # bar 5
-            self.h_b5, self.h_mcp1_ch12, self.h_ch12_vs_ch13, self.h_ch12_ch13_x_vs_ratio, self.h_b5_t, self.h_ch12_x_vs_amp, self.h_ch13_x_vs_amp, self.h_ch12_x_vs_time, self.h_ch13_x_vs_time, self.h_allChannel_timing, self.h_allChannel_timingRes, self.h_allChannel_timingLogic, self.h_allChannel_mcpRef_timingRes, self.h_allCh_x_vs_timingRes, self.h_allCh_x_vs_mcpRef_timingRes = self.fillChannelPlots(event, 5, self.h_b5, self.h_mcp1_ch12, self.h_ch12_vs_ch13, self.h_ch12_ch13_x_vs_ratio, self.h_b5_t, self.h_ch12_x_vs_amp, self.h_ch13_x_vs_amp, self.h_ch12_x_vs_time, self.h_ch13_x_vs_time, self.h_allChannel_timing, self.h_allChannel_timingRes, self.h_allChannel_timingLogic, self.h_allChannel_mcpRef_timingRes, self.h_allCh_x_vs_timingRes, self.h_allCh_x_vs_mcpRef_timingRes)
+            inBar = self.geometry.getFiducial([event.x_dut[2]], [event.y_dut[2]])[0] # in-bar area of each bar, once per event
+            for k, barNum in enumerate(self.bars):
+                self.fillChannelPlots(event, barNum, inBar[k])
+
+            if self.checkpointEvery > 0 and nTotal % self.checkpointEvery == 0:
+                self.saveCheckpoint(iEntry + 1)
+            self.publishSnapshot(nTotal)
 
        # end filling loop     
 
-        self.draw2Dbar(self.c1, self.h_b1, 1)
-        self.draw2Dbar(self.c1, self.h_b2, 2)
-        self.draw2Dbar(self.c1, self.h_b3, 3)
-        self.draw2Dbar(self.c1, self.h_b4, 4)
-        self.draw2Dbar(self.c1, self.h_b5, 5)
-        self.draw2Dbar(self.c1, self.h_b1_t, 1, "test")
-        self.draw2Dbar(self.c1, self.h_b2_t, 2, "test")
-        self.draw2Dbar(self.c1, self.h_b3_t, 3, "test")
-        self.draw2Dbar(self.c1, self.h_b4_t, 4, "test")
-        self.draw2Dbar(self.c1, self.h_b5_t, 5, "test")
-        
-        self.c2.cd()
-        self.c2.SetLeftMargin(0.15);
-        self.c2.SetRightMargin(0.05);
-        self.c2.SetBottomMargin(0.10);
-        self.c2.SetTopMargin(0.05);
-        # kBlack == 1, kRed == 632, kBlue == 600, kGreen == 416, kMagenta == 616
-        self.h_mcp0_ch1.SetLineColor(1) # kBlack
-        self.h_mcp0_ch3.SetLineColor(600) # kBlue
-        self.h_mcp0_ch5.SetLineColor(632) # kRed
-        self.h_mcp1_ch10.SetLineColor(416+2) # kGreen+2
-        self.h_mcp1_ch12.SetLineColor(616-3) # kMagenta-3
-        
-        self.h_mcp0_ch1.SetLineWidth(3) 
-        self.h_mcp0_ch3.SetLineWidth(3) 
-        self.h_mcp0_ch5.SetLineWidth(3) 
-        self.h_mcp1_ch10.SetLineWidth(3) 
-        self.h_mcp1_ch12.SetLineWidth(3) 
-        
-        self.h_mcp1_ch12.SetYTitle("Noramlized Entries / 20 mV")
-        self.h_mcp1_ch12.SetXTitle("MCP Amplitude [mV]")
-        self.h_mcp1_ch12.SetTitle("")
-        self.h_mcp1_ch12.DrawNormalized()
-        self.h_mcp1_ch12.GetYaxis().SetRangeUser(0,1.6)
-        
-        self.h_mcp0_ch3.DrawNormalized("same")
-        self.h_mcp0_ch5.DrawNormalized("same")
-        self.h_mcp1_ch10.DrawNormalized("same")
-        self.h_mcp0_ch1.DrawNormalized("same")
-        
-        leg = TLegend(0.5, 0.4, .85, .7);
-        leg.AddEntry(self.h_mcp0_ch1, "MCP Amplitude: Bar 1 Signal", "l");
-        leg.AddEntry(self.h_mcp0_ch3, "MCP Amplitude: Bar 2 Signal", "l");
-        leg.AddEntry(self.h_mcp0_ch5, "MCP Amplitude: Bar 3 Signal", "l");
-        leg.AddEntry(self.h_mcp1_ch10, "MCP Amplitude: Bar 4 Signal", "l");
-        leg.AddEntry(self.h_mcp1_ch12, "MCP Amplitude: Bar 5 Signal", "l");
-        leg.Draw("same");
-        
-        self.c2.Print("{0}/mcp_amplitudes.png".format(self.topDir) )
+        return nTotal
 
-        
-        self.drawLvsRinBar(self.c3, self.h_ch1_vs_ch2, 1)
-        self.drawLvsRinBar(self.c3, self.h_ch3_vs_ch4, 2)
-        self.drawLvsRinBar(self.c3, self.h_ch5_vs_ch6, 3)
-        self.drawLvsRinBar(self.c3, self.h_ch10_vs_ch11, 4)
-        self.drawLvsRinBar(self.c3, self.h_ch12_vs_ch13, 5)
-        
-        
-        self.drawSingleProfile(self.c4, self.h_ch1_ch2_x_vs_ratio, 1, 'Right/Left')
-        self.drawSingleProfile(self.c4, self.h_ch3_ch4_x_vs_ratio, 2, 'Right/Left')
-        self.drawSingleProfile(self.c4, self.h_ch5_ch6_x_vs_ratio, 3, 'Right/Left')
-        self.drawSingleProfile(self.c4, self.h_ch10_ch11_x_vs_ratio, 4, 'Right/Left')
-        self.drawSingleProfile(self.c4, self.h_ch12_ch13_x_vs_ratio, 5, 'Right/Left')
-
-        self.drawSingleProfile(self.c4, self.h_ch1_x_vs_amp, 1, 'Bar 1 Amplitude (Right SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch2_x_vs_amp, 1, 'Bar 1 Amplitude (Left SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch3_x_vs_amp, 2, 'Bar 2 Amplitude (Right SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch4_x_vs_amp, 2, 'Bar 2 Amplitude (Left SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch5_x_vs_amp, 3, 'Bar 3 Amplitude (Right SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch6_x_vs_amp, 3, 'Bar 3 Amplitude (Left SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch10_x_vs_amp, 4, 'Bar 4 Amplitude (Right SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch11_x_vs_amp, 4, 'Bar 4 Amplitude (Left SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch12_x_vs_amp, 5, 'Bar 5 Amplitude (Right SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch13_x_vs_amp, 5, 'Bar 5 Amplitude (Left SiPM)')
-
-        self.drawSingleProfile(self.c4, self.h_ch1_x_vs_time, 1, 'Bar 1 Time (Right SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch2_x_vs_time, 1, 'Bar 1 Time (Left SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch3_x_vs_time, 2, 'Bar 2 Time (Right SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch4_x_vs_time, 2, 'Bar 2 Time (Left SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch5_x_vs_time, 3, 'Bar 3 Time (Right SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch6_x_vs_time, 3, 'Bar 3 Time (Left SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch10_x_vs_time, 4, 'Bar 4 Time (Right SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch11_x_vs_time, 4, 'Bar 4 Time (Left SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch12_x_vs_time, 5, 'Bar 5 Time (Right SiPM)')
-        self.drawSingleProfile(self.c4, self.h_ch13_x_vs_time, 5, 'Bar 5 Time (Left SiPM)')
-
-        self.c4.cd()
-        self.h_allChannel_timing.Draw()
-        self.c4.Print( "{0}/h_allChannel_timing.png".format(self.topDir) )
-
-        self.drawResolutionPlot(self.c4, self.h_allChannel_timingRes, False)
-        self.drawResolutionPlot(self.c4, self.h_allChannel_mcpRef_timingRes, True)
-
-        self.drawSingleProfile(self.c4, self.h_allCh_x_vs_timingRes, 0, 't_{right SiPM} - t_{left SiPM}')
-        self.drawSingleProfile(self.c4, self.h_allCh_x_vs_mcpRef_timingRes, 0, '(t_{right SiPM} + t_{left SiPM})/2 - t_{MCP}')
-
-        self.c4.cd()
-        self.h_allChannel_timingLogic.Draw("TEXT")
-        self.c4.Print( "{0}/h_allChannel_timingLogic.png".format(self.topDir) )
+    # =============================
+    
+    def loopEventsBatch(self):
+        """ function looping over all events in file in chunks of self.chunkSize events read as numpy arrays"""
+
+        print self.tree.GetEntries()
+        first, last = self.getEntryRange()
+
+        nTotal=0
+        for chunk in self.timers.timeIterator('treeRead', self.readEventChunks(first, last)):
+            self.chunkEntries = numpy.arange(first + nTotal, first + nTotal + len(chunk))
+            if self.skimFile is not None: # histograms filled from skim rows, so reanalysis of the skim gives the same plots
+                rows = self.getSkimRows(chunk)
+                self.fillSkimPlots(rows)
+                writeSkimRows(rows, self.skimFile, self.skimRowsWritten == 0)
+                self.skimRowsWritten += len(rows)
+            else:
+                self.fillChunkPlots(chunk)
+
+            # keep same progress printout as loopEvents
+            if (nTotal + len(chunk))/10000 > nTotal/10000:
+                print (nTotal + len(chunk))/10000*10000, "processed"
+            if self.checkpointEvery > 0 and (nTotal + len(chunk))/self.checkpointEvery > nTotal/self.checkpointEvery:
+                self.saveCheckpoint(first + nTotal + len(chunk))
+            nTotal += len(chunk)
+            self.publishSnapshot(nTotal)
+
+        return nTotal
+
+    # =============================
+
+    def processNewEntries(self, tree, first, last):
+        """ function to add entries [first, last) of tree to the histograms with the batch engine, for instances made with runAnalysis=False.
+        used by onlineMonitor for entries appended to run files still being written. returns number of events processed"""
+        self.tree = tree
+        self.entryRange = (first, last)
+        setBranchProfile(self.tree, self.branches)
+        return self.loopEventsBatch()
+
+    # =============================
+
+    def loopEventsTwoPass(self):
+        """ function looping over events twice: pass 1 reads only scalar branches, applies cuts and fills leakage plots, pass 2 reads waveforms only for selected entries and does timing"""
+
+        print self.tree.GetEntries()
+        first, last = self.getEntryRange()
+
+        # *** 1. scalar branches only, build list of candidate entries per bar
+        scalarBranches = [branch for branch in self.branches if branch not in ('time', 'channel')]
+        self.candidateEntries = dict( (barNum, []) for barNum in self.bars )
+        candidates = []
+        selected = []
+        nTotal=0
+        for chunk in self.timers.timeIterator('treeRead', readChunks(self.tree, scalarBranches, self.chunkSize, first, last)):
+            chunkSelected = self.fillChunkScalarPlots(chunk)
+
+            # keep only scalars of events selected for any bar
+            rows = sorted(set(iEvt for iEvt, barNum in chunkSelected))
+            candidates.append(chunk[rows])
+            for iEvt, barNum in chunkSelected:
+                self.candidateEntries[barNum].append(first + nTotal + iEvt)
+            selected += [first + nTotal + iEvt for iEvt in rows]
+
+            if (nTotal + len(chunk))/10000 > nTotal/10000:
+                print (nTotal + len(chunk))/10000*10000, "processed (pass 1)"
+            nTotal += len(chunk)
+            self.publishSnapshot(nTotal)
+
+        candidates = numpy.concatenate(candidates) if candidates else numpy.zeros(0)
+        entries = numpy.array(selected, dtype=numpy.int64)
+        print "pass 1: {0} of {1} events selected for waveform timing".format(len(entries), nTotal)
+
+        # *** 2. waveform branches only for candidate entries, in chunks of chunkSize selected events
+        entryBars = {}
+        for barNum, barEntries in self.candidateEntries.items():
+            for entry in barEntries:
+                entryBars.setdefault(entry, []).append(barNum)
+
+        for first in range(0, len(entries), self.chunkSize):
+            chunkEntries = entries[first:first + self.chunkSize]
+            chunkSelected = [(k, barNum) for k, entry in enumerate(chunkEntries) for barNum in sorted(entryBars[entry])]
+            channels = sorted(set( c for k, barNum in chunkSelected for c in self.getChannelsForBar(barNum)[:2] ))
+            groups = sorted(set( self.getChannelsForBar(barNum)[3] for k, barNum in chunkSelected ))
+
+            start = self.timers.start()
+            if self.waveformStore is not None:
+                waveforms = self.waveformStore.readWaveforms(chunkEntries, channels, groups)
+            else:
+                waveforms = readWaveforms(self.tree, chunkEntries, channels, groups)
+            self.timers.stop('treeRead', start, len(chunkEntries))
+            chunk = mergeFields(candidates[first:first + self.chunkSize], waveforms)
+            self.chunkEntries = chunkEntries
+            self.fillChunkTimingPlots(chunk, chunkSelected)
+            self.publishSnapshot(nTotal)
+
+        setBranchProfile(self.tree, self.branches)
+        return nTotal
+
+    # =============================
+
+    def loopEventsSkim(self):
+        """ function looping over events of a skim (tree written with skimFile) in chunks of self.chunkSize events, without reading waveforms or fitting.
+        histograms of extra configurations (self.configs) are filled in the same pass"""
+
+        self.configBars = [barClass(self.tree, self.runType, topDir, vetoOpt, test=self.isTest, engine='skim', chunkSize=self.chunkSize, fitEngine=self.fitEngine, signalThreshold=signalThreshold, runAnalysis=False) for vetoOpt, signalThreshold, topDir in self.configs]
+        for bar in [self] + self.configBars:
+            bar.timers = self.timers
+            bar.checkSkim()
+
+        print self.tree.GetEntries()
+        first, last = self.getEntryRange()
+
+        nBars = self.geometry.nBars
+        nTotal=0
+        for rows in self.timers.timeIterator('treeRead', readChunks(self.tree, self.branches, nBars*self.chunkSize, nBars*first, nBars*last)):
+            for bar in [self] + self.configBars:
+                bar.fillSkimPlots(rows)
+
+            if (nTotal + len(rows)/nBars)/10000 > nTotal/10000:
+                print (nTotal + len(rows)/nBars)/10000*10000, "processed"
+            if self.checkpointEvery > 0 and (nTotal + len(rows)/nBars)/self.checkpointEvery > nTotal/self.checkpointEvery:
+                self.saveCheckpoint(first + nTotal + len(rows)/nBars)
+            nTotal += len(rows)/nBars
+            self.publishSnapshot(nTotal)
+
+        return nTotal
+
+    # =============================
+
+    def getSkimRows(self, chunk):
+        """ function to return skim rows (treeIO.skimType) of a chunk of events, one per event and bar in bar order. times are reconstructed for rows passing
+        signal and slope cuts, for any veto option"""
+        amp = chunk['amp'].astype(numpy.float64)
+        nBars = self.geometry.nBars
+        rows = numpy.zeros(nBars*len(chunk), dtype=skimType)
+        inBar = self.geometry.getFiducial(chunk['x_dut'][:, 2], chunk['y_dut'][:, 2])
+        hitBars = self.geometry.getHitBars(chunk['x_dut'][:, 2], chunk['y_dut'][:, 2], inBar)
+        for k, barNum in enumerate(self.bars):
+            r, l, mcp, drs_time = self.getChannelsForBar(barNum)
+            barRows = rows[k::nBars]
+            barRows['entry'] = self.chunkEntries
+            barRows['i_evt'] = chunk['i_evt']
+            barRows['bar'] = barNum
+            barRows['ampR'], barRows['ampL'], barRows['ampMCP'] = amp[:, r], amp[:, l], amp[:, mcp]
+            barRows['x'], barRows['y'] = chunk['x_dut'][:, 2], chunk['y_dut'][:, 2]
+            barRows['hitBar'], barRows['fiducial'] = hitBars, inBar[:, k]
+            barRows['xSlope'], barRows['ySlope'] = chunk['xSlope'], chunk['ySlope']
+            barRows['timeMCP'] = chunk['t_peak'][:, mcp]
+            barRows['passSignal'] = (amp[:, r] > self.signalThreshold) & (amp[:, l] > self.signalThreshold)
+            barRows['passSlope'] = (numpy.abs(chunk['xSlope']) < 0.0004) & (numpy.abs(chunk['ySlope']) < 0.0004)
+        for bit, vetoOption in enumerate(skimVetoOptions): # events x bars, same order as rows
+            rows['vetoBits'] |= self.getVetoMasks(amp, vetoOption).astype(numpy.int8).ravel() << bit
+
+        # rows are ordered by (event, bar), as selected lists of fillChunkScalarPlots
+        fit = numpy.flatnonzero(rows['passSignal'] & rows['passSlope'])
+        mipTimes = self.getChunkTimes(chunk, [(row/nBars, self.bars[row%nBars]) for row in fit])
+        rows['fitStatus'] = -1
+        if len(fit) > 0:
+            rows['timeR'][fit], rows['timeL'][fit] = mipTimes[:, 0], mipTimes[:, 1]
+            rows['fitStatus'][fit] = (mipTimes[:, 0] != 0) + 2*(mipTimes[:, 1] != 0)
+
+        return rows
+
+    # =============================
+
+    def fillSkimPlots(self, rows):
+        """ function to apply signal, slope, and veto cuts to skim rows and fill bar-specific plots"""
+        signal = (rows['ampR'] > self.signalThreshold) & (rows['ampL'] > self.signalThreshold) & rows['passSlope']
+        if self.vetoOpt in skimVetoOptions:
+            signal &= (rows['vetoBits'] >> skimVetoOptions.index(self.vetoOpt)) & 1 == 0
+        else: # no logic settled, veto all events like returnVetoDecision
+            signal[:] = False
+
+        for barNum in self.bars:
+            barRows = rows[signal & (rows['bar'] == barNum)]
+            column = lambda name: barRows[name].astype(numpy.float64)
+            self.fillBarPlots(barNum, 'leakage', {'x' : column('x'), 'y' : column('y'), 'ampR' : column('ampR'), 'ampL' : column('ampL'), 'ampMCP' : column('ampMCP'), 'fiducial' : barRows['fiducial']})
+            self.fillBarPlots(barNum, 'timing', {'x' : column('x'), 'ampMCP' : column('ampMCP'), 'timeR' : column('timeR'), 'timeL' : column('timeL'), 'timeMCP' : column('timeMCP'), 'i_evt' : barRows['i_evt']})
+
+    # =============================
+
+    def getSkimKey(self):
+        """ function to return dictionary of settings skim rows depend on, stored as TNamed in skim file"""
+        return {'runType' : self.runType, 'skimSignalThreshold' : str(self.signalThreshold), 'vetoThreshold' : str(self.vetoThreshold), 'fitConfig' : repr(sorted(self.getFitConfig().items())),
+                'skimColumns' : ','.join(name for name, dtype in skimType)}
+
+    # =============================
+
+    def writeSkimMetadata(self):
+        """ function to add settings of getSkimKey and input files to skim file"""
+        if self.skimRowsWritten == 0:
+            print "#### no events, skim {0} not written ####".format(self.skimFile)
+            return
+
+        f = TFile(self.skimFile, 'UPDATE')
+        for key, value in self.getSkimKey().items():
+            TNamed(key, value).Write()
+        TNamed('files', '\n'.join(getFileIdentity(getTreeFiles(self.tree)))).Write()
+        f.Close()
+        print "-- skim {0}: {1} rows, {2:0.1f} MB".format(self.skimFile, self.skimRowsWritten, os.path.getsize(self.skimFile)/1e6)
+
+    # =============================
+
+    def checkSkim(self):
+        """ function to exit if skim files of tree were written with other settings than this instance, or with a higher signal threshold (times of
+        rows below it were not reconstructed)"""
+        skimKey = self.getSkimKey()
+        for fileName in getTreeFiles(self.tree):
+            f = TFile(fileName, 'READ')
+            stored = dict( (key, f.Get(key).GetTitle()) for key in skimKey if f.Get(key) )
+            f.Close()
+            for key in ['runType', 'vetoThreshold', 'fitConfig', 'skimColumns']:
+                if stored.get(key) != skimKey[key]:
+                    sys.exit( "#### skim {0} was made with {1} = {2}, not {3}. please rewrite skim ####\nEXITING".format(fileName, key, stored.get(key), skimKey[key]) )
+            if self.signalThreshold < float(stored['skimSignalThreshold']):
+                sys.exit( "#### skim {0} only has times for signal threshold >= {1}, not {2} ####\nEXITING".format(fileName, stored['skimSignalThreshold'], self.signalThreshold) )
+
+    # =============================
+
+    def loopEventsMultiConfig(self):
+        """ function looping once over all events in chunks, filling histograms of this and all extra configurations (self.configs).
+        waveforms selected by any configuration are fitted once by this instance, so every-500-event snapshots go to its topDir"""
+
+        if self.engine != 'batch':
+            print "#### multiple configurations are filled with the batch engine, not {0} ####".format(self.engine)
+        self.configBars = [barClass(self.tree, self.runType, topDir, vetoOpt, test=self.isTest, engine='batch', chunkSize=self.chunkSize, fitEngine=self.fitEngine, signalThreshold=signalThreshold, runAnalysis=False) for vetoOpt, signalThreshold, topDir in self.configs]
+        bars = [self] + self.configBars
+        for bar in self.configBars:
+            bar.timers = self.timers
+
+        print self.tree.GetEntries()
+        first, last = self.getEntryRange()
+        nTotal=0
+        nFits=0
+        nUnshared=0
+        for chunk in self.timers.timeIterator('treeRead', self.readEventChunks(first, last)):
+            self.chunkEntries = numpy.arange(first + nTotal, first + nTotal + len(chunk))
+            barSelected = [bar.fillChunkScalarPlots(chunk) for bar in bars]
+
+            # timing once for union of selected (event, bar) of all configurations
+            allSelected = sorted(set( s for selected in barSelected for s in selected ))
+            mipTimes = dict( zip(allSelected, self.getChunkTimes(chunk, allSelected)) )
+            for bar, selected in zip(bars, barSelected):
+                bar.fillChunkTimingPlots(chunk, selected, [mipTimes[s] for s in selected])
+
+            nFits += 2*len(allSelected)
+            nUnshared += 2*sum(len(selected) for selected in barSelected)
+            if (nTotal + len(chunk))/10000 > nTotal/10000:
+                print (nTotal + len(chunk))/10000*10000, "processed"
+            nTotal += len(chunk)
+            self.publishSnapshot(nTotal)
+
+        print "{0} configurations: {1} waveform fits instead of {2}".format(len(bars), nFits, nUnshared)
+        return nTotal
+
+    # =============================
+
+    def fillChunkPlots(self, chunk):
+        """ function to apply signal, slope, and veto cuts as array masks on a chunk of events and fill bar-specific plots"""
+        self.fillChunkTimingPlots(chunk, self.fillChunkScalarPlots(chunk))
+
+    # =============================
+
+    def fillChunkScalarPlots(self, chunk):
+        """ function to apply signal, slope, and veto cuts as array masks on a chunk of events and fill bar-specific plots not needing waveforms. returns list of selected (event index in chunk, bar number)"""
+
+        amp = chunk['amp'].astype(numpy.float64) # float64 so ratios match per-event PyROOT arithmetic
+        x = chunk['x_dut'][:,2].astype(numpy.float64)
+        y = chunk['y_dut'][:,2].astype(numpy.float64)
+        slopeMask = (numpy.abs(chunk['xSlope']) < 0.0004) & (numpy.abs(chunk['ySlope']) < 0.0004)
+
+        # cuts of all bars at once, events x bars
+        passed = (amp[:, self.geometry.rightChannels] > self.signalThreshold) & (amp[:, self.geometry.leftChannels] > self.signalThreshold) & slopeMask[:, numpy.newaxis] & ~self.getVetoMasks(amp)
+        inBar = self.geometry.getFiducial(x, y)
+        for k, barNum in enumerate(self.bars):
+            mask = passed[:, k]
+            if not mask.any():
+                continue
+
+            # leakage histograms and profiles
+            r, l, mcp, drs_time = self.getChannelsForBar(barNum)
+            self.fillBarPlots(barNum, 'leakage', {'x' : x[mask], 'y' : y[mask], 'ampR' : amp[mask, r], 'ampL' : amp[mask, l], 'ampMCP' : amp[mask, mcp], 'fiducial' : inBar[mask, k]})
+
+        # (event, bar) in event, then bar order
+        iEvts, iBars = numpy.nonzero(passed)
+        return [(iEvt, self.bars[k]) for iEvt, k in zip(iEvts, iBars)]
+
+    # =============================
+
+    def fillChunkTimingPlots(self, chunk, selected, mipTimes=None):
+        """ function to fill timing plots of selected (event index in chunk, bar number) given their (right, left) times, reconstructed here if mipTimes is None"""
+        amp = chunk['amp'].astype(numpy.float64)
+        x = chunk['x_dut'][:,2].astype(numpy.float64)
+        if mipTimes is None:
+            mipTimes = self.getChunkTimes(chunk, selected)
+
+        # timing stuff, all selected events of a bar at once
+        mipTimes = numpy.asarray(mipTimes, dtype=numpy.float64).reshape(-1, 2)
+        iEvts = numpy.array([iEvt for iEvt, barNum in selected], dtype=int)
+        bars = numpy.array([barNum for iEvt, barNum in selected], dtype=int)
+        for barNum in self.bars:
+            rows = bars == barNum
+            mcp = self.getChannelsForBar(barNum)[2]
+            events = iEvts[rows]
+            self.fillBarPlots(barNum, 'timing', {'x' : x[events], 'ampMCP' : amp[events, mcp], 'timeR' : mipTimes[rows, 0], 'timeL' : mipTimes[rows, 1], 'timeMCP' : chunk['t_peak'][events, mcp].astype(numpy.float64), 'i_evt' : chunk['i_evt'][events]})
+
+    # =============================
+
+    def getChunkTimes(self, chunk, selected):
+        """ function to return reconstructed (right, left) SiPM times of selected (event index in chunk, bar number), from timing cache if available"""
+        iEvts = numpy.array([iEvt for iEvt, barNum in selected], dtype=int)
+        channels = numpy.array([self.getChannelsForBar(barNum)[:2] for iEvt, barNum in selected], dtype=int).reshape(-1, 2)
+        drs_times = numpy.array([self.getChannelsForBar(barNum)[3] for iEvt, barNum in selected], dtype=int)
+
+        # only fit bars with at least one channel missing from cache
+        mipTimes = numpy.zeros(channels.shape)
+        toFit = numpy.ones(len(iEvts), dtype=bool)
+        if self.timingCache is not None:
+            entries = numpy.repeat(self.chunkEntries[iEvts], 2).reshape(-1, 2)
+            mipTimes, found = self.timingCache.lookup(entries, channels)
+            toFit = ~found.all(axis=1)
+        if not toFit.any():
+            return mipTimes
+
+        # threshold search for all selected waveforms at once
+        iEvts, channels, drs_times = iEvts[toFit], channels[toFit], drs_times[toFit]
+        start = self.timers.start()
+        if self.fitEngine == 'ratio': # ratio method finds its own window
+            startFits = numpy.zeros(channels.shape, dtype=int)
+        else:
+            startFits = self.getStartFitForChunk(chunk['channel'][iEvts[:, numpy.newaxis], channels].reshape(-1, 1024), channels.ravel()).reshape(-1, 2)
+        self.timers.stop('thresholdSearch', start, channels.size)
+        mipTimes[toFit] = self.getTimingForChunk(chunk, iEvts, channels, drs_times, startFits)
+
+        if self.timingCache is not None:
+            self.timingCache.store(entries[toFit], channels, mipTimes[toFit])
+        return mipTimes
+
+    # =============================
+
+    def getTimingForChunk(self, chunk, iEvts, channels, drs_times, startFits):
+        """ function to return reconstructed times (0 if wonky) of DRS channels (n x 2) in events iEvts of chunk, fitting waveforms one by one with ROOT (fitEngine root) or all at once (fitEngine batch/ratio)"""
+        mipTimes = numpy.zeros(channels.shape)
+        if self.fitEngine == 'ratio':
+            if len(iEvts) > 0:
+                mipTimes = self.getRatioTimingForWaveforms(chunk['time'][numpy.repeat(iEvts, 2), numpy.repeat(drs_times, 2)], chunk['channel'][numpy.repeat(iEvts, 2), channels.ravel()], channels.ravel()).reshape(-1, 2)
+            return mipTimes
+        if self.fitEngine == 'batch':
+            if len(iEvts) > 0:
+                mipTimes = self.getBatchTimingForWaveforms(chunk['time'][numpy.repeat(iEvts, 2), numpy.repeat(drs_times, 2)], chunk['channel'][numpy.repeat(iEvts, 2), channels.ravel()], channels.ravel(), startFits.ravel(), numpy.repeat(chunk['i_evt'][iEvts], 2)).reshape(-1, 2)
+            return mipTimes
+
+        for k, iEvt in enumerate(iEvts):
+            time = chunk['time'][iEvt].ravel()
+            channel = chunk['channel'][iEvt].ravel()
+            for j in range(2):
+                mipTimes[k, j] = self.getTimingForChannel(time, channel, drs_times[k], channels[k, j], chunk['i_evt'][iEvt], startFits[k, j])
+
+        return mipTimes
+
+    # =============================
+
+    def getBatchTimingForWaveforms(self, times, channels, drs_channels, startFits, i_evts):
+        """ function to fit leading edges of waveforms (n x 1024) all at once with edgeFitter and return threshold times (0 if wonky or fit not converged)"""
+        samples = -1*channels.astype(numpy.float64)
+        isMCP = self.geometry.isMCPChannel(drs_channels)
+        timeWindow = numpy.where(isMCP, self.fitMCPTimeWindow, self.fitTimeWindow)
+        fitStop = numpy.where(isMCP, self.fitMCPVoltageForTiming, self.fitVoltageForTiming)
+
+        start = self.timers.start()
+        params, chi2ndf, converged = fitLeadingEdges(times, samples, startFits, timeWindow, self.fitFunction)
+        self.timers.stop('fit', start, len(samples))
+
+        # count fits of waveforms passing the startFit protection that did not converge, so their loss is not hidden among wonky times
+        fitted = (startFits > 1) & (startFits + timeWindow < samples.shape[1])
+        self.edgeFitCounts['fitted'] += int(fitted.sum())
+        self.edgeFitCounts['notConverged'] += int((fitted & ~converged).sum())
+
+        mipTimes = numpy.zeros(len(samples))
+        good = numpy.flatnonzero(converged)
+        start = self.timers.start()
+        mipTimes[good] = self.solveThresholdTimes(params[good], times[good, startFits[good]], fitStop[good])
+        self.timers.stop('evalScan', start, len(good))
+
+        for k in numpy.flatnonzero(converged & (i_evts%500 == 0)):
+            self.drawFitSnapshot(times[k], samples[k], params[k], drs_channels[k], i_evts[k], chi2ndf[k])
+
+        return mipTimes
+
+    # =============================
+
+    def getRatioTimingForWaveforms(self, times, channels, drs_channels):
+        """ function to reconstruct times of waveforms (n x 1024) with the ratio method of RecoWaveForm (ratioTiming), all waveforms of a DRS channel at once
+        with its calibration. returns times, 0 if no good ratio"""
+        mipTimes = numpy.zeros(len(channels))
+        start = self.timers.start()
+        for drs_channel in numpy.unique(drs_channels):
+            rows = numpy.flatnonzero(drs_channels == drs_channel)
+            reco = recoWaveforms(channels[rows], times[rows], self.ratioChannels.get(drs_channel, self.ratioChannel))[0]
+            mipTimes[rows] = numpy.where(reco['nGoodRatios'] > 0, reco['tReco'], 0)
+        self.timers.stop('fit', start, len(channels))
+
+        return mipTimes
+
+    # =============================
+
+    def solveThresholdTimes(self, params, tStart, fitStop):
+        """ vectorized solveThresholdTime for fitted parameters (one row per waveform). returns times, 0 where wonky"""
+        fitted = lambda t: evaluateEdge(self.fitFunction, params, t)
+
+        # push back start when first point of fit is already beyond fitVoltageThreshold
+        rewind = fitted(tStart) > self.fitVoltageThreshold
+        evalFit = findCrossingTimes(lambda t: fitted(t) <= self.fitVoltageThreshold, tStart, numpy.where(rewind, 0, tStart), self.fitTimeStep, self.fitTimeTolerance)
+        evalFit[ numpy.isnan(evalFit) ] = 0 # never drops below threshold before t = 0
+
+        timeStep = findCrossingTimes(lambda t: numpy.abs(fitted(t)) >= numpy.abs(fitStop), evalFit, evalFit + 30, self.fitTimeStep, self.fitTimeTolerance)
+        timeStep[ numpy.isnan(timeStep) ] = 0
+
+        return timeStep
+
+    # =============================
+
+    def drawFitSnapshot(self, time, sample, params, drs_channel, i_evt, chi2ndf):
+        """ function to draw one waveform with its batch leading-edge fit, like the every-500-event snapshots of getTimingForChannel"""
+        g = TGraph()
+        for i in range(len(sample)):
+            g.SetPoint(i, time[i], sample[i])
+        fn1 = TF1("fn1", self.fitFunction)
+        for i, par in enumerate(params):
+            fn1.SetParameter(i, par)
+
+        c5 = TCanvas("c5", "c5", 800, 800)
+        g.Draw()
+        fn1.Draw("same")
+        c5.Print( "{0}/waveformPlusPol1Fit_Ch{1}_Evt{2}.png".format(self.topDir, drs_channel, i_evt) )
+        print 'Chi2 / NDF = {0:0.1f}'.format(chi2ndf)
+
+    # =============================
+
+    def getVetoMasks(self, amp, vetoOption=None):
+        """ function to return returnVetoDecision decisions (events x bars) for a chunk of amp arrays (events x channels), vetoOption = self.vetoOpt by default"""
+        if vetoOption is None:
+            vetoOption = self.vetoOpt
+        vetoMatrix = self.geometry.getVetoMatrix(vetoOption)
+        if vetoMatrix is None: # no logic settled, veto all events
+            return numpy.ones((len(amp), self.geometry.nBars), dtype=bool)
+
+        # bar is vetoed if any of its veto channels is not below vetoThreshold
+        return numpy.dot( (~(amp < self.vetoThreshold)).astype(numpy.int32), vetoMatrix.T.astype(numpy.int32) ) > 0
+
+    # =============================
+
+    def getPlots(self):
+        """ function to return list of all plots as (draw method, [histogram names], (extra arguments)), in drawing order"""
+        plots = []
+        for test in ["", "test"]:
+            for barNum in self.bars:
+                plots.append( ('draw2Dbar', ['h_b{0}{1}'.format(barNum, '_t' if test == "test" else ""), 'h_b{0}_t'.format(barNum)], (barNum, test)) )
+
+        plots.append( ('drawMCPAmplitudes', ['h_mcp{0}_ch{1}'.format(self.getChannelsForBar(barNum)[2]/9, self.getChannelsForBar(barNum)[0]) for barNum in self.bars], ()) )
+
+        for barNum in self.bars:
+            r, l, mcp, drs_time = self.getChannelsForBar(barNum)
+            plots.append( ('drawLvsRinBar', ['h_ch{0}_vs_ch{1}'.format(r, l)], (barNum,)) )
+        for barNum in self.bars:
+            r, l, mcp, drs_time = self.getChannelsForBar(barNum)
+            plots.append( ('drawSingleProfile', ['h_ch{0}_ch{1}_x_vs_ratio'.format(r, l)], (barNum, 'Right/Left')) )
+        for var in ['amp', 'time']:
+            for barNum in self.bars:
+                r, l, mcp, drs_time = self.getChannelsForBar(barNum)
+                for channel, side in [(r, 'Right'), (l, 'Left')]:
+                    plots.append( ('drawSingleProfile', ['h_ch{0}_x_vs_{1}'.format(channel, var)], (barNum, 'Bar {0} {1} ({2} SiPM)'.format(barNum, 'Amplitude' if var == 'amp' else 'Time', side))) )
+
+        plots.append( ('drawHistogram', ['h_allChannel_timing'], ("",)) )
+        plots.append( ('drawResolutionPlot', ['h_allChannel_timingRes'], (False,)) )
+        plots.append( ('drawResolutionPlot', ['h_allChannel_mcpRef_timingRes'], (True,)) )
+        plots.append( ('drawSingleProfile', ['h_allCh_x_vs_timingRes'], (0, 't_{right SiPM} - t_{left SiPM}')) )
+        plots.append( ('drawSingleProfile', ['h_allCh_x_vs_mcpRef_timingRes'], (0, '(t_{right SiPM} + t_{left SiPM})/2 - t_{MCP}')) )
+        plots.append( ('drawHistogram', ['h_allChannel_timingLogic'], ("TEXT",)) )
 
         # === function graveyard. keep for reference"
-        #self.drawXquadrants(self.c4, self.h_ch1_ch2_ratio_x1, self.h_ch1_ch2_ratio_x2, self.h_ch1_ch2_ratio_x3, self.h_ch1_ch2_ratio_x4, 1, 'Right/Left')
-        #self.drawXquadrants(self.c4, self.h_ch1_x1, self.h_ch1_x2, self.h_ch1_x3, self.h_ch1_x4, 1, 'Bar 1 [Right SiPM]')
+        #plots.append( ('drawXquadrants', ['h_ch1_ch2_ratio_x1', 'h_ch1_ch2_ratio_x2', 'h_ch1_ch2_ratio_x3', 'h_ch1_ch2_ratio_x4'], (1, 'Right/Left')) )
+        #plots.append( ('drawXquadrants', ['h_ch1_x1', 'h_ch1_x2', 'h_ch1_x3', 'h_ch1_x4'], (1, 'Bar 1 [Right SiPM]')) )
+
+        return plots
+
+    # =============================
+
+    def getPlotStyle(self, plot):
+        """ function to return string of everything besides histogram contents a plot depends on: arguments, drawing code, and bar boundaries"""
+        method, histNames, args = plot
+        return '\n'.join([repr(plot), inspect.getsource(barClass.drawPlot), inspect.getsource(getattr(barClass, method)), repr( (self.yBoundaries, self.yIntegralOffset) )])
+
+    # =============================
+
+    def getSummaryPlots(self):
+        """ function to return plots followed during data taking (onlineMonitor): bar occupancy, MCP amplitudes, and time resolution"""
+        return [plot for plot in self.getPlots() if plot[0] in ('draw2Dbar', 'drawMCPAmplitudes', 'drawResolutionPlot') and "test" not in plot[2]]
+
+    # =============================
+
+    def renderPlots(self, nProcesses=None, force=False, plots=None):
+        """ function to render plots (default: all of getPlots) from histograms saved in plotHistFile, in a pool of nProcesses (default: number of CPUs) in ROOT batch mode.
+        plots whose histograms and style are unchanged since their last render in topDir are skipped, unless force"""
+        if nProcesses is None:
+            nProcesses = multiprocessing.cpu_count()
+
+        if plots is None:
+            plots = self.getPlots()
+        plotHashes = getPlotHashes(self.plotHistFile, plots, self.getPlotStyle)
+        state = readRenderState(self.topDir)
+        changed = [plot for plot in plots if force or not isUnchanged(state, getPlotId(plot), plotHashes[getPlotId(plot)])]
+        print "-- rendering {0} plots in {1}, {2} unchanged".format(len(changed), self.topDir, len(plots) - len(changed))
+        if len(changed) == 0:
+            return
+
+        start = self.timers.start()
+        groups = [(self.runType, self.baseDir, self.plotHistFile, group) for group in getRenderGroups(changed, nProcesses)]
+        if len(groups) == 1 or multiprocessing.current_process().daemon: # pool workers, e.g. of runDriver.py, cannot start processes
+            results = map(renderPlotGroup, groups)
+        else:
+            pool = multiprocessing.Pool(len(groups))
+            results = pool.map(renderPlotGroup, groups, chunksize=1)
+            pool.close()
+            pool.join()
+
+        for plotId, fileName in sum(results, []):
+            state[plotId] = {'hash' : plotHashes[plotId], 'file' : fileName}
+        writeRenderState(self.topDir, state)
+        self.timers.stop('render', start, len(changed))
+
+    # =============================
+
+    def drawPlot(self, plot):
+        """ function to draw one plot (draw method, [histogram names], (extra arguments)) on a new canvas. returns printed file"""
+        method, histNames, args = plot
+
+        # canvas made per plot, so plots do not depend on margins left by the one drawn before
+        c0 = TCanvas("c_render", "c_render", 800, 800)
+        histograms = [self.histograms[name] for name in histNames]
+
+        return getattr(self, method)(c0, *(histograms + list(args)))
+
+    # =============================
+
+    def drawPlots(self):
+        """ function drawing and printing all plots in this process, without skipping unchanged plots"""
+        for plot in self.getPlots():
+            self.drawPlot(plot)
+
+    # =============================
+
+    def drawMCPAmplitudes(self, c0, *h_bars):
+        """ function to recieve canvas (c0) and MCP amplitude histograms of all bars (in bar order), drawn normalized on top of each other"""
+        c0.cd()
+        c0.SetLeftMargin(0.15);
+        c0.SetRightMargin(0.05);
+        c0.SetBottomMargin(0.10);
+        c0.SetTopMargin(0.05);
+        # kBlack, kBlue, kRed, kGreen+2, kMagenta-3, kOrange+7, kCyan+2, kViolet+1, then again with dashed lines
+        colors = [1, 600, 632, 416+2, 616-3, 800+7, 432+2, 880+1]
+        for k, h_b in enumerate(h_bars):
+            h_b.SetLineColor(colors[k % len(colors)])
+            h_b.SetLineStyle(1 + k/len(colors))
+            h_b.SetLineWidth(3)
+
+        # last bar sets the axes
+        h_bars[-1].SetYTitle("Noramlized Entries / 20 mV")
+        h_bars[-1].SetXTitle("MCP Amplitude [mV]")
+        h_bars[-1].SetTitle("")
+        h_bars[-1].DrawNormalized()
+        h_bars[-1].GetYaxis().SetRangeUser(0,1.6)
+        for h_b in h_bars[:-1]:
+            h_b.DrawNormalized("same")
+
+        leg = TLegend(0.5, 0.7 - 0.06*len(h_bars), .85, .7);
+        for barNum, h_b in zip(self.bars, h_bars):
+            leg.AddEntry(h_b, "MCP Amplitude: Bar {0} Signal".format(barNum), "l");
+        leg.Draw("same");
         
+        filename = "{0}/mcp_amplitudes.png".format(self.topDir)
+        c0.Print(filename)
+        return filename
+
+    # =============================
+
+    def drawHistogram(self, c0, h0, option):
+        """ function to recieve canvas (c0) and histogram (h0), drawn with option and printed as <histogram name>.png"""
+        c0.cd()
+        c0.SetLeftMargin(0.15);
+        c0.SetRightMargin(0.05);
+        c0.SetBottomMargin(0.10);
+        c0.SetTopMargin(0.10);
+        h0.Draw(option)
+
+        filename = "{0}/{1}.png".format(self.topDir, h0.GetName())
+        c0.Print(filename)
+        return filename
+
     # =============================
 
     def drawResolutionPlot(self, c0, h0, isMCPref):
@@ -595,13 +1283,15 @@ class barClass:
         ltx1.SetTextSize(0.035)
         ltx1.SetNDC()
         ltx1.DrawLatex(0.70, 0.55, '#sigma_{{t}} = {0:0.1f} ps'.format(f_res.GetParameter(2)))
-        c0.Print( "{0}/{1}.png".format(self.topDir, plotName) )
+        filename = "{0}/{1}.png".format(self.topDir, plotName)
+        c0.Print(filename)
+        return filename
         
 
     # =============================
 
-    def draw2Dbar(self, c0, h0, barNum, test=""):
-        """ function to recieve canvas (c0), histogram (h0), and name for 2D bar plot"""
+    def draw2Dbar(self, c0, h0, h_inBar, barNum, test=""):
+        """ function to recieve canvas (c0), histogram (h0), histogram of tracks in in-bar area (h_inBar), and name for 2D bar plot"""
         c0.cd()
         h0.SetTitle( "Bar {0}".format(barNum) )
         h0.SetXTitle("X [mm]")
@@ -612,9 +1302,10 @@ class barClass:
         #7-10, 12-14, 16
         #ymin = 4*barNum + self.yIntegralOffset
         #ymax = 4*barNum + self.yIntegralOffset + 4
-        ymin = int(self.yBoundaries[barNum -1] - self.yIntegralOffset)
-        ymax = int(self.yBoundaries[barNum -1] + self.yIntegralOffset)
-        window = h0.Integral(4, 38, ymin, ymax)
+        #ymin = int(self.yBoundaries[barNum -1] - self.yIntegralOffset)
+        #ymax = int(self.yBoundaries[barNum -1] + self.yIntegralOffset)
+        #window = h0.Integral(4, 38, ymin, ymax)
+        window = h_inBar.GetEntries() # tracks flagged in-bar by barGeometry.getFiducial, exact instead of whole bins
         
         if h0.GetEntries() > 0:
             print "In bar {0}: {1}\t Total: {2}\t % in Bar: {3}".format(barNum, window, h0.GetEntries(), window/h0.GetEntries())
@@ -628,7 +1319,9 @@ class barClass:
         else:
             print "no entries"
 
-        c0.Print( "{0}/bar{1}_python{2}.png".format(self.topDir, barNum, test) )
+        filename = "{0}/bar{1}_python{2}.png".format(self.topDir, barNum, test)
+        c0.Print(filename)
+        return filename
 
     # =============================
 
@@ -641,7 +1334,9 @@ class barClass:
         h0.SetYTitle("Left SiPM [mV]")
         h0.Draw("colz")
         
-        c0.Print( "{0}/bar{1}_rightVleft.png".format(self.topDir, barNum) )
+        filename = "{0}/bar{1}_rightVleft.png".format(self.topDir, barNum)
+        c0.Print(filename)
+        return filename
 
     # =============================
 
@@ -699,6 +1394,7 @@ class barClass:
             filename = '{0}/{1}_x.png'.format(self.topDir, varName.replace(' ', '_').replace('[','').replace(']',''))
 
         c0.Print(filename)
+        return filename
 
     # =============================
 
@@ -733,5 +1429,6 @@ class barClass:
             filename = '{0}/{1}_x.png'.format(self.topDir, varName.replace(' ', '_').replace('(','').replace(')',''))
 
         c0.Print(filename)
+        return filename
 
     # =============================
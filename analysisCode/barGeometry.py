@@ -0,0 +1,130 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 29, 2018
+#Purpose: Bar geometry of each run type (bars, SiPM/MCP DRS channels, time groups, bar boundaries, thresholds), from which barClass books and fills histograms for any number of bars
+
+import numpy
+
+# veto options of barClass --vetoOpt, in the order of skim column vetoBits
+vetoOptions = ['none', 'singleAdj', 'doubleAdj', 'allAdj', 'all']
+
+
+def getModuleChannels(barsPerGroup):
+    """ function to return dictionary bar -> (right SiPM, left SiPM, MCP) DRS channels of a module read out with an MCP in the first channel of each DRS group
+    (channels 0, 9, 18, 27) and barsPerGroup[g] bars on the following channel pairs of group g. bars are numbered from 1 in group order"""
+    channels = {}
+    for group, nBars in enumerate(barsPerGroup):
+        mcp = 9*group
+        for k in range(nBars):
+            channels[len(channels) + 1] = (mcp + 2*k + 1, mcp + 2*k + 2, mcp)
+    return channels
+
+
+def getVetoNeighbours(bars):
+    """ function to return dictionary bar -> adjacent bar whose SiPMs veto it for singleAdj/doubleAdj: the next bar, the previous one for the last bar"""
+    return dict( (bar, bars[k + 1] if k + 1 < len(bars) else bars[k - 1]) for k, bar in enumerate(bars) if len(bars) > 1 )
+
+
+# March 2018 FNAL module: bars 1-3 read with MCP 0 in DRS group 0, bars 4-5 with MCP 9 in group 1
+fiveBarChannels = getModuleChannels([3, 2])
+fiveBarVetoNeighbours = {1 : 2, 2 : 3, 3 : 4, 4 : 3, 5 : 4} # bars 4 and 5 are vetoed by the bar below
+
+# geometry of each run type. yCenters: bar centers in y (mm, telescope y_dut[2]), in bar order. halfHeight: half bar height (mm) of the in-bar area.
+# xBoundaries: bar edges and quadrant boundaries in x (mm). thresholds in mV. sipmMPV: most probable SiPM amplitude (mV), used by syntheticPulses
+runGeometries = {
+    'all5exposure'   : {'channels' : fiveBarChannels, 'vetoNeighbours' : fiveBarVetoNeighbours, 'yCenters' : [7.5, 12.5, 16.5, 20.5, 24.5], 'halfHeight' : 2.5,
+                        'xBoundaries' : [-2, 6, 15, 24, 33], 'signalThreshold' : 800, 'vetoThreshold' : 100, 'sipmMPV' : 1100},
+    'bottomBars_66V' : {'channels' : fiveBarChannels, 'vetoNeighbours' : fiveBarVetoNeighbours, 'yCenters' : [4.5, 9.5, 13.5, 16.5, 20.5], 'halfHeight' : 2.5, #5, 9, 13
+                        'xBoundaries' : [17, 19, 21, 23, 25], 'signalThreshold' : 30, 'vetoThreshold' : 30, 'sipmMPV' : 150},
+    'topBars_66V'    : {'channels' : fiveBarChannels, 'vetoNeighbours' : fiveBarVetoNeighbours, 'yCenters' : [25, 25, 2.5, 7.5, 11.5], 'halfHeight' : 1.5, # 6-9, 1-4 (bins) 10-13
+                        'xBoundaries' : [17, 19, 21, 23, 25], 'signalThreshold' : 30, 'vetoThreshold' : 30, 'sipmMPV' : 150},
+}
+
+
+class barGeometry:
+    def __init__(self, runType):
+        if runType not in runGeometries:
+            raise KeyError('no bar geometry for run type {0}, use one of {1}'.format(runType, '/'.join(sorted(runGeometries))))
+        layout = runGeometries[runType]
+
+        self.runType = runType
+        self.bars = sorted(layout['channels'])
+        self.nBars = len(self.bars)
+        # (right SiPM, left SiPM, MCP, DRS time group) of each bar, channel c is read with time group c/9
+        self.channels = dict( (bar, (r, l, mcp, r/9)) for bar, (r, l, mcp) in layout['channels'].items() )
+        self.rightChannels = numpy.array([self.channels[bar][0] for bar in self.bars])
+        self.leftChannels = numpy.array([self.channels[bar][1] for bar in self.bars])
+        self.mcpChannels = numpy.array([self.channels[bar][2] for bar in self.bars])
+        self.sipmChannels = sorted( c for bar in self.bars for c in self.channels[bar][:2] )
+        self.mcpDRSChannels = sorted(set(int(c) for c in self.mcpChannels)) # DRS channels read by MCPs, timing reference instead of SiPM
+
+        self.yBoundaries = list(layout['yCenters'])
+        self.yIntegralOffset = layout['halfHeight']
+        # bar centers sorted for binary search (centers may repeat and bars may overlap), centerRank: position of each bar in sortedCenters
+        centerOrder = numpy.argsort(self.yBoundaries, kind='mergesort')
+        self.sortedCenters = numpy.array(self.yBoundaries, dtype=numpy.float64)[centerOrder]
+        self.centerRank = numpy.empty(self.nBars, dtype=numpy.int64)
+        self.centerRank[centerOrder] = numpy.arange(self.nBars)
+        self.xBoundaries = list(layout['xBoundaries'])
+        self.signalThreshold = layout['signalThreshold']
+        self.vetoThreshold = layout['vetoThreshold']
+        self.sipmMPV = layout['sipmMPV']
+        self.vetoChannels = self.getVetoChannels( layout.get('vetoNeighbours', getVetoNeighbours(self.bars)) )
+
+    # =============================
+
+    def isMCPChannel(self, drsChannels):
+        """ function to return boolean array of DRS channels drsChannels (any shape) read by an MCP"""
+        drsChannels = numpy.asarray(drsChannels)
+        return numpy.in1d(drsChannels.ravel(), self.mcpDRSChannels).reshape(drsChannels.shape)
+
+    # =============================
+
+    def getVetoChannels(self, vetoNeighbours):
+        """ function to return dictionary vetoOption -> bar -> channels that must be below vetoThreshold for the bar not to be vetoed.
+        singleAdj: right SiPM of the veto neighbour, doubleAdj: both its SiPMs, allAdj: SiPMs of bars on both sides, all: SiPMs of all other bars"""
+        vetoChannels = dict( (option, {}) for option in vetoOptions )
+        for k, bar in enumerate(self.bars):
+            neighbour = self.channels[vetoNeighbours[bar]] if bar in vetoNeighbours else ()
+            adjacent = self.bars[k + 1:k + 2] + self.bars[max(k - 1, 0):k]
+            vetoChannels['none'][bar] = []
+            vetoChannels['singleAdj'][bar] = list(neighbour[:1])
+            vetoChannels['doubleAdj'][bar] = list(neighbour[:2])
+            vetoChannels['allAdj'][bar] = [c for b in adjacent for c in self.channels[b][:2]]
+            vetoChannels['all'][bar] = [c for b in self.bars if b != bar for c in self.channels[b][:2]]
+        return vetoChannels
+
+    # =============================
+
+    def getVetoMatrix(self, vetoOption):
+        """ function to return boolean array (bars x 36 DRS channels) of vetoChannels of vetoOption, None if the option has no logic (all events vetoed)"""
+        if vetoOption not in self.vetoChannels:
+            return None
+        matrix = numpy.zeros((self.nBars, 36), dtype=bool)
+        for k, bar in enumerate(self.bars):
+            matrix[k, self.vetoChannels[vetoOption][bar]] = True
+        return matrix
+
+
+    # =============================
+
+    def getFiducial(self, x, y):
+        """ function to return boolean array (events x bars) of tracks at (x, y) (telescope x_dut[2], y_dut[2]) inside the in-bar area of each bar:
+        |y - yCenter| <= halfHeight and first <= x <= last xBoundaries. bars containing y are a contiguous range of bars sorted by center, found with
+        two binary searches per event instead of a test per event and bar"""
+        x, y = numpy.asarray(x, dtype=numpy.float64), numpy.asarray(y, dtype=numpy.float64)
+        first = numpy.searchsorted(self.sortedCenters, y - self.yIntegralOffset, side='left')
+        last = numpy.searchsorted(self.sortedCenters, y + self.yIntegralOffset, side='right')
+        inX = (x >= self.xBoundaries[0]) & (x <= self.xBoundaries[-1])
+        return (first[:, numpy.newaxis] <= self.centerRank) & (self.centerRank < last[:, numpy.newaxis]) & inX[:, numpy.newaxis]
+
+    # =============================
+
+    def getHitBars(self, x, y, fiducial=None):
+        """ function to return bar number of each track: the bar with nearest center among bars whose in-bar area holds the track (lowest bar number
+        if centers are equal), 0 if none. fiducial: getFiducial(x, y) if already known"""
+        if fiducial is None:
+            fiducial = self.getFiducial(x, y)
+        distance = numpy.where(fiducial, numpy.abs(numpy.asarray(y, dtype=numpy.float64)[:, numpy.newaxis] - self.yBoundaries), numpy.inf)
+        return numpy.where(fiducial.any(axis=1), numpy.array(self.bars)[distance.argmin(axis=1)], 0)
@@ -12,18 +12,31 @@ import sys, argparse
 # *** 0. setup parser for command line
 parser = argparse.ArgumentParser()
 parser.add_argument("--test", help="flag for running over only 10k events",  nargs='?', default=False)
-parser.add_argument("--vetoOpt", help="veto decision logic option: none/singleAdj/doubleAdj/allAdj/all")
+parser.add_argument("--vetoOpt", help="veto decision logic option: none/singleAdj/doubleAdj/allAdj/all, or comma-separated list of options filled in one pass")
+parser.add_argument("--signalThresholds", help="comma-separated list of SiPM signal thresholds in mV filled in one pass (default: run type value)", default=None)
+parser.add_argument("--engine", help="event loop engine: event (PyROOT loop, default), batch (numpy arrays in chunks), twoPass (batch, reading waveforms only for events passing cuts), or skim (read --skimFile instead of pulse tree)", default='event')
+parser.add_argument("--chunkSize", help="number of events per chunk for --engine batch/twoPass", type=int, default=1000)
+parser.add_argument("--cacheDir", help="directory of timing cache: reconstructed times are reused when input files and fit parameters are unchanged (default: no cache)", default=None)
+parser.add_argument("--checkpointEvery", help="save histograms and last processed entry to <topDir>/<runType>/checkpoint.root every N events and at the end, not with --engine twoPass (default: 0, no checkpoints)", type=int, default=0)
+parser.add_argument("--resume", help="continue from checkpoint, after a crash or to process only entries of run files added to the chain since", action='store_true')
+parser.add_argument("--nWorkers", help="number of worker processes, each filling histograms for its own range of events (default 1, no extra processes)", type=int, default=1)
+parser.add_argument("--fitEngine", help="leading-edge fit for --engine batch/twoPass: root (TGraph + TF1 per waveform, default), batch (all waveforms of a chunk at once), or ratio (sample-ratio method of DRS-UVa RecoWaveForm, all waveforms of a chunk at once)", default='root')
+parser.add_argument("--skimFile", help="with --engine batch: also write per-bar amplitudes, positions, times, and selection flags to this file. with --engine skim: file to run on", default=None)
+parser.add_argument("--storeDir", help="with --engine batch/twoPass: read waveforms from waveform store in this directory (written with waveformStore.py) instead of the pulse tree", default=None)
+parser.add_argument("--ratioCalibration", help="with --fitEngine ratio: calibration file, or directory of versioned files (latest is used), written by calibrateRatios.py (default: DRS-UVa/pulse.cc constants)", default=None)
+parser.add_argument("--snapshotPort", help="serve JSON snapshots of histograms and stage counters on http://127.0.0.1:<port>/ while the event loop runs (default: no server)", type=int, default=None)
+parser.add_argument("--timeStages", help="time tree reading, threshold search, fits, threshold scan, histogram filling, ... and write summary table and <topDir>/<runType>/stageTimers.json", action='store_true')
 args = parser.parse_args()
 
 if(args.vetoOpt is None):
     print "#### Seting --vetoOpt singlAdj by default ####"
     args.vetoOpt = 'singleAdj'
 else:
-    if( not(args.vetoOpt == "none" or args.vetoOpt == "singleAdj" or args.vetoOpt == "doubleAdj" or args.vetoOpt == "allAdj" or args.vetoOpt == "all") ):
-        print "#### Please use none/singleAdj/doubleAdj/allAdj/all when setting --vetoOpt <option>. Supplied value ({0}) does not match ####\nEXITING".format(args.vetoOpt)
-        quit()
-    else:
-        print '-- Setting vetoOpt = {0}'.format(args.vetoOpt)
+    for vetoOpt in args.vetoOpt.split(','):
+        if( not(vetoOpt == "none" or vetoOpt == "singleAdj" or vetoOpt == "doubleAdj" or vetoOpt == "allAdj" or vetoOpt == "all") ):
+            print "#### Please use none/singleAdj/doubleAdj/allAdj/all when setting --vetoOpt <option>. Supplied value ({0}) does not match ####\nEXITING".format(vetoOpt)
+            quit()
+    print '-- Setting vetoOpt = {0}'.format(args.vetoOpt)
 
 if(args.test is None):
     args.test = True
@@ -31,29 +44,83 @@ if(args.test is None):
 else:
     args.test = False
 
+if( not(args.engine == "event" or args.engine == "batch" or args.engine == "twoPass" or args.engine == "skim") ):
+    print "#### Please use event/batch/twoPass/skim when setting --engine <option>. Supplied value ({0}) does not match ####\nEXITING".format(args.engine)
+    quit()
+if( args.skimFile is not None and not(args.engine == "batch" or args.engine == "skim") ):
+    print "#### Please use --engine batch to write or --engine skim to read --skimFile ####\nEXITING"
+    quit()
+if( args.engine == "skim" and args.skimFile is None ):
+    print "#### Please set --skimFile <file> with --engine skim ####\nEXITING"
+    quit()
+if( args.storeDir is not None and not(args.engine == "batch" or args.engine == "twoPass") ):
+    print "#### Please use --engine batch/twoPass when reading waveforms with --storeDir ####\nEXITING"
+    quit()
+if( args.checkpointEvery > 0 and args.engine == "twoPass" ):
+    print "#### Please use --engine event/batch/skim with --checkpointEvery, twoPass only reads waveforms after its first pass over all entries ####\nEXITING"
+    quit()
+if( not(args.fitEngine == "root" or args.fitEngine == "batch" or args.fitEngine == "ratio") ):
+    print "#### Please use root/batch/ratio when setting --fitEngine <option>. Supplied value ({0}) does not match ####\nEXITING".format(args.fitEngine)
+    quit()
+if( args.ratioCalibration is not None and args.fitEngine != "ratio" ):
+    print "#### Please use --fitEngine ratio with --ratioCalibration ####\nEXITING"
+    quit()
+if( args.fitEngine == "ratio" and args.engine == "event" ):
+    print "#### Please use --engine batch/twoPass with --fitEngine ratio ####\nEXITING"
+    quit()
+if( args.snapshotPort is not None and args.nWorkers > 1 ):
+    print "#### Please use --snapshotPort without --nWorkers, shard histograms are only added at the end ####\nEXITING"
+    quit()
+if( args.nWorkers < 1 ):
+    print "#### Please use a positive number when setting --nWorkers <n>. Supplied value ({0}) does not match ####\nEXITING".format(args.nWorkers)
+    quit()
 
-topDir = '04-23-18_plots_{0}'.format(args.vetoOpt)
+# one configuration per (vetoOpt, signalThreshold), each with its own output directory
+signalThresholds = [None]
+if(args.signalThresholds is not None):
+    signalThresholds = [float(threshold) for threshold in args.signalThresholds.split(',')]
+configs = []
+for vetoOpt in args.vetoOpt.split(','):
+    for threshold in signalThresholds:
+        topDir = '04-23-18_plots_{0}'.format(vetoOpt)
+        if threshold is not None:
+            topDir = '{0}_sig{1:g}'.format(topDir, threshold)
+        configs.append( (vetoOpt, threshold, topDir) )
+if( len(configs) > 1 and args.nWorkers > 1 ):
+    print "#### --nWorkers is not supported with several --vetoOpt/--signalThresholds configurations ####\nEXITING"
+    quit()
+if( len(configs) > 1 and args.engine == "batch" and args.skimFile is not None ):
+    print "#### write --skimFile with one configuration, then fill several configurations from it with --engine skim ####\nEXITING"
+    quit()
+if( len(configs) > 1 ):
+    print '-- Filling {0} configurations in one pass with the {1} engine'.format(len(configs), 'skim' if args.engine == 'skim' else 'batch')
+vetoOpt, signalThreshold, topDir = configs[0]
 
 
-# Ben Local
-f0 = TFile('/home/btannenw/Desktop/MTD/testbeam_FNAL_03-2018/all5exposure/DataCMSVMETiming_5barExposure.root', 'READ') # all 5
-f1 = TFile('/home/btannenw/Desktop/MTD/testbeam_FNAL_03-2018/lowBias/bottombars_66V.root', 'READ') # low bias (66 V) bars 1 and 2
-#f2 = TFile('/home/btannenw/Desktop/MTD/testbeam_FNAL_03-2018/lowBias/topbars_66V.root', 'READ') # low bias (66 V) bars 3, 4, and 5
+skimOutput = args.skimFile if args.engine == "batch" else None
+if(args.engine == "skim"): # skim of all5exposure replaces pulse tree, raw files are not needed
+    f0 = TFile(args.skimFile, 'READ')
+    t0 = f0.skim
+else:
+    # Ben Local
+    f0 = TFile('/home/btannenw/Desktop/MTD/testbeam_FNAL_03-2018/all5exposure/DataCMSVMETiming_5barExposure.root', 'READ') # all 5
+    f1 = TFile('/home/btannenw/Desktop/MTD/testbeam_FNAL_03-2018/lowBias/bottombars_66V.root', 'READ') # low bias (66 V) bars 1 and 2
+    #f2 = TFile('/home/btannenw/Desktop/MTD/testbeam_FNAL_03-2018/lowBias/topbars_66V.root', 'READ') # low bias (66 V) bars 3, 4, and 5
 
-# LPC
-#f0 = TFile('/eos/uscms/store/user/mjoyce/BTL/FNAL_TB_Mar2018/combined/Run902_to_953.root', 'READ') # all 5
-#f1 = TFile('/eos/uscms/store/user/mjoyce/BTL/FNAL_TB_Mar2018/combined/bottombars_66V.root', 'READ') # low bias (66 V) bars 1 and 2
-#f2 = TFile('/eos/uscms/store/user/mjoyce/BTL/FNAL_TB_Mar2018/combined/topbars_66V.root', 'READ') # low bias (66 V) bars 3, 4, and 5
+    # LPC
+    #f0 = TFile('/eos/uscms/store/user/mjoyce/BTL/FNAL_TB_Mar2018/combined/Run902_to_953.root', 'READ') # all 5
+    #f1 = TFile('/eos/uscms/store/user/mjoyce/BTL/FNAL_TB_Mar2018/combined/bottombars_66V.root', 'READ') # low bias (66 V) bars 1 and 2
+    #f2 = TFile('/eos/uscms/store/user/mjoyce/BTL/FNAL_TB_Mar2018/combined/topbars_66V.root', 'READ') # low bias (66 V) bars 3, 4, and 5
 
-t0 = f0.pulse
-t1 = f1.pulse
-#t2 = f2.pulse
+    t0 = f0.pulse
+    t1 = f1.pulse
+    #t2 = f2.pulse
 
 
 if(args.test):
-    barClass(t0, 'all5exposure', topDir, args.vetoOpt, True)
-    #barClass(t1, 'bottomBars_66V', topDir, args.vetoOpt, True)
+    barClass(t0, 'all5exposure', topDir, vetoOpt, test=True, engine=args.engine, chunkSize=args.chunkSize, fitEngine=args.fitEngine, nWorkers=args.nWorkers, signalThreshold=signalThreshold, configs=configs[1:], cacheDir=args.cacheDir, checkpointEvery=args.checkpointEvery, resume=args.resume, timeStages=args.timeStages, skimFile=skimOutput, storeDir=args.storeDir, ratioCalibration=args.ratioCalibration, snapshotPort=args.snapshotPort)
+    #barClass(t1, 'bottomBars_66V', topDir, vetoOpt, test=True, engine=args.engine, chunkSize=args.chunkSize, fitEngine=args.fitEngine, nWorkers=args.nWorkers, signalThreshold=signalThreshold, configs=configs[1:], cacheDir=args.cacheDir, checkpointEvery=args.checkpointEvery, resume=args.resume, timeStages=args.timeStages, skimFile=skimOutput, storeDir=args.storeDir, ratioCalibration=args.ratioCalibration, snapshotPort=args.snapshotPort)
 else:
-    barClass(t0, 'all5exposure', topDir, args.vetoOpt)
-    #barClass(t1, 'bottomBars_66V', topDir, args.vetoOpt)
-    #barClass(t2, 'topBars_66V', topDir, args.vetoOpt)
+    barClass(t0, 'all5exposure', topDir, vetoOpt, test=False, engine=args.engine, chunkSize=args.chunkSize, fitEngine=args.fitEngine, nWorkers=args.nWorkers, signalThreshold=signalThreshold, configs=configs[1:], cacheDir=args.cacheDir, checkpointEvery=args.checkpointEvery, resume=args.resume, timeStages=args.timeStages, skimFile=skimOutput, storeDir=args.storeDir, ratioCalibration=args.ratioCalibration, snapshotPort=args.snapshotPort)
+    #barClass(t1, 'bottomBars_66V', topDir, vetoOpt, test=False, engine=args.engine, chunkSize=args.chunkSize, fitEngine=args.fitEngine, nWorkers=args.nWorkers, signalThreshold=signalThreshold, configs=configs[1:], cacheDir=args.cacheDir, checkpointEvery=args.checkpointEvery, resume=args.resume, timeStages=args.timeStages, skimFile=skimOutput, storeDir=args.storeDir, ratioCalibration=args.ratioCalibration, snapshotPort=args.snapshotPort)
+    #barClass(t2, 'topBars_66V', topDir, vetoOpt, test=False, engine=args.engine, chunkSize=args.chunkSize, fitEngine=args.fitEngine, nWorkers=args.nWorkers, signalThreshold=signalThreshold, configs=configs[1:], cacheDir=args.cacheDir, checkpointEvery=args.checkpointEvery, resume=args.resume, timeStages=args.timeStages, skimFile=skimOutput, storeDir=args.storeDir, ratioCalibration=args.ratioCalibration, snapshotPort=args.snapshotPort)
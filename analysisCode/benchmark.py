@@ -0,0 +1,119 @@
+# /usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 22, 2018
+#Purpose: Throughput benchmark of barClass engines on synthetic pulse trees: events/s and peak memory at several dataset sizes
+
+import os, sys, argparse, json, time, resource, subprocess
+import multiprocessing
+
+# (name, engine, fitEngine, nWorkers) of each benchmarked mode. nWorkers 0 = number of CPUs
+benchmarkModes = [
+    ('event',           'event',   'root',  1),
+    ('batch',           'batch',   'root',  1),
+    ('batch-batchFit',  'batch',   'batch', 1),
+    ('batch-ratioFit',  'batch',   'ratio', 1),
+    ('twoPass',         'twoPass', 'root',  1),
+    ('twoPass-batchFit','twoPass', 'batch', 1),
+    ('parallel',        'batch',   'batch', 0),
+]
+
+
+def runSingle(inputFile, runType, mode, nEvents, outDir, chunkSize, resultFile):
+    """ function run in a fresh process for each measurement: run barClass over first nEvents of inputFile and write events, seconds, events/s, and peak memory to resultFile"""
+    from barClass import barClass
+    from treeIO import buildChain
+
+    name, engine, fitEngine, nWorkers = mode
+    if nWorkers == 0:
+        nWorkers = multiprocessing.cpu_count()
+
+    start = time.time()
+    bar = barClass(buildChain([inputFile]), runType, outDir, 'singleAdj', engine=engine, chunkSize=chunkSize, fitEngine=fitEngine, nWorkers=nWorkers, entryRange=(0, nEvents),
+                   histFile='{0}/{1}/{2}_hists.root'.format(outDir, runType, name))
+    seconds = time.time() - start
+
+    # ru_maxrss is in kB on Linux, workers of parallel mode are counted separately
+    peakMB = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+    childPeakMB = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1024.
+    result = {'mode' : name, 'engine' : engine, 'fitEngine' : fitEngine, 'nWorkers' : nWorkers, 'nEvents' : bar.nEvents, 'seconds' : seconds,
+              'eventsPerSecond' : bar.nEvents/max(seconds, 1e-9), 'peakMB' : peakMB, 'workerPeakMB' : childPeakMB}
+    json.dump(result, open(resultFile, 'w'))
+
+
+def runBenchmark(inputFile, runType, modes, sizes, outDir, chunkSize):
+    """ function to run every mode at every size, each in its own process so peak memory is per measurement. returns list of results"""
+    results = []
+    for nEvents in sizes:
+        for mode in modes:
+            resultFile = '{0}/result.json'.format(outDir)
+            if os.path.isfile(resultFile):
+                os.remove(resultFile)
+            log = open('{0}/{1}_{2}.log'.format(outDir, mode[0], nEvents), 'w')
+            subprocess.call([sys.executable, os.path.abspath(__file__), '--single', '--input', inputFile, '--runType', runType, '--modes', mode[0],
+                             '--sizes', str(nEvents), '--outDir', outDir, '--chunkSize', str(chunkSize)], stdout=log, stderr=subprocess.STDOUT)
+            log.close()
+
+            if not os.path.isfile(resultFile):
+                print "#### {0} with {1} events failed, see {2}/{0}_{1}.log ####".format(mode[0], nEvents, outDir)
+                continue
+            result = json.load(open(resultFile))
+            result['size'] = nEvents
+            results.append(result)
+            print "{0:18s} {1:8d} events: {2:10.1f} events/s, peak {3:8.1f} MB".format(mode[0], result['nEvents'], result['eventsPerSecond'], max(result['peakMB'], result['workerPeakMB']))
+
+    return results
+
+
+def printBenchmarkSummary(results, sizes):
+    """ function to print table of events/s (peak MB) with one row per mode and one column per size"""
+    print "==== Benchmark summary: events/s (peak MB) ===="
+    print "{0:18s}".format("mode") + ''.join( "{0:>22s}".format('{0} events'.format(size)) for size in sizes )
+    for name in sorted(set(result['mode'] for result in results), key=[mode[0] for mode in benchmarkModes].index):
+        row = "{0:18s}".format(name)
+        for size in sizes:
+            match = [result for result in results if result['mode'] == name and result['size'] == size]
+            if len(match) == 0:
+                row += "{0:>22s}".format('failed')
+            else:
+                row += "{0:>22s}".format('{0:0.1f} ({1:0.0f})'.format(match[0]['eventsPerSecond'], max(match[0]['peakMB'], match[0]['workerPeakMB'])))
+        print row
+
+
+if __name__ == '__main__':
+    # *** 0. setup parser for command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="pulse tree to run on, generated with syntheticPulses.py if it does not exist", default='benchmark/synthetic_pulse.root')
+    parser.add_argument("--runType", help="run type used for generation and analysis", default='all5exposure')
+    parser.add_argument("--sizes", help="comma-separated list of numbers of events (default 1000,5000,20000)", default='1000,5000,20000')
+    parser.add_argument("--modes", help="comma-separated list of modes (default all: {0})".format(', '.join(mode[0] for mode in benchmarkModes)), default=None)
+    parser.add_argument("--chunkSize", help="number of events per chunk for batch/twoPass engines", type=int, default=1000)
+    parser.add_argument("--outDir", help="directory for histograms, logs, and benchmark.json", default='benchmark')
+    parser.add_argument("--seed", help="random seed of generated input", type=int, default=1)
+    parser.add_argument("--single", help=argparse.SUPPRESS, action='store_true') # one measurement, used by runBenchmark
+    args = parser.parse_args()
+
+    modeNames = [mode[0] for mode in benchmarkModes]
+    modes = benchmarkModes if args.modes is None else [benchmarkModes[modeNames.index(name)] for name in args.modes.split(',') if name in modeNames]
+    if args.modes is not None and len(modes) != len(args.modes.split(',')):
+        print "#### Please use {0} when setting --modes <list>. Supplied value ({1}) does not match ####\nEXITING".format('/'.join(modeNames), args.modes)
+        quit()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    if args.single:
+        runSingle(args.input, args.runType, modes[0], sizes[0], args.outDir, args.chunkSize, '{0}/result.json'.format(args.outDir))
+        quit()
+
+    if not os.path.isdir(args.outDir):
+        os.system( 'mkdir -p {0}'.format(args.outDir) )
+
+    # *** 1. synthetic input with enough events for largest size
+    if not os.path.isfile(args.input):
+        from syntheticPulses import writeSyntheticTree
+        writeSyntheticTree(args.input, max(sizes), args.runType, None, args.seed)
+
+    # *** 2. all modes at all sizes, then summary
+    print '-- benchmarking {0} on {1} ({2} CPUs)'.format(', '.join(mode[0] for mode in modes), args.input, multiprocessing.cpu_count())
+    results = runBenchmark(args.input, args.runType, modes, sizes, args.outDir, args.chunkSize)
+    printBenchmarkSummary(results, sizes)
+    json.dump({'input' : args.input, 'runType' : args.runType, 'nCPUs' : multiprocessing.cpu_count(), 'results' : results}, open('{0}/benchmark.json'.format(args.outDir), 'w'), indent=1, sort_keys=True)
@@ -0,0 +1,238 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 25, 2018
+#Purpose: T(R) and A(R) ratio calibration of all SiPM channels in one pass over the pulse tree, saved as versioned calibration file for ratioTiming
+
+import os, sys, argparse
+import numpy
+from treeIO import readChunks, buildChain, getTreeFiles
+from timingCache import getFileIdentity
+from ratioTiming import recoWaveforms, getChannelDRS, defaultCalibration, writeRatioCalibration
+from barGeometry import barGeometry
+
+# SiPM channels of all bars of the March 2018 module
+sipmChannels = barGeometry('all5exposure').sipmChannels
+
+# settings of pulse::CalibrateOneChannel
+maxRatioWaveforms = 2000 # 1st iteration stops after this many (+1) good waveforms
+maxBacklogWaveforms = 5000 # waveforms per channel kept in memory until T(R) is known, entries are read again for the pulse shape if there are more
+profileBins, profileMin, profileMax = 500, -50., 50. # average pulse shape A(T), ns relative to tReco
+
+
+def fitPolynomial(x, y, order, fixConstant=False):
+    """ function to return coefficients of unweighted least squares polynomial fit of order (like TGraph::Fit "W" with polN), constant term 0 if fixConstant"""
+    powers = numpy.arange(1 if fixConstant else 0, order + 1)
+    coefficients = numpy.linalg.lstsq( x[:, numpy.newaxis]**powers, y, rcond=-1 )[0]
+    return list(coefficients) if not fixConstant else [0.] + list(coefficients)
+
+
+class channelCalibration:
+    def __init__(self, channel, calibration=defaultCalibration):
+        self.channel = channel
+        self.calibration = dict(calibration)
+        self.ch = getChannelDRS(self.calibration)
+        self.stage = 'ratios' # ratios: collect T(R) points with start calibration, shape: fill average pulse shape with new T(R)
+        self.backlog = [] # (samples, times) copies of pulse shape candidates read during ratios stage, filled into pulse shape once T(R) is known. None if above maxBacklogWaveforms
+        self.nBacklog = 0
+        self.nEntries = 0 # entries read during ratios stage
+        self.rereadStop = None # entries [0, rereadStop) to read again for the pulse shape, if backlog was dropped
+        self.ratios = []
+        self.ratioTimes = []
+        self.nRatioWaveforms = 0
+        self.nShapeWaveforms = 0
+        self.profileSums = numpy.zeros(profileBins)
+        self.profileEntries = numpy.zeros(profileBins)
+
+    # =============================
+
+    def addChunk(self, samples, times):
+        """ function to add waveforms (n x 1024) of this channel. both iterations of CalibrateOneChannel are done in the same pass: pulse shape candidates are kept
+        until maxRatioWaveforms good ones give the new T(R), then all of them and every later chunk fill the average pulse shape"""
+        if self.stage == 'shape':
+            self.addShape(samples, times)
+            return
+
+        reco, amp, points = recoWaveforms(samples, times, self.ch)
+        ratio, error, time, sample, inWindow = points
+        good = numpy.flatnonzero( (reco['ampMin'] < -200.) & (reco['pedRMS'] < 5.0) & (reco['tReco'] < 200.0) )[:maxRatioWaveforms + 1 - self.nRatioWaveforms]
+        self.ratios.append( ratio[good][inWindow[good]] )
+        self.ratioTimes.append( (time[good] - reco['tReco'][good, numpy.newaxis])[inWindow[good]] )
+        self.nRatioWaveforms += len(good)
+        self.nEntries += len(samples)
+
+        # only copies of waveforms that can pass addShape are kept (ampMin and pedRMS do not depend on T(R)), not views pinning the whole chunk
+        if self.backlog is not None:
+            candidates = numpy.flatnonzero( (reco['ampMin'] > -1800.) & (reco['ampMin'] < -200.) & (reco['pedRMS'] < 5.0) )
+            self.nBacklog += len(candidates)
+            if self.nBacklog > maxBacklogWaveforms:
+                print "#### channel {0}: more than {1} waveforms before T(R) is known, pulse shape entries are read again ####".format(self.channel, maxBacklogWaveforms)
+                self.backlog = None
+            elif len(candidates) > 0:
+                self.backlog.append( (samples[candidates].copy(), times[candidates].copy()) )
+
+        if self.nRatioWaveforms > maxRatioWaveforms:
+            self.startShape()
+
+    # =============================
+
+    def startShape(self):
+        """ function to fit new T(R) to ratio points of 1st iteration and fill waveforms kept so far into average pulse shape. if they were dropped,
+        entries [0, rereadStop) must be added again with addShape"""
+        ratio, ratioTime = numpy.concatenate(self.ratios), numpy.concatenate(self.ratioTimes)
+        inRange = (ratio >= 0.0) & (ratio <= 0.8)
+        if inRange.sum() > 5:
+            self.calibration['parTvsR'] = fitPolynomial(ratio[inRange], ratioTime[inRange], 4)
+        else:
+            print "#### channel {0}: only {1} ratio points, keeping start T(R) ####".format(self.channel, inRange.sum())
+        self.ch = getChannelDRS(self.calibration)
+
+        self.stage = 'shape'
+        if self.backlog is None:
+            self.rereadStop = self.nEntries
+        else:
+            for samples, times in self.backlog:
+                self.addShape(samples, times)
+        self.backlog = []
+
+    # =============================
+
+    def addShape(self, samples, times):
+        """ function to fill average pulse shape A(T) (amplitude / minimum vs. time - tReco) with unclipped good waveforms"""
+        reco, amp, points = recoWaveforms(samples, times, self.ch)
+        good = numpy.flatnonzero( (reco['ampMin'] > -1800.) & (reco['ampMin'] < -200.) & (reco['pedRMS'] < 5.0) & (reco['tReco'] < 200.0) )
+        if len(good) == 0:
+            return
+
+        t = reco['tStart'][good, numpy.newaxis] + numpy.arange(amp.shape[1])*self.ch.timeStep - reco['tReco'][good, numpy.newaxis]
+        a = amp[good] / reco['ampMin'][good, numpy.newaxis]
+        bins = numpy.floor( profileBins*(t - profileMin)/(profileMax - profileMin) ).astype(int)
+        inside = (t >= profileMin) & (t < profileMax)
+        self.profileSums += numpy.bincount(bins[inside], weights=a[inside], minlength=profileBins)
+        self.profileEntries += numpy.bincount(bins[inside], minlength=profileBins)
+        self.nShapeWaveforms += len(good)
+
+    # =============================
+
+    def getProfile(self):
+        """ function to return (bin centers, mean amplitude) of average pulse shape, 0 in empty bins like TProfile"""
+        centers = profileMin + (numpy.arange(profileBins) + 0.5)*(profileMax - profileMin)/profileBins
+        means = numpy.where(self.profileEntries > 0, self.profileSums / numpy.maximum(self.profileEntries, 1), 0)
+        return centers, means
+
+    # =============================
+
+    def finish(self):
+        """ function to fit T(R) and A(R) to average pulse shape, like 2nd iteration of CalibrateOneChannel. returns calibration (settings like defaultCalibration)"""
+        if self.stage == 'ratios': # fewer than maxRatioWaveforms good waveforms in tree
+            self.startShape()
+
+        centers, means = self.getProfile()
+        iMax = means.argmax()
+        ampMax, timeMax = means[iMax], centers[iMax]
+        interpolate = lambda x: numpy.interp(x, centers, means) # same as TH1::Interpolate, constant outside first/last bin center
+
+        # ratio of pulse shape at t and t + ratioStep samples
+        tvsR, avsR = [], []
+        tCurrent = -10.0
+        while tCurrent < 20.0:
+            a1 = interpolate(tCurrent)
+            a2 = interpolate(tCurrent + self.ch.ratioStep*self.ch.timeStep)
+            if a1 > 1e-3 and a2 > 1e-3 and tCurrent < timeMax and a2 < ampMax*0.8:
+                tvsR.append( (a1/a2, tCurrent) )
+                avsR.append( (a1/a2, a1/ampMax) )
+            tCurrent += 0.1
+
+        points = numpy.array(tvsR).reshape(-1, 2)
+        inRange = (points[:, 0] >= 0.0) & (points[:, 0] <= 0.8)
+        if inRange.sum() > 5:
+            self.calibration['parTvsR'] = fitPolynomial(points[inRange, 0], points[inRange, 1], 4)
+            points = numpy.array(avsR)
+            self.calibration['parAvsR'] = fitPolynomial(points[inRange, 0], points[inRange, 1], 4, True)
+        else:
+            print "#### channel {0}: only {1} pulse shape points, keeping T(R) of 1st iteration and start A(R) ####".format(self.channel, inRange.sum())
+
+        self.calibration['nRatioWaveforms'] = self.nRatioWaveforms
+        self.calibration['nShapeWaveforms'] = self.nShapeWaveforms
+        return self.calibration
+
+
+def calibrateRatios(tree, channels, chunkSize=1000, nEvents=None):
+    """ function to calibrate all channels in one pass over tree, plus a second pass over the first entries for channels whose waveforms kept until T(R)
+    was known were above maxBacklogWaveforms. returns (dictionary channel -> calibration, dictionary channel -> channelCalibration)"""
+    calibrators = dict( (channel, channelCalibration(channel)) for channel in channels )
+    nTotal = 0
+    for chunk in readChunks(tree, ['time', 'channel'], chunkSize, 0, nEvents):
+        for channel in channels:
+            calibrators[channel].addChunk(chunk['channel'][:, channel], chunk['time'][:, channel/9])
+        nTotal += len(chunk)
+        print "{0} events processed, T(R) from {1} waveforms so far".format(nTotal, ', '.join( '{0} (ch{1})'.format(calibrators[channel].nRatioWaveforms, channel) for channel in channels ))
+
+    for channel in channels:
+        if calibrators[channel].stage == 'ratios': # fewer than maxRatioWaveforms good waveforms in tree
+            calibrators[channel].startShape()
+    reread = [channel for channel in channels if calibrators[channel].rereadStop is not None]
+    if len(reread) > 0:
+        rereadStop = max(calibrators[channel].rereadStop for channel in reread)
+        print "-- reading entries 0-{0} again for pulse shape of channels {1}".format(rereadStop, ', '.join(str(channel) for channel in reread))
+        first = 0
+        for chunk in readChunks(tree, ['time', 'channel'], chunkSize, 0, rereadStop):
+            for channel in reread:
+                n = min(len(chunk), calibrators[channel].rereadStop - first)
+                if n > 0:
+                    calibrators[channel].addShape(chunk['channel'][:n, channel], chunk['time'][:n, channel/9])
+            first += len(chunk)
+
+    return dict( (channel, calibrators[channel].finish()) for channel in channels ), calibrators
+
+
+def writeCalibrationPlots(fileName, calibrators, calibrations):
+    """ function to write pulse shape A(T), T(R), and A(R) graphs of each channel to ROOT file, like calibrate.root of CalibrateOneChannel"""
+    from ROOT import TFile, TGraph, TF1
+
+    f = TFile(fileName, 'RECREATE')
+    for channel, calibrator in sorted(calibrators.items()):
+        centers, means = calibrator.getProfile()
+        gAT = TGraph(len(centers), centers, means)
+        gAT.SetName('grAT_ch{0}'.format(channel))
+        gAT.SetTitle('average A(T), ch{0};T - T_{{0}} (ns);A / A_{{max}}'.format(channel))
+        gAT.Write()
+
+        for name, key in [('TvsR', 'parTvsR'), ('AvsR', 'parAvsR')]:
+            fn = TF1('f{0}_ch{1}'.format(name, channel), 'pol4', 0.0, 0.8)
+            for i in range(5):
+                fn.SetParameter(i, calibrations[channel][key][i])
+            fn.SetTitle('{0}(R) ch{1};R'.format(name[0], channel))
+            fn.Write()
+    f.Close()
+
+
+if __name__ == '__main__':
+    # *** 0. setup parser for command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="comma-separated list of pulse tree files (chained in this order)", required=True)
+    parser.add_argument("--treeName", help="name of tree in input files", default='pulse')
+    parser.add_argument("--channels", help="comma-separated list of DRS channels to calibrate (default: SiPMs of all bars, {0})".format(','.join(str(c) for c in sipmChannels)), default=None)
+    parser.add_argument("--nEvents", help="number of events to use, from first entry (default: all)", type=int, default=None)
+    parser.add_argument("--chunkSize", help="number of events read at once", type=int, default=1000)
+    parser.add_argument("--calibDir", help="directory of versioned calibration files ratioCalibration_v<N>.json, a new version is added", default='ratioCalibration')
+    parser.add_argument("--plotFile", help="also write pulse shape and T(R), A(R) of each channel to this ROOT file", default=None)
+    args = parser.parse_args()
+
+    channels = sipmChannels if args.channels is None else [int(c) for c in args.channels.split(',')]
+    if( any(channel < 0 or channel > 35 for channel in channels) ):
+        print "#### Please use DRS channels 0-35 when setting --channels <list>. Supplied value ({0}) does not match ####\nEXITING".format(args.channels)
+        quit()
+
+    # *** 1. one pass over tree for all channels
+    tree = buildChain(args.input.split(','), args.treeName)
+    calibrations, calibrators = calibrateRatios(tree, channels, args.chunkSize, args.nEvents)
+
+    # *** 2. save constants, read by barClass with --ratioCalibration
+    fileName = writeRatioCalibration(args.calibDir, calibrations, {'files' : getFileIdentity(getTreeFiles(tree)), 'nEvents' : args.nEvents})
+    for channel in channels:
+        print "ch{0}: parTvsR = {{ {1} }}, parAvsR = {{ {2} }} ({3} + {4} waveforms)".format(channel, ', '.join('{0:g}'.format(p) for p in calibrations[channel]['parTvsR']),
+                                                                                          ', '.join('{0:g}'.format(p) for p in calibrations[channel]['parAvsR']), calibrations[channel]['nRatioWaveforms'], calibrations[channel]['nShapeWaveforms'])
+    print "-- ratio calibration written to {0}".format(fileName)
+    if args.plotFile is not None:
+        writeCalibrationPlots(args.plotFile, calibrators, calibrations)
@@ -0,0 +1,275 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 8, 2018
+#Purpose: Batched leading-edge fits of DRS waveforms with numpy, replacing one TGraph + TF1 fit per waveform
+
+import numpy
+
+# CERNLIB DENLAN coefficients, as used by ROOT::Math::landau_pdf (and so by TF1 "landau")
+p1 = [0.4259894875, -0.1249762550, 0.03984243700, -0.006298287635, 0.001511162253]
+q1 = [1.0, -0.3388260629, 0.09594393323, -0.01608042283, 0.003778942063]
+p2 = [0.1788541609, 0.1173957403, 0.01488850518, -0.001394989411, 0.0001283617211]
+q2 = [1.0, 0.7428795082, 0.3153932961, 0.06694219548, 0.008790609714]
+p3 = [0.1788544503, 0.09359161662, 0.006325387654, 0.00006611667319, -0.000002031049101]
+q3 = [1.0, 0.6097809921, 0.2560616665, 0.04746722384, 0.006957301675]
+p4 = [0.9874054407, 118.6723273, 849.2794360, -743.7792444, 427.0262186]
+q4 = [1.0, 106.8615961, 337.6496214, 2016.712389, 1597.063511]
+p5 = [1.003675074, 167.5702434, 4789.711289, 21217.86767, -22324.94910]
+q5 = [1.0, 156.9424537, 3745.310488, 9834.698876, 66924.28357]
+p6 = [1.000827619, 664.9143136, 62972.92665, 475554.6998, -5743609.109]
+q6 = [1.0, 651.4101098, 56974.73333, 165917.4725, -2815759.939]
+a1 = [0.04166666667, -0.01996527778, 0.02709538966]
+a2 = [-1.845568670, -4.284640743]
+
+
+def rational(p, q, u):
+    """ function to evaluate ratio of two 4th order polynomials with coefficients p, q at u"""
+    return (p[0]+(p[1]+(p[2]+(p[3]+p[4]*u)*u)*u)*u) / (q[0]+(q[1]+(q[2]+(q[3]+q[4]*u)*u)*u)*u)
+
+
+def landau(v):
+    """ function to return un-normalized landau density at v = (t - mpv)/sigma, same as TMath::Landau(t, mpv, sigma)"""
+    v = numpy.asarray(v, dtype=numpy.float64)
+    den = numpy.zeros(v.shape)
+
+    with numpy.errstate(all='ignore'):
+        m = (v >= -5.5) & (v < -1)
+        u = numpy.exp(-v[m] - 1)
+        den[m] = numpy.exp(-u)*numpy.sqrt(u)*rational(p1, q1, v[m])
+
+        m = v < -5.5
+        u = numpy.exp(v[m] + 1.0)
+        tail = 0.3989422803*(numpy.exp(-1/u)/numpy.sqrt(u))*(1 + (a1[0] + (a1[1] + a1[2]*u)*u)*u)
+        den[m] = numpy.where(u < 1e-10, 0.0, tail)
+
+        m = (v >= -1) & (v < 1)
+        den[m] = rational(p2, q2, v[m])
+
+        m = (v >= 1) & (v < 5)
+        den[m] = rational(p3, q3, v[m])
+
+        for vMin, vMax, p, q in [(5, 12, p4, q4), (12, 50, p5, q5), (50, 300, p6, q6)]:
+            m = (v >= vMin) & (v < vMax)
+            u = 1/v[m]
+            den[m] = u*u*rational(p, q, u)
+
+        m = v >= 300
+        u = 1/(v[m] - v[m]*numpy.log(v[m])/(v[m] + 1))
+        den[m] = u*u*(1 + (a2[0] + a2[1]*u)*u)
+
+    return den
+
+
+# v = (t - mpv)/sigma of landau maximum, and left side of landau / maximum (v, fraction) for finding v of a fraction of the peak on the rising edge
+landauPeak = numpy.linspace(-1, 0.5, 15001)[ landau(numpy.linspace(-1, 0.5, 15001)).argmax() ]
+risingV = numpy.linspace(-5.5, landauPeak, 2001)
+risingFraction = landau(risingV)/landau(landauPeak)
+
+
+def polynomialOrder(function):
+    """ function to return order N of polynomial fit function 'polN', -1 if function is not a polynomial"""
+    if function.startswith('pol') and function[3:].isdigit():
+        return int(function[3:])
+    return -1
+
+
+def evaluateEdge(function, params, t):
+    """ function to evaluate fit function (landau or polN) with one row of params per waveform at times t (one row per waveform)"""
+    params = numpy.asarray(params, dtype=numpy.float64)
+    t = numpy.asarray(t, dtype=numpy.float64)
+    if t.ndim == params.ndim: # several times per waveform
+        params = params[..., numpy.newaxis, :]
+
+    if function == 'landau':
+        with numpy.errstate(all='ignore'):
+            return params[..., 0]*landau( (t - params[..., 1])/params[..., 2] )
+
+    order = polynomialOrder(function)
+    if order < 0:
+        raise ValueError('fit function {0} not supported by edgeFitter, use landau or polN'.format(function))
+
+    value = numpy.zeros(numpy.broadcast(t, params[..., 0]).shape)
+    for i in range(order, -1, -1):
+        value = value*t + params[..., i]
+    return value
+
+
+def getFitWindows(times, samples, startFit, window):
+    """ function to return (t, y, weight) arrays of the window+1 samples after startFit of each waveform, and mask of waveforms with a usable window"""
+    nWaveforms = len(samples)
+    window = numpy.broadcast_to(numpy.asarray(window, dtype=int), (nWaveforms,))
+    startFit = numpy.asarray(startFit, dtype=int)
+
+    # same protection against weird waveforms as getTimingForChannel
+    valid = (startFit > 1) & (startFit + window < samples.shape[1])
+
+    offsets = numpy.arange(window.max() + 1 if nWaveforms > 0 else 1)
+    index = numpy.clip(startFit[:, numpy.newaxis] + offsets, 0, samples.shape[1] - 1)
+    rows = numpy.arange(nWaveforms)[:, numpy.newaxis]
+    weight = ((offsets <= window[:, numpy.newaxis]) & valid[:, numpy.newaxis]).astype(numpy.float64)
+
+    return times[rows, index].astype(numpy.float64), samples[rows, index].astype(numpy.float64), weight, valid
+
+
+def fitPolynomialEdges(t, y, weight, order):
+    """ function to fit polynomial of given order to every row of (t, y) at once with weighted linear least squares. returns (params, chi2)"""
+    nPar = order + 1
+    t0 = t[:, :1] # expand around first point of window for stable normal equations
+    X = (t - t0)[..., numpy.newaxis]**numpy.arange(nPar)
+    XtW = X.transpose(0, 2, 1)*weight[:, numpy.newaxis, :]
+    A = numpy.matmul(XtW, X) + 1e-12*numpy.eye(nPar)
+    b = numpy.matmul(XtW, y[..., numpy.newaxis])
+    c = numpy.linalg.solve(A, b)[..., 0]
+
+    # shift coefficients back to p(t) = sum_j params_j * t^j
+    params = numpy.zeros_like(c)
+    for i in range(nPar):
+        for j in range(i + 1):
+            params[:, j] += c[:, i]*binomial(i, j)*(-t0[:, 0])**(i - j)
+
+    residual = y - numpy.matmul(X, c[..., numpy.newaxis])[..., 0]
+    return params, (weight*residual**2).sum(axis=1)
+
+
+def binomial(n, k):
+    """ function to return binomial coefficient n choose k"""
+    value = 1
+    for i in range(k):
+        value = value*(n - i)/(i + 1)
+    return value
+
+
+def getLandauStart(times, samples, startFit, window):
+    """ function to return start parameters (amplitude, mpv, sigma) of landau fits from the rise of each waveform: amplitude and mpv from the sample
+    maximum after startFit, sigma from the time the pulse takes to rise from the last window sample before the maximum to the maximum.
+    waveforms without a rising edge get the peak just after the end of the window and a width of half the window"""
+    nWaveforms = len(samples)
+    rows = numpy.arange(nWaveforms)
+    startFit = numpy.clip(numpy.asarray(startFit, dtype=int), 0, samples.shape[1] - 1)
+    window = numpy.broadcast_to(numpy.asarray(window, dtype=int), (nWaveforms,))
+
+    # sample maximum of the pulse the window starts on
+    afterStart = numpy.where(numpy.arange(samples.shape[1]) >= startFit[:, numpy.newaxis], samples, -numpy.inf)
+    iPeak = afterStart.argmax(axis=1)
+    tPeak, yPeak = times[rows, iPeak].astype(numpy.float64), samples[rows, iPeak].astype(numpy.float64)
+
+    # v of the reference sample from its fraction of the maximum, then sigma from rise time (landauPeak - v)*sigma
+    iRef = numpy.clip(numpy.minimum(startFit + window, iPeak - 1), 0, samples.shape[1] - 1)
+    tRef = times[rows, iRef].astype(numpy.float64)
+    with numpy.errstate(all='ignore'):
+        fraction = numpy.clip(samples[rows, iRef]/yPeak, risingFraction[0], 0.98)
+        sigma = (tPeak - tRef)/(landauPeak - numpy.interp(fraction, risingFraction, risingV))
+    rising = (iPeak > startFit) & (yPeak > 0) & numpy.isfinite(sigma) & (sigma > 0)
+
+    tFirst = times[rows, startFit].astype(numpy.float64)
+    tLast = times[rows, numpy.clip(startFit + window, 0, samples.shape[1] - 1)].astype(numpy.float64)
+    params = numpy.zeros((nWaveforms, 3))
+    params[:, 2] = numpy.where(rising, sigma, numpy.maximum(0.5*(tLast - tFirst), 1e-3))
+    params[:, 1] = numpy.where(rising, tPeak - landauPeak*params[:, 2], tLast)
+    params[:, 0] = numpy.where(rising, yPeak, samples[rows, numpy.clip(startFit + window, 0, samples.shape[1] - 1)])/landau(numpy.where(rising, landauPeak, 0))
+    return params
+
+
+def fitLandauEdges(t, y, weight, start, maxIterations, tolerance, edmTolerance):
+    """ function to fit landau to every row of (t, y) at once with a damped (Levenberg-Marquardt) Gauss-Newton iteration, starting from params start
+    (getLandauStart). the amplitude enters linearly and is solved exactly for every (mpv, sigma), so the iteration only runs over mpv and sigma and
+    does not have to crawl along the amplitude-sigma valley of broad pulses. a row converges when the full Gauss-Newton step would lower chi2 by less
+    than edmTolerance (like MIGRAD), when the accepted step is negligibly small, or when it changes chi2 by less than tolerance (relative).
+    returns (params, chi2, converged)"""
+    nWaveforms = len(y)
+    shape = numpy.array(start, dtype=numpy.float64)[:, 1:3] # (mpv, sigma)
+
+    def chi2For(s, rows=slice(None)):
+        with numpy.errstate(all='ignore'):
+            curve = landau((t[rows] - s[:, 0:1])/s[:, 1:2])
+            amplitude = (weight[rows]*y[rows]*curve).sum(axis=1)/(weight[rows]*curve**2).sum(axis=1)
+            r = y[rows] - amplitude[:, numpy.newaxis]*curve
+            chi2 = (weight[rows]*r**2).sum(axis=1)
+        chi2[ ~numpy.isfinite(chi2) | (s[:, 1] <= 0) ] = numpy.inf
+        return amplitude, r, chi2
+
+    amplitude, residual, chi2 = chi2For(shape)
+    damping = numpy.full(nWaveforms, 1e-3)
+    converged = numpy.zeros(nWaveforms, dtype=bool)
+    active = numpy.isfinite(chi2)
+
+    for iteration in range(maxIterations):
+        rows = numpy.flatnonzero(active)
+        if len(rows) == 0:
+            break
+        s, r, wr = shape[rows], residual[rows], weight[rows]
+
+        # numerical jacobian of the residual (with its best amplitude), one column per parameter. only active rows are computed, so late iterations are cheap
+        J = numpy.zeros(r.shape + (2,))
+        for k in range(2):
+            h = 1e-6*numpy.maximum(numpy.abs(s[:, k]), 1e-3)
+            shifted = s.copy()
+            shifted[:, k] += h
+            with numpy.errstate(all='ignore'):
+                J[..., k] = (r - chi2For(shifted, rows)[1])/h[:, numpy.newaxis]
+        J[ ~numpy.isfinite(J) ] = 0
+
+        JtW = J.transpose(0, 2, 1)*wr[:, numpy.newaxis, :]
+        H = numpy.matmul(JtW, J)
+        g = numpy.matmul(JtW, r[..., numpy.newaxis])[..., 0]
+        diagonal = numpy.maximum(numpy.einsum('nii->ni', H), 1e-12)
+
+        # estimated distance to minimum of the undamped (Gauss-Newton) step, the MIGRAD convergence test of TGraph::Fit: rows already at the minimum are done
+        with numpy.errstate(all='ignore'):
+            newton = numpy.linalg.solve(H + 1e-12*diagonal.max(axis=1)[:, numpy.newaxis, numpy.newaxis]*numpy.eye(2), g[..., numpy.newaxis])[..., 0]
+            edm = 0.5*(g*newton).sum(axis=1)
+        atMinimum = (edm >= 0) & (edm < edmTolerance)
+
+        A = H + (damping[rows, numpy.newaxis]*diagonal)[..., numpy.newaxis]*numpy.eye(2)
+        with numpy.errstate(all='ignore'):
+            step = numpy.linalg.solve(A, g[..., numpy.newaxis])[..., 0]
+        step[ atMinimum | ~numpy.isfinite(step).all(axis=1) ] = 0
+
+        trial = s + step
+        trialAmplitude, trialResidual, trialChi2 = chi2For(trial, rows)
+        better = ~atMinimum & (trialChi2 <= chi2[rows])
+
+        # relative chi2 change and relative size of accepted steps also decide convergence
+        with numpy.errstate(all='ignore'):
+            change = numpy.abs(chi2[rows] - trialChi2)/numpy.maximum(chi2[rows], 1e-12)
+        smallStep = (numpy.abs(step) <= tolerance*numpy.maximum(numpy.abs(s), 1e-3)).all(axis=1)
+        converged[rows] = atMinimum | (better & ((change < tolerance) | smallStep))
+
+        accepted = rows[better]
+        shape[accepted] = trial[better]
+        amplitude[accepted] = trialAmplitude[better]
+        residual[accepted] = trialResidual[better]
+        chi2[accepted] = trialChi2[better]
+        damping[rows] = numpy.where(better, damping[rows]/10, damping[rows]*10) # only active rows, finished rows keep their damping
+
+        # give up on rows where damping blew up, they keep converged = False
+        active[rows] = ~converged[rows] & (damping[rows] < 1e10)
+
+    return numpy.column_stack([amplitude, shape]), chi2, converged
+
+
+def fitLeadingEdges(times, samples, startFit, window, function='landau', maxIterations=200, tolerance=1e-6, edmTolerance=2e-5):
+    """ function to fit the leading edge (window+1 samples after startFit) of a chunk of waveforms at once.
+    times, samples: (waveforms x 1024) arrays with positive pulses, startFit: first sample of each fit, window: number of samples (one value or one per waveform).
+    returns (params, chi2/NDF, converged) with one row per waveform. Waveforms failing the startFit protection are returned with converged = False"""
+    t, y, weight, valid = getFitWindows(times, samples, startFit, window)
+
+    order = polynomialOrder(function)
+    if function == 'landau':
+        nPar = 3
+        params, chi2, converged = fitLandauEdges(t, y, weight, getLandauStart(times, samples, startFit, window), maxIterations, tolerance, edmTolerance)
+    elif order >= 0:
+        nPar = order + 1
+        params, chi2 = fitPolynomialEdges(t, y, weight, order)
+        converged = numpy.isfinite(params).all(axis=1)
+    else:
+        raise ValueError('fit function {0} not supported by edgeFitter, use landau or polN'.format(function))
+
+    ndf = weight.sum(axis=1) - nPar
+    with numpy.errstate(all='ignore'):
+        chi2ndf = numpy.where(ndf > 0, chi2/ndf, numpy.nan)
+
+    converged &= valid & (ndf > 0)
+    params[ ~valid ] = numpy.nan
+    return params, chi2ndf, converged
@@ -0,0 +1,174 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 18, 2018
+#Purpose: Declarative booking of bar histograms and bulk filling of ROOT histograms and profiles from numpy arrays
+
+import numpy
+from ROOT import TH1D, TH2D, TProfile
+
+# histograms booked once per bar: (name, class, binning). {bar} = bar number, {r}/{l} = right/left SiPM channel, {group} = DRS group of the bar MCP (0 for MCP 0, 1 for MCP 9, ...)
+barHistograms = [
+    ('h_b{bar}',                 TH2D,     (40, -5, 35, 35, 0, 35)),
+    ('h_b{bar}_t',               TH2D,     (40, -5, 35, 35, 0, 35)),
+    ('h_mcp{group}_ch{r}',       TH1D,     (25, 0, 500)),
+    ('h_ch{r}_vs_ch{l}',         TH2D,     (22, 0, 1100, 22, 0, 1100)),
+    ('h_ch{r}_ch{l}_x_vs_ratio', TProfile, (40, -5, 35, 0, 2)),
+    ('h_ch{r}_x_vs_amp',         TProfile, (40, -5, 35, 0, 1000)),
+    ('h_ch{l}_x_vs_amp',         TProfile, (40, -5, 35, 0, 1000)),
+    ('h_ch{r}_x_vs_time',        TProfile, (40, -5, 35, 0, 100)),
+    ('h_ch{l}_x_vs_time',        TProfile, (40, -5, 35, 0, 100)),
+]
+
+# histograms shared by all bars
+allChannelHistograms = [
+    ('h_allChannel_timing',           TH1D,     (60, 0, 60)),
+    ('h_allChannel_timingRes',        TH1D,     (300, -1500, 1500)),
+    ('h_allChannel_timingLogic',      TH1D,     (4, 0, 4)),
+    ('h_allChannel_mcpRef_timingRes', TH1D,     (350, -3500, 0)),
+    ('h_allCh_x_vs_timingRes',        TProfile, (40, -5, 35, -1500, 1500)),
+    ('h_allCh_x_vs_mcpRef_timingRes', TProfile, (40, -5, 35, -2500, 0)),
+]
+
+# how histograms are filled: (stage, selection, name, x column, y column or None). columns and selections are built by barClass.fillBarPlots
+fillRules = [
+    # leakage histograms and profiles, events passing signal, slope, and veto cuts
+    ('leakage', 'signal', 'h_b{bar}',                 'x',        'y'),
+    ('leakage', 'signal', 'h_mcp{group}_ch{r}',       'ampMCP',   None),
+    ('leakage', 'signal', 'h_ch{r}_vs_ch{l}',         'ampR',     'ampL'),
+    ('leakage', 'signal', 'h_ch{r}_ch{l}_x_vs_ratio', 'x',        'ratio'),
+    ('leakage', 'signal', 'h_ch{r}_x_vs_amp',         'x',        'ampR'),
+    ('leakage', 'signal', 'h_ch{l}_x_vs_amp',         'x',        'ampL'),
+    ('leakage', 'test',   'h_b{bar}_t',               'x',        'y'),
+    # timing, right and left SiPM times reconstructed
+    ('timing',  'both',   'h_ch{r}_x_vs_time',             'x',         'timeR'),
+    ('timing',  'both',   'h_ch{l}_x_vs_time',             'x',         'timeL'),
+    ('timing',  'both',   'h_allCh_x_vs_timingRes',        'x',         'deltaT'),
+    ('timing',  'both',   'h_allChannel_timingRes',        'deltaT',    None),
+    ('timing',  'both',   'h_allChannel_timing',           'timeL',     None),
+    ('timing',  'both',   'h_allChannel_timing',           'timeR',     None),
+    ('timing',  'mcpRef', 'h_allCh_x_vs_mcpRef_timingRes', 'x',         'deltaT_mcp'),
+    ('timing',  'mcpRef', 'h_allChannel_mcpRef_timingRes', 'deltaT_mcp', None),
+    ('timing',  'mcpRef', 'h_allChannel_timing',           'timeMCP',   None),
+    ('timing',  'all',    'h_allChannel_timingLogic',      'logicBin',  None),
+]
+
+# below this many values, TH1::Fill is cheaper than bulk filling
+minBulkFill = 8
+
+
+def getNameFormat(barNum, channels):
+    """ function to return dictionary filling {bar}, {r}, {l}, {group} of histogram names for bar barNum with (right, left, MCP, DRS time group) channels"""
+    r, l, mcp, drs_time = channels
+    return {'bar' : barNum, 'r' : r, 'l' : l, 'group' : mcp/9}
+
+
+def bookHistograms(barChannels):
+    """ function to book all histograms given dictionary barNum -> (right, left, MCP, DRS time group) channels. returns dictionary name -> histogram"""
+    histograms = {}
+    for barNum in sorted(barChannels):
+        nameFormat = getNameFormat(barNum, barChannels[barNum])
+        for name, histClass, binning in barHistograms:
+            name = name.format(**nameFormat)
+            histograms[name] = histClass(name, name, *binning)
+
+    for name, histClass, binning in allChannelHistograms:
+        histograms[name] = histClass(name, name, *binning)
+
+    return histograms
+
+
+def getBarFillRules(histograms, barNum, channels):
+    """ function to return dictionary stage -> list of (selection, histogram, x column, y column) for bar barNum"""
+    nameFormat = getNameFormat(barNum, channels)
+    rules = {}
+    for stage, selection, name, x, y in fillRules:
+        rules.setdefault(stage, []).append( (selection, histograms[name.format(**nameFormat)], x, y) )
+    return rules
+
+
+def applyFillRules(rules, columns, selections):
+    """ function to fill histograms of rules with columns (name -> array) of rows passing selections (name -> boolean array)"""
+    for selection, h, x, y in rules:
+        mask = selections[selection]
+        fillArrays(h, columns[x][mask], None if y is None else columns[y][mask])
+
+
+def findBins(axis, values):
+    """ function to return bin of each value on fixed-width axis, same as TAxis::FindFixBin (0 underflow, nBins+1 overflow and NaN)"""
+    nBins, low, high = axis.GetNbins(), axis.GetXmin(), axis.GetXmax()
+    with numpy.errstate(invalid='ignore'):
+        inRange = (values >= low) & (values < high)
+        bins = numpy.where(values < low, 0, nBins + 1)
+        bins[inRange] = 1 + (nBins*(values[inRange] - low)/(high - low)).astype(numpy.int64)
+    return bins
+
+
+def fillArrays(h, x, y=None):
+    """ function to fill TH1D (x), TH2D (x, y), or TProfile (x, y) with unit weights from arrays: numpy histogramming, then one update of
+    each touched bin and of the statistics (PutStats), giving the same contents, errors, entries and statistics as one Fill per value"""
+    x = numpy.asarray(x, dtype=numpy.float64)
+    if y is not None:
+        y = numpy.asarray(y, dtype=numpy.float64)
+    if len(x) == 0:
+        return
+    isLabelled = h.GetXaxis().IsAlphanumeric() and h.GetXaxis().CanExtend() # like TH1::Fill(label), no x moments for fully labelled axes
+    if len(x) < minBulkFill and not isLabelled: # labelled axes always take the bulk path, so statistics do not depend on number of values
+        for i in range(len(x)):
+            if y is None:
+                h.Fill(x[i])
+            else:
+                h.Fill(x[i], y[i])
+        return
+
+    isProfile = isinstance(h, TProfile)
+    if isProfile and h.GetYmin() != h.GetYmax(): # TProfile::Fill drops values outside y range
+        keep = (y >= h.GetYmin()) & (y <= h.GetYmax())
+        x, y = x[keep], y[keep]
+    nFills = len(x)
+
+    binX = findBins(h.GetXaxis(), x)
+    inRange = (binX >= 1) & (binX <= h.GetXaxis().GetNbins())
+    bins = binX
+    if isinstance(h, TH2D):
+        binY = findBins(h.GetYaxis(), y)
+        inRange &= (binY >= 1) & (binY <= h.GetYaxis().GetNbins())
+        bins = binX + (h.GetXaxis().GetNbins() + 2)*binY
+
+    # statistics of in-range values, in order of TH1/TH2/TProfile::GetStats
+    stats = numpy.zeros(13)
+    h.GetStats(stats)
+    xs = x[inRange]
+    sums = [len(xs), len(xs), xs.sum(), (xs*xs).sum()]
+    if y is not None:
+        ys = y[inRange]
+        sums += [ys.sum(), (ys*ys).sum()]
+        if not isProfile:
+            sums += [(xs*ys).sum()]
+    if isLabelled:
+        sums[2:4] = [0, 0]
+    stats[:len(sums)] += sums
+
+    # one update per touched bin
+    touched, counts = numpy.unique(bins, return_counts=True)
+    if isProfile:
+        sumY = numpy.bincount(numpy.searchsorted(touched, bins), weights=y)
+        sumY2 = numpy.bincount(numpy.searchsorted(touched, bins), weights=y*y)
+        sumw2 = h.GetSumw2()
+        binSumw2 = h.GetBinSumw2()
+        for bin, count, wy, wy2 in zip(touched, counts, sumY, sumY2):
+            h.AddBinContent(int(bin), wy)
+            sumw2.AddAt(sumw2.At(int(bin)) + wy2, int(bin))
+            h.SetBinEntries(int(bin), h.GetBinEntries(int(bin)) + count)
+            if binSumw2.GetSize() > 0:
+                binSumw2.AddAt(binSumw2.At(int(bin)) + count, int(bin))
+    else:
+        sumw2 = h.GetSumw2()
+        for bin, count in zip(touched, counts):
+            h.AddBinContent(int(bin), count)
+            if h.GetSumw2N() > 0:
+                sumw2.AddAt(sumw2.At(int(bin)) + count, int(bin))
+
+    entries = h.GetEntries()
+    h.PutStats(stats)
+    h.SetEntries(entries + nFills)
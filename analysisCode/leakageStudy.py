@@ -6,6 +6,7 @@
 
 import os,sys, argparse
 from ROOT import gROOT, TH1D, TFile, TTree, TChain, TCanvas, TH2D, gStyle, TLegend
+from treeIO import branchProfiles, setBranchProfile, getBytesRead, printIOReport
 
 def draw2Dbar(c0, h0, barNum, test=""):
     """ function to recieve canvas (c0), histogram (h0), and name for 2D bar plot"""
@@ -86,6 +87,8 @@ def drawXquadrants(c0, h_x1, h_x2, h_x3, h_x4, barNum):
 #f0 = TFile('/home/btannenw/Desktop/MTD/testbeam_FNAL_03-2018/all5exposure/DataCMSVMETiming_5barExposure.root', 'READ') # all 5
 f0 = TFile('/home/btannenw/Desktop/MTD/testbeam_FNAL_03-2018/lowBias/bottombars_66V.root', 'READ') # low bias (66 V) bars 1 and 2
 t0 = f0.pulse
+setBranchProfile(t0, branchProfiles['leakage']) # only read branches used below
+bytesAtStart = getBytesRead()
 
 signalThreshold = 30
 
@@ -233,6 +236,8 @@ for event in t0:
     if (event.amp[12] > signalThreshold and event.amp[10] < signalThreshold and abs(event.xSlope) < 0.0004 and abs(event.ySlope) and abs(event.y_dut[2] -24.5) < 2 and event.x_dut[2]>=-2 and event.x_dut[2]<=33):
         h_b5_t.Fill(event.x_dut[2], event.y_dut[2])
 
+printIOReport(t0, branchProfiles['leakage'], nTotal, getBytesRead() - bytesAtStart)
+
 draw2Dbar(c1, h_b1, 1)
 draw2Dbar(c1, h_b2, 2)
 draw2Dbar(c1, h_b3, 3)
@@ -0,0 +1,121 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 26, 2018
+#Purpose: Join per-channel reco trees (ch<N>_Tree of BTL_Analysis SimpleCheck) of any number of channels on event number into one wide tree
+
+import os, sys, argparse, re
+import numpy
+from ROOT import TFile
+from root_numpy import tree2array, array2root
+from treeIO import buildChain
+
+# columns of each channel tree joined by default, <ch> is replaced by ch<N>
+defaultColumns = ['recoTime_<ch>', 'recoAmp_<ch>']
+
+
+def findChannelTrees(fileName):
+    """ function to return sorted DRS channels of all ch<N>_Tree trees in fileName"""
+    f = TFile(fileName, 'READ')
+    channels = []
+    for key in f.GetListOfKeys():
+        match = re.match(r'^ch(\d+)_Tree$', key.GetName())
+        if match and key.GetClassName() == 'TTree':
+            channels.append( int(match.group(1)) )
+    f.Close()
+    return sorted(set(channels))
+
+
+def readChannel(files, channel, columns):
+    """ function to return (event numbers, structured array of columns) of tree ch<channel>_Tree in files, both sorted by event number.
+    events are entries of the input pulse tree stored as double, so they are converted to integers"""
+    branches = [column.replace('<ch>', 'ch{0}'.format(channel)) for column in columns]
+    data = tree2array(buildChain(files, 'ch{0}_Tree'.format(channel)), branches=['event'] + branches)
+    events = numpy.round(data['event']).astype(numpy.int64)
+    order = numpy.argsort(events, kind='mergesort')
+
+    return events[order], data[branches][order]
+
+
+def intersectSorted(a, b):
+    """ function to return values in both sorted unique arrays a and b, by binary search of a in b without sorting again"""
+    if len(a) == 0 or len(b) == 0:
+        return a[:0]
+    found = numpy.searchsorted(b, a).clip(max=len(b) - 1)
+    return a[ b[found] == a ]
+
+
+def joinEvents(channelEvents):
+    """ function to sort-merge sorted event numbers of all channels. returns (events present in every channel, dictionary channel -> row of each joined event,
+    dictionary channel -> (unmatched events, duplicate events)). the first row of duplicated events is used"""
+    unique = dict( (channel, events[numpy.concatenate(([True], events[1:] != events[:-1]))] if len(events) > 0 else events) for channel, events in channelEvents.items() )
+    common = reduce(intersectSorted, unique.values())
+
+    rows = {}
+    counts = {}
+    for channel, events in channelEvents.items():
+        rows[channel] = numpy.searchsorted(events, common, side='left') # first of duplicates
+        counts[channel] = (len(unique[channel]) - len(common), len(events) - len(unique[channel]))
+
+    return common, rows, counts
+
+
+def getMergedType(channelData, channels):
+    """ function to return dtype of merged tree: event plus all columns of all channels"""
+    dtype = [('event', numpy.int64)]
+    for channel in channels:
+        dtype += [(name, channelData[channel].dtype[name]) for name in channelData[channel].dtype.names]
+    return dtype
+
+
+def writeMergedTree(fileName, treeName, common, rows, channelData, channels, chunkSize=1000000):
+    """ function to write joined events to treeName of fileName in chunks of chunkSize events"""
+    dtype = getMergedType(channelData, channels)
+    for first in range(0, max(len(common), 1), chunkSize):
+        merged = numpy.zeros(len(common[first:first + chunkSize]), dtype=dtype)
+        merged['event'] = common[first:first + chunkSize]
+        for channel in channels:
+            data = channelData[channel][ rows[channel][first:first + chunkSize] ]
+            for name in data.dtype.names:
+                merged[name] = data[name]
+        array2root(merged, fileName, treeName, mode='recreate' if first == 0 else 'update')
+
+
+def printMergeReport(common, channelEvents, counts, channels):
+    """ function to print per-channel table of events, events missing from merged tree, and duplicate events"""
+    print "==== merged {0} events of {1} channels ====".format(len(common), len(channels))
+    print "{0:8s} {1:>12s} {2:>12s} {3:>12s}".format("channel", "events", "unmatched", "duplicates")
+    for channel in channels:
+        print "{0:8s} {1:12d} {2:12d} {3:12d}".format('ch{0}'.format(channel), len(channelEvents[channel]), counts[channel][0], counts[channel][1])
+
+
+if __name__ == '__main__':
+    # *** 0. setup parser for command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="comma-separated list of files with ch<N>_Tree trees (chained in this order)", required=True)
+    parser.add_argument("--channels", help="comma-separated list of DRS channels to join (default: every ch<N>_Tree of first file)", default=None)
+    parser.add_argument("--columns", help="comma-separated list of columns of each channel, <ch> is replaced by ch<N> (default: {0})".format(','.join(defaultColumns)), default=None)
+    parser.add_argument("--output", help="output file", default='mergeTree.root')
+    parser.add_argument("--treeName", help="name of merged tree", default='mergeTree')
+    parser.add_argument("--chunkSize", help="number of merged events written at once", type=int, default=1000000)
+    args = parser.parse_args()
+
+    files = args.input.split(',')
+    channels = findChannelTrees(files[0]) if args.channels is None else [int(c) for c in args.channels.split(',')]
+    columns = defaultColumns if args.columns is None else args.columns.split(',')
+    if( len(channels) < 2 ):
+        print "#### Please give at least two channels to join, found {0} in {1} ####\nEXITING".format(len(channels), files[0])
+        quit()
+
+    # *** 1. columns of every channel as arrays sorted by event number
+    channelEvents = {}
+    channelData = {}
+    for channel in channels:
+        channelEvents[channel], channelData[channel] = readChannel(files, channel, columns)
+        print '-- ch{0}: {1} events'.format(channel, len(channelEvents[channel]))
+
+    # *** 2. sort-merge join and one wide tree
+    common, rows, counts = joinEvents(channelEvents)
+    printMergeReport(common, channelEvents, counts, channels)
+    writeMergedTree(args.output, args.treeName, common, rows, channelData, channels, args.chunkSize)
+    print "-- {0} events written to {1}:{2}".format(len(common), args.output, args.treeName)
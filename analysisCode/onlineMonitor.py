@@ -0,0 +1,140 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 27, 2018
+#Purpose: Online monitoring during data taking: follow run files (or a directory they are written to), add only newly written entries to the barClass histograms, and re-render summary plots at a fixed cadence
+
+import os, sys, argparse, glob, time
+from ROOT import gROOT, TFile
+from barClass import barClass
+from treeIO import buildChain
+from barGeometry import runGeometries
+
+
+def getWatchedFiles(inputs, pattern='*.root'):
+    """ function to return existing files to follow: files of inputs plus files matching pattern in directories of inputs, sorted by name (run number)"""
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            files += sorted( glob.glob(os.path.join(path, pattern)) )
+        elif os.path.isfile(path):
+            files.append(path)
+    return files
+
+
+def getAvailableEntries(fileName, treeName):
+    """ function to return number of entries of treeName readable in fileName, 0 if file or tree is not written yet. files still open in the DAQ
+    are recovered by ROOT up to the last AutoSave of the tree"""
+    f = TFile.Open(fileName, 'READ')
+    if not f or f.IsZombie():
+        return 0
+    tree = f.Get(treeName)
+    nEntries = tree.GetEntries() if tree else 0
+    f.Close()
+    return nEntries
+
+
+class runMonitor:
+    def __init__(self, inputs, treeName, runType, topDir, vetoOpt, chunkSize=1000, fitEngine='batch', signalThreshold=None, pattern='*.root', ratioCalibration=None):
+        self.inputs = inputs
+        self.treeName = treeName
+        self.pattern = pattern
+        self.processed = {} # file -> entries already in histograms, so growing files are only read from there on
+        self.nEvents = 0
+        # histograms live in this instance for the whole shift, filled with the batch engine
+        self.bar = barClass(None, runType, topDir, vetoOpt, engine='batch', chunkSize=chunkSize, fitEngine=fitEngine, signalThreshold=signalThreshold, runAnalysis=False,
+                            ratioCalibration=ratioCalibration)
+
+    # =============================
+
+    def poll(self):
+        """ function to add entries written since the last poll, of all followed files, to the histograms. returns number of new events"""
+        nNew = 0
+        for fileName in getWatchedFiles(self.inputs, self.pattern):
+            first = self.processed.get(fileName, 0)
+            last = getAvailableEntries(fileName, self.treeName)
+            if last <= first:
+                continue
+            nNew += self.bar.processNewEntries(buildChain([fileName], self.treeName), first, last)
+            self.processed[fileName] = last
+            print "-- {0}: entries {1}-{2} added".format(fileName, first, last)
+
+        self.nEvents += nNew
+        return nNew
+
+    # =============================
+
+    def render(self, summaryOnly=True):
+        """ function to save histograms and render summary plots (or all plots), only plots whose histograms changed are drawn again"""
+        self.bar.saveHistograms(self.bar.plotHistFile, {'nEvents' : str(self.nEvents), 'files' : '\n'.join('{0} {1}'.format(f, n) for f, n in sorted(self.processed.items()))})
+        self.bar.renderPlots(plots=self.bar.getSummaryPlots() if summaryOnly else None)
+
+    # =============================
+
+    def run(self, pollInterval=10, renderEvery=30, idleTimeout=0):
+        """ function to poll every pollInterval seconds and render summary plots at most every renderEvery seconds while there are new events.
+        stops after idleTimeout seconds without new entries (0: until Ctrl-C), then renders all plots"""
+        lastRender = 0
+        lastNew = time.time()
+        firstUnrendered = None # time new entries were seen that are not in plots yet
+        try:
+            while True:
+                pollStart = time.time()
+                if self.poll() > 0:
+                    lastNew = pollStart
+                    if firstUnrendered is None:
+                        firstUnrendered = pollStart
+                if firstUnrendered is not None and time.time() - lastRender >= renderEvery:
+                    self.render()
+                    lastRender = time.time()
+                    print "-- {0} events in summary plots, {1:0.1f} s after entries were found (+ up to {2} s poll interval)".format(self.nEvents, lastRender - firstUnrendered, pollInterval)
+                    firstUnrendered = None
+                if idleTimeout > 0 and time.time() - lastNew > idleTimeout:
+                    print "-- no new entries for {0} s, stopping".format(idleTimeout)
+                    break
+                time.sleep( max(0, pollInterval - (time.time() - pollStart)) )
+        except KeyboardInterrupt:
+            print "-- monitoring stopped"
+
+        self.render(False)
+        print "-- {0} events in {1} files, all plots in {2}".format(self.nEvents, len(self.processed), self.bar.topDir)
+
+
+if __name__ == '__main__':
+    # *** 0. setup parser for command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="comma-separated list of run files and/or directories run files are written to", required=True)
+    parser.add_argument("--pattern", help="pattern of run files in directories of --input", default='*.root')
+    parser.add_argument("--treeName", help="name of tree in run files", default='pulse')
+    parser.add_argument("--runType", help="run type: {0}".format("/".join(sorted(runGeometries))), default='all5exposure')
+    parser.add_argument("--vetoOpt", help="veto decision logic option: none/singleAdj/doubleAdj/allAdj/all", default='singleAdj')
+    parser.add_argument("--signalThreshold", help="SiPM signal threshold in mV (default: run type value)", type=float, default=None)
+    parser.add_argument("--topDir", help="output directory, plots go to <topDir>/<runType>", default='online_plots')
+    parser.add_argument("--chunkSize", help="number of events per chunk", type=int, default=1000)
+    parser.add_argument("--fitEngine", help="leading-edge fit: batch (default), root, or ratio", default='batch')
+    parser.add_argument("--ratioCalibration", help="with --fitEngine ratio: calibration file or directory written by calibrateRatios.py", default=None)
+    parser.add_argument("--pollInterval", help="seconds between looks for new entries", type=float, default=10)
+    parser.add_argument("--renderEvery", help="seconds between renders of summary plots", type=float, default=30)
+    parser.add_argument("--idleTimeout", help="stop after this many seconds without new entries, 0 to run until Ctrl-C", type=float, default=0)
+    args = parser.parse_args()
+
+    if( args.runType not in runGeometries ):
+        print "#### Please use {0} when setting --runType <option>. Supplied value ({1}) does not match ####\nEXITING".format('/'.join(sorted(runGeometries)), args.runType)
+        quit()
+    if( not(args.vetoOpt == "none" or args.vetoOpt == "singleAdj" or args.vetoOpt == "doubleAdj" or args.vetoOpt == "allAdj" or args.vetoOpt == "all") ):
+        print "#### Please use none/singleAdj/doubleAdj/allAdj/all when setting --vetoOpt <option>. Supplied value ({0}) does not match ####\nEXITING".format(args.vetoOpt)
+        quit()
+    if( not(args.fitEngine == "root" or args.fitEngine == "batch" or args.fitEngine == "ratio") ):
+        print "#### Please use root/batch/ratio when setting --fitEngine <option>. Supplied value ({0}) does not match ####\nEXITING".format(args.fitEngine)
+        quit()
+    if( args.ratioCalibration is not None and args.fitEngine != "ratio" ):
+        print "#### Please use --fitEngine ratio with --ratioCalibration ####\nEXITING"
+        quit()
+    if( args.pollInterval <= 0 or args.renderEvery < 0 ):
+        print "#### Please use a positive --pollInterval and non-negative --renderEvery ####\nEXITING"
+        quit()
+
+    # *** 1. follow run files until idle or Ctrl-C
+    gROOT.SetBatch(True)
+    monitor = runMonitor(args.input.split(','), args.treeName, args.runType, args.topDir, args.vetoOpt, args.chunkSize, args.fitEngine, args.signalThreshold, args.pattern, args.ratioCalibration)
+    monitor.run(args.pollInterval, args.renderEvery, args.idleTimeout)
@@ -0,0 +1,262 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 24, 2018
+#Purpose: Vectorized numpy port of ChannelDRS/RecoWaveForm (DRS-UVa/RecoWaveForm.h): sample-ratio timing of many DRS waveforms at once
+
+import os, glob, json
+import numpy
+
+# ratio calibration of DRS-UVa/pulse.cc (SiPM attached to LYSO): T(R) and A(R) coefficients, ratio range used in fits, amplitude fraction for timing, resampling step (ns), ratio step (samples)
+defaultCalibration = {'parTvsR' : [-1.20339, 3.94932, -4.77487, 5.69944, -0.630818], 'parAvsR' : [0, 0.0330576, 0.292408, 0.651366, 0.000751415],
+                      'ratioMin' : 0.1, 'ratioMax' : 0.4, 'ampThreshold' : 0.1, 'timeStep' : 0.2, 'ratioStep' : 3}
+
+# layout of calibration files written by writeRatioCalibration, increased when it changes
+calibrationFormatVersion = 1
+
+# per-waveform results of recoWaveforms, same quantities as the RecoWaveForm accessors. tReco = 1e9 and aReco = 0 if no ratio in [ratioMin, ratioMax]
+recoType = [('tStart', numpy.float64), ('imin', numpy.int32), ('ampMin', numpy.float64), ('pedMean', numpy.float64), ('pedRMS', numpy.float64),
+            ('nRatios', numpy.int32), ('nGoodRatios', numpy.int32), ('aReco', numpy.float64), ('tReco', numpy.float64)]
+
+
+class channelDRS:
+    def __init__(self, parTvsR, parAvsR, ratioMin=0.1, ratioMax=0.4, ampThreshold=0.1, timeStep=0.2, ratioStep=3):
+        self.parTvsR = numpy.zeros(10) # coefficients of 9th order polynomials, missing ones are 0 as in ChannelDRS
+        self.parTvsR[:min(len(parTvsR), 10)] = parTvsR[:10]
+        self.parAvsR = numpy.zeros(10)
+        self.parAvsR[:min(len(parAvsR), 10)] = parAvsR[:10]
+        self.ratioMin = ratioMin
+        self.ratioMax = ratioMax
+        self.timeStep = timeStep
+        self.ratioStep = ratioStep
+        self.ampThreshold = ampThreshold # fraction of amplitude that corresponds to pulse timing
+        if ampThreshold < 1e-3 or ampThreshold > 0.8: # protect against meaningless values (ChannelDRS tests thr<1e-3 && thr>0.8, which is never true)
+            self.ampThreshold = 0.1
+        self.ratioT0 = self.getRatioT0()
+
+    # =============================
+
+    def getRatioT0(self):
+        """ function to return ratio R where A(R) = ampThreshold, like TF1::GetX: first sign change on 100 point grid in [1e-3, 0.8], then bisection"""
+        a = lambda r: numpy.polynomial.polynomial.polyval(r, self.parAvsR) - self.ampThreshold
+        grid = numpy.linspace(1e-3, 0.8, 100)
+        values = a(grid)
+        crossing = numpy.flatnonzero( numpy.sign(values[:-1]) != numpy.sign(values[1:]) )
+        if len(crossing) == 0: # no solution in range, closest point
+            return grid[ numpy.abs(values).argmin() ]
+
+        low, high = grid[crossing[0]], grid[crossing[0] + 1]
+        while high - low > 1e-12:
+            middle = (low + high)/2
+            if numpy.sign(a(middle)) == numpy.sign(a(low)):
+                low = middle
+            else:
+                high = middle
+        return (low + high)/2
+
+    # =============================
+
+    def getCalibration(self):
+        """ function to return dictionary of all settings, e.g. as timing cache key"""
+        return {'parTvsR' : list(self.parTvsR), 'parAvsR' : list(self.parAvsR), 'ratioMin' : self.ratioMin, 'ratioMax' : self.ratioMax,
+                'ampThreshold' : self.ampThreshold, 'timeStep' : self.timeStep, 'ratioStep' : self.ratioStep}
+
+
+def getChannelDRS(calibration=defaultCalibration):
+    """ function to return channelDRS from dictionary of settings like defaultCalibration"""
+    return channelDRS(calibration['parTvsR'], calibration['parAvsR'], calibration['ratioMin'], calibration['ratioMax'], calibration['ampThreshold'], calibration['timeStep'], calibration['ratioStep'])
+
+
+def resampleWaveforms(samples, times, timeStep):
+    """ function to linearly interpolate waveforms (n x 1024, like TGraph::Eval) at tStart + i*timeStep, 0 after last sample. returns (resampled n x 1024, tStart)"""
+    samples = numpy.atleast_2d(samples).astype(numpy.float64)
+    times = numpy.atleast_2d(times).astype(numpy.float64)
+    nWaveforms, nSamples = samples.shape
+    tStart = times[:, 0]
+    t = times - tStart[:, numpy.newaxis]
+    x = numpy.arange(nSamples)*timeStep
+
+    # one searchsorted for all waveforms: shift each waveform by its own offset so the flattened times stay sorted
+    offset = (max(t[:, -1].max(), x[-1]) + 1)*numpy.arange(nWaveforms)[:, numpy.newaxis]
+    index = numpy.searchsorted( (t + offset).ravel(), (x + offset).ravel(), side='right' ).reshape(nWaveforms, nSamples) - 1
+    index = numpy.clip(index - numpy.arange(nWaveforms)[:, numpy.newaxis]*nSamples, 0, nSamples - 2)
+
+    rows = numpy.arange(nWaveforms)[:, numpy.newaxis]
+    tLow, tHigh = t[rows, index], t[rows, index + 1]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        fraction = numpy.where(tHigh > tLow, (x - tLow)/(tHigh - tLow), 0)
+    amp = samples[rows, index] + fraction*(samples[rows, index + 1] - samples[rows, index])
+    amp[ x > t[:, -1:] ] = 0
+
+    return amp, tStart
+
+
+def getPedestals(samples, times, tStart, imin, timeStep):
+    """ function to return (mean, RMS) of non-zero original samples between 200 and 150 resampled steps before minimum imin. RMS is 1e9 if there are none"""
+    samples = numpy.atleast_2d(samples).astype(numpy.float64)
+    times = numpy.atleast_2d(times).astype(numpy.float64)
+    tMin = tStart + numpy.maximum(0, imin - 200)*timeStep
+    tMax = tStart + numpy.maximum(0, imin - 150)*timeStep
+    use = (numpy.abs(samples) > 1e-9) & (times > tMin[:, numpy.newaxis]) & (times < tMax[:, numpy.newaxis])
+
+    sum0 = use.sum(axis=1)
+    sum1 = numpy.where(use, samples, 0).sum(axis=1)
+    sum2 = numpy.where(use, samples*samples, 0).sum(axis=1)
+    pedMean = numpy.zeros(len(samples))
+    pedRMS = numpy.full(len(samples), 1e9)
+    has = sum0 > 0
+    pedMean[has] = sum1[has]/sum0[has]
+    pedRMS[has] = numpy.sqrt( numpy.maximum(sum2[has]/sum0[has] - pedMean[has]**2, 0) )
+
+    return pedMean, pedRMS
+
+
+def getRatios(amp, ratioStep):
+    """ function to return amp[i]/amp[i + ratioStep] (n x 1024, 0 for the last ratioStep samples)"""
+    ratio = numpy.zeros(amp.shape)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        ratio[:, :-ratioStep] = amp[:, :-ratioStep] / amp[:, ratioStep:]
+    return ratio
+
+
+def findRatioWindows(amp, imin, pedRMS, ratioStep):
+    """ function to return (first, last) sample of longest window of good ratios of each pedestal-subtracted waveform, like RecoWaveForm: samples before
+    the minimum with both samples below -3 pedRMS, the later one above 0.8 of the minimum, and ratio in (0.05, 0.8). window is empty (first >= last) if none"""
+    nWaveforms, nSamples = amp.shape
+    rows = numpy.arange(nWaveforms)
+    index = numpy.arange(nSamples)
+    ratio = getRatios(amp, ratioStep)
+    later = numpy.zeros(amp.shape)
+    later[:, :-ratioStep] = amp[:, ratioStep:]
+    noise = -3*pedRMS[:, numpy.newaxis]
+
+    with numpy.errstate(invalid='ignore'): # 0/0 ratios are bad
+        good = (index < numpy.minimum(imin, nSamples - ratioStep)[:, numpy.newaxis]) & (later < noise) & (amp < noise) & (later > 0.8*amp[rows, imin][:, numpy.newaxis]) & (ratio > 0.05) & (ratio < 0.8)
+
+    # gap from each bad sample to the next bad one, the largest (last one if tied) starts the window. last samples are always bad
+    nextBad = numpy.minimum.accumulate( numpy.where(good, nSamples, index)[:, ::-1], axis=1 )[:, ::-1]
+    gap = numpy.full(amp.shape, -1, dtype=int)
+    gap[:, :-1] = numpy.where(good[:, :-1], -1, nextBad[:, 1:] - index[:-1])
+    start = nSamples - 1 - gap[:, ::-1].argmax(axis=1)
+    igap = gap[rows, start]
+
+    return start + 1, numpy.minimum(start + igap, nSamples - ratioStep)
+
+
+def getRatioPoints(amp, first, last, tStart, pedRMS, ch):
+    """ function to return (ratio, ratio error, time, sample, in window) arrays (n x 1024) of ratio points in windows [first, last), as RecoWaveForm rv, re, tv, av"""
+    index = numpy.arange(amp.shape[1])
+    inWindow = (index >= first[:, numpy.newaxis]) & (index < last[:, numpy.newaxis])
+    later = numpy.ones(amp.shape)
+    later[:, :-ch.ratioStep] = amp[:, ch.ratioStep:]
+    rms = pedRMS[:, numpy.newaxis]
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        ratio = numpy.where(inWindow, amp/later, 0)
+        err1 = numpy.sqrt( ratio*ratio*((rms/amp)**2 + (rms/later)**2) )
+        err2 = rms*(amp - later)/later**2
+        error = numpy.where(inWindow, numpy.sqrt(err1*err1 + err2*err2), 0)
+    time = tStart[:, numpy.newaxis] + index*ch.timeStep
+
+    return ratio, error, time, amp, inWindow
+
+
+def fitTimeOffsets(ratio, error, time, use, ch):
+    """ function to fit T(R) with only constant term free to ratio points (use = points in fit), like TGraphErrors::Fit with errors (error, 0.025) on (ratio, time).
+    the x errors enter through the effective variance 0.025^2 + (error*T'(R))^2, which does not depend on the constant, so the fit is a weighted mean"""
+    slope = numpy.polynomial.polynomial.polyval(ratio, numpy.polynomial.polynomial.polyder(ch.parTvsR))
+    weight = numpy.where(use, 1/(0.025**2 + (error*slope)**2), 0)
+    shape = numpy.polynomial.polynomial.polyval(ratio, numpy.concatenate([[0], ch.parTvsR[1:]]))
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return (weight*(time - shape)).sum(axis=1) / weight.sum(axis=1)
+
+
+def fitAmplitudeScales(ratio, error, sample, pedRMS, use, ch, maxIterations=50, tolerance=1e-10):
+    """ function to fit scale a of a*A(R) (A without constant term) to ratio points, like TGraphErrors::Fit with errors (error, pedRMS) on (ratio, sample).
+    the effective variance pedRMS^2 + (error*a*A'(R))^2 depends on a, so the minimum of chi2 is found by fixed-point iteration of d(chi2)/da = 0"""
+    shape = numpy.polynomial.polynomial.polyval(ratio, numpy.concatenate([[0], ch.parAvsR[1:]]))
+    slope2 = (error*numpy.polynomial.polynomial.polyval(ratio, numpy.polynomial.polynomial.polyder(ch.parAvsR)))**2
+    rms2 = pedRMS[:, numpy.newaxis]**2
+    shape, sample = numpy.where(use, shape, 0), numpy.where(use, sample, 0)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        scale = (shape*sample).sum(axis=1) / (shape*shape).sum(axis=1) # no x errors
+        for iteration in range(maxIterations):
+            variance = rms2 + scale[:, numpy.newaxis]**2*slope2
+            residual = sample - scale[:, numpy.newaxis]*shape
+            newScale = (shape*sample/variance).sum(axis=1) / ( (shape*shape/variance).sum(axis=1) - (slope2*residual*residual/variance**2).sum(axis=1) )
+            newScale = numpy.where(numpy.isfinite(newScale), newScale, scale)
+            converged = numpy.abs(newScale - scale) <= tolerance*numpy.maximum(numpy.abs(scale), 1)
+            scale = newScale
+            if converged.all():
+                break
+
+    return scale
+
+
+def recoWaveforms(samples, times, ch):
+    """ function to reconstruct time and amplitude of waveforms (n x 1024 DRS samples and times in ns) with the ratio method of RecoWaveForm and calibration ch.
+    returns (structured array of recoType, resampled pedestal-subtracted waveforms, ratio points of getRatioPoints)"""
+    amp, tStart = resampleWaveforms(samples, times, ch.timeStep)
+    rows = numpy.arange(len(amp))
+    imin = amp.argmin(axis=1)
+    pedMean, pedRMS = getPedestals(samples, times, tStart, imin, ch.timeStep)
+    amp -= pedMean[:, numpy.newaxis]
+
+    first, last = findRatioWindows(amp, imin, pedRMS, ch.ratioStep)
+    points = getRatioPoints(amp, first, last, tStart, pedRMS, ch)
+    ratio, error, time, sample, inWindow = points
+    nGood = (inWindow & (ratio > ch.ratioMin) & (ratio < ch.ratioMax)).sum(axis=1)
+    inRange = inWindow & (ratio >= ch.ratioMin) & (ratio <= ch.ratioMax) # fit range of TGraph::Fit includes limits
+
+    reco = numpy.zeros(len(amp), dtype=recoType)
+    reco['tStart'], reco['imin'], reco['ampMin'], reco['pedMean'], reco['pedRMS'] = tStart, imin, amp[rows, imin], pedMean, pedRMS
+    reco['nRatios'], reco['nGoodRatios'] = inWindow.sum(axis=1), nGood
+    reco['tReco'] = 1e9
+    fitted = numpy.flatnonzero(nGood > 0)
+    if len(fitted) > 0:
+        reco['aReco'][fitted] = fitAmplitudeScales(ratio[fitted], error[fitted], sample[fitted], pedRMS[fitted], inRange[fitted], ch)
+        offsets = fitTimeOffsets(ratio[fitted], error[fitted], time[fitted], inRange[fitted], ch)
+        reco['tReco'][fitted] = offsets + numpy.polynomial.polynomial.polyval(ch.ratioT0, numpy.concatenate([[0], ch.parTvsR[1:]]))
+
+    return reco, amp, points
+
+
+def getCalibrationFiles(calibDir):
+    """ function to return list of (version, file name) of versioned ratio calibration files in calibDir, oldest first"""
+    files = []
+    for fileName in glob.glob('{0}/ratioCalibration_v*.json'.format(calibDir)):
+        version = os.path.basename(fileName)[len('ratioCalibration_v'):-len('.json')]
+        if version.isdigit():
+            files.append( (int(version), fileName) )
+    return sorted(files)
+
+
+def writeRatioCalibration(calibDir, calibrations, info={}):
+    """ function to write dictionary DRS channel -> calibration (settings like defaultCalibration) plus info (input files, ...) as next version in calibDir. returns file name"""
+    if not os.path.isdir(calibDir):
+        os.system( 'mkdir -p {0}'.format(calibDir) )
+    files = getCalibrationFiles(calibDir)
+    version = files[-1][0] + 1 if len(files) > 0 else 1
+
+    content = dict(info)
+    content.update( {'formatVersion' : calibrationFormatVersion, 'version' : version, 'channels' : dict( (str(channel), calibration) for channel, calibration in calibrations.items() )} )
+    fileName = '{0}/ratioCalibration_v{1}.json'.format(calibDir, version)
+    json.dump(content, open(fileName, 'w'), indent=1, sort_keys=True)
+    return fileName
+
+
+def readRatioCalibration(path):
+    """ function to return (dictionary DRS channel -> channelDRS, file name) from a calibration file, or from the latest version in directory path"""
+    fileName = path
+    if os.path.isdir(path):
+        files = getCalibrationFiles(path)
+        if len(files) == 0:
+            raise IOError('no ratio calibration in {0}, make one with calibrateRatios.py'.format(path))
+        fileName = files[-1][1]
+
+    content = json.load( open(fileName) )
+    if content.get('formatVersion') != calibrationFormatVersion:
+        raise IOError('ratio calibration {0} has format version {1}, not {2}'.format(fileName, content.get('formatVersion'), calibrationFormatVersion))
+    return dict( (int(channel), getChannelDRS(calibration)) for channel, calibration in content['channels'].items() ), fileName
@@ -0,0 +1,96 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 20, 2018
+#Purpose: Render stage: draw plots from histograms saved by barClass, skipping plots whose histograms and drawing code are unchanged
+
+import os, sys, argparse, hashlib, json
+import multiprocessing
+from ROOT import TFile, TProfile
+
+# name of file in each plot directory recording what every plot was last rendered from
+renderStateFile = 'renderState.json'
+
+
+def getPlotId(plot):
+    """ function to return readable id of plot (draw method, [histogram names], (arguments)), e.g. draw2Dbar(h_b1, 1)"""
+    method, histNames, args = plot
+    return '{0}({1})'.format(method, ', '.join(histNames + [repr(arg) for arg in args]))
+
+
+def getHistogramHash(h):
+    """ function to return hash of class, binning, contents, errors, and entries of histogram h (plus bin entries for profiles)"""
+    content = [h.ClassName(), h.GetNcells(), h.GetEntries()]
+    for iCell in range(h.GetNcells()):
+        content += [h.GetBinContent(iCell), h.GetBinError(iCell)]
+        if isinstance(h, TProfile):
+            content.append( h.GetBinEntries(iCell) )
+    for axis in [h.GetXaxis(), h.GetYaxis()]:
+        content += [axis.GetXmin(), axis.GetXmax()]
+    return hashlib.sha1( repr(content) ).hexdigest()
+
+
+def getPlotHashes(histFile, plots, getPlotStyle):
+    """ function to return dictionary plot id -> hash of source histograms in histFile and of drawing style (string from getPlotStyle(plot))"""
+    f = TFile(histFile, 'READ')
+    histHashes = {}
+    plotHashes = {}
+    for plot in plots:
+        method, histNames, args = plot
+        for name in histNames:
+            if name not in histHashes:
+                histHashes[name] = getHistogramHash( f.Get(name) )
+        plotHashes[getPlotId(plot)] = hashlib.sha1( '\n'.join([histHashes[name] for name in histNames] + [getPlotStyle(plot)]) ).hexdigest()
+    f.Close()
+
+    return plotHashes
+
+
+def readRenderState(plotDir):
+    """ function to return dictionary plot id -> {'hash', 'file'} of last render in plotDir, empty if never rendered"""
+    fileName = '{0}/{1}'.format(plotDir, renderStateFile)
+    if not os.path.isfile(fileName):
+        return {}
+    return json.load( open(fileName) )
+
+
+def writeRenderState(plotDir, state):
+    """ function to write render state of plotDir, replaced atomically"""
+    fileName = '{0}/{1}'.format(plotDir, renderStateFile)
+    tmpName = '{0}.tmp'.format(fileName)
+    json.dump(state, open(tmpName, 'w'), indent=1, sort_keys=True)
+    os.rename(tmpName, fileName)
+
+
+def isUnchanged(state, plotId, plotHash):
+    """ function to return True if plot was last rendered from the same histograms and style and its file still exists"""
+    return plotId in state and state[plotId]['hash'] == plotHash and os.path.isfile(state[plotId]['file'])
+
+
+def getRenderGroups(plots, nProcesses):
+    """ function to split plots round-robin into at most nProcesses non-empty groups"""
+    groups = [plots[iGroup::nProcesses] for iGroup in range(nProcesses)]
+    return [group for group in groups if len(group) > 0]
+
+
+if __name__ == '__main__':
+    # *** 0. setup parser for command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topDir", help="output directory of barStudies.py/runDriver.py, holding <runType>/histograms.root", required=True)
+    parser.add_argument("--runType", help="run type(s) to render, comma separated (default: every runType directory of topDir)", default=None)
+    parser.add_argument("--nProcesses", help="number of plots rendered at the same time (default: number of CPUs)", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--force", help="render all plots, even if unchanged since last render", action='store_true')
+    args = parser.parse_args()
+
+    from barClass import barClass # not at top, barClass imports this module
+
+    runTypes = args.runType.split(',') if args.runType is not None else sorted(d for d in os.listdir(args.topDir) if os.path.isfile('{0}/{1}/histograms.root'.format(args.topDir, d)))
+    if len(runTypes) == 0:
+        print "#### No <runType>/histograms.root found in {0} ####\nEXITING".format(args.topDir)
+        quit()
+
+    # *** 1. render each runType from its saved histograms, no event loop
+    for runType in runTypes:
+        print '-- rendering {0}/{1}'.format(args.topDir, runType)
+        bar = barClass(None, runType, args.topDir, None, runAnalysis=False)
+        bar.renderPlots(args.nProcesses, args.force)
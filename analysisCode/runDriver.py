@@ -0,0 +1,154 @@
+# /usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 14, 2018
+#Purpose: Script to run barClass over all run types and files listed in a manifest, one run type per process or each run type split into --nWorkers shards
+
+from barClass import barClass
+from treeIO import buildChain
+import os, sys, argparse, glob, time
+import multiprocessing
+
+
+def readManifest(manifest):
+    """ function to return list of (runType, [files]) from manifest with one '<file or glob> <runType>' per line. lines of same runType are chained"""
+    runs = []
+    runFiles = {}
+    for line in open(manifest):
+        line = line.split('#')[0].strip()
+        if line == '':
+            continue
+        pattern, runType = line.split()
+        files = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if len(files) == 0:
+            print "#### No files match {0} for runType {1} ####".format(pattern, runType)
+            continue
+        if runType not in runFiles:
+            runFiles[runType] = []
+            runs.append( (runType, runFiles[runType]) )
+        runFiles[runType] += files
+
+    return runs
+
+
+def processRun(run):
+    """ function run in worker processes (or in the driver with nWorkers > 1): run barClass over all files of one runType. returns (runType, events processed, bytes read, seconds)"""
+    runType, files, treeName, topDir, vetoOpt, test, engine, chunkSize, fitEngine, nWorkers, cacheDir, checkpointEvery, resume, timeStages, skimFile, storeDir, ratioCalibration = run
+    start = time.time()
+    bar = barClass(buildChain(files, treeName), runType, topDir, vetoOpt, test=test, engine=engine, chunkSize=chunkSize, fitEngine=fitEngine, nWorkers=nWorkers, cacheDir=cacheDir,
+                   checkpointEvery=checkpointEvery, resume=resume, timeStages=timeStages, skimFile=skimFile, storeDir=storeDir, ratioCalibration=ratioCalibration)
+
+    return runType, bar.nEvents, bar.bytesRead, time.time() - start
+
+
+def printThroughputSummary(results, wallTime):
+    """ function to print events, I/O, and event rate per runType and for all runs combined"""
+    print "==== Throughput summary ===="
+    print "{0:20s} {1:>10s} {2:>10s} {3:>10s} {4:>12s}".format("runType", "events", "MB read", "time [s]", "events/s")
+    for runType, nEvents, bytesRead, seconds in results:
+        print "{0:20s} {1:10d} {2:10.1f} {3:10.1f} {4:12.1f}".format(runType, nEvents, bytesRead/1e6, seconds, nEvents/max(seconds, 1e-9))
+
+    nEvents = sum(result[1] for result in results)
+    bytesRead = sum(result[2] for result in results)
+    print "{0:20s} {1:10d} {2:10.1f} {3:10.1f} {4:12.1f}".format("all (wall time)", nEvents, bytesRead/1e6, wallTime, nEvents/max(wallTime, 1e-9))
+
+
+if __name__ == '__main__':
+    # *** 0. setup parser for command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--manifest", help="file with one '<root file or glob> <runType>' entry per line", default='runList_March2018.txt')
+    parser.add_argument("--test", help="flag for running over only 10k events per runType",  nargs='?', default=False)
+    parser.add_argument("--vetoOpt", help="veto decision logic option: none/singleAdj/doubleAdj/allAdj/all", default='singleAdj')
+    parser.add_argument("--engine", help="event loop engine: event (PyROOT loop, default), batch (numpy arrays in chunks), twoPass (batch, reading waveforms only for events passing cuts), or skim (manifest lists skims written with --skimDir)", default='event')
+    parser.add_argument("--chunkSize", help="number of events per chunk for --engine batch/twoPass", type=int, default=1000)
+    parser.add_argument("--fitEngine", help="leading-edge fit for --engine batch/twoPass: root (TGraph + TF1 per waveform, default), batch (all waveforms of a chunk at once), or ratio (sample-ratio method of DRS-UVa RecoWaveForm, all waveforms of a chunk at once)", default='root')
+    parser.add_argument("--cacheDir", help="directory of timing cache: reconstructed times are reused when input files and fit parameters are unchanged (default: no cache)", default=None)
+    parser.add_argument("--checkpointEvery", help="save histograms and last processed entry to <topDir>/<runType>/checkpoint.root every N events and at the end, not with --engine twoPass (default: 0, no checkpoints)", type=int, default=0)
+    parser.add_argument("--resume", help="continue each runType from its checkpoint, after a crash or to process only entries of run files added to the manifest since", action='store_true')
+    parser.add_argument("--skimDir", help="with --engine batch: also write skim of each runType to skimDir/<runType>_skim.root, for reanalysis with --engine skim", default=None)
+    parser.add_argument("--storeDir", help="with --engine batch/twoPass: read waveforms of each runType from waveform store storeDir/<runType> (written with waveformStore.py) if it exists", default=None)
+    parser.add_argument("--ratioCalibration", help="with --fitEngine ratio: calibration file, or directory of versioned files (latest is used), written by calibrateRatios.py (default: DRS-UVa/pulse.cc constants)", default=None)
+    parser.add_argument("--timeStages", help="time tree reading, threshold search, fits, threshold scan, histogram filling, ... of each runType and write <topDir>/<runType>/stageTimers.json", action='store_true')
+    parser.add_argument("--nProcesses", help="number of run types processed at the same time, without --nWorkers (default: number of CPUs)", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--nWorkers", help="split each runType into this many shards filled in parallel worker processes, run types are then processed one after another (default 1: one process per runType)", type=int, default=1)
+    parser.add_argument("--treeName", help="name of tree in input files (default: pulse, skim for --engine skim)", default=None)
+    parser.add_argument("--topDir", help="output directory, plots of each runType go to topDir/runType (default: 04-23-18_plots_<vetoOpt>)", default=None)
+    args = parser.parse_args()
+
+    if( not(args.vetoOpt == "none" or args.vetoOpt == "singleAdj" or args.vetoOpt == "doubleAdj" or args.vetoOpt == "allAdj" or args.vetoOpt == "all") ):
+        print "#### Please use none/singleAdj/doubleAdj/allAdj/all when setting --vetoOpt <option>. Supplied value ({0}) does not match ####\nEXITING".format(args.vetoOpt)
+        quit()
+    if( not(args.engine == "event" or args.engine == "batch" or args.engine == "twoPass" or args.engine == "skim") ):
+        print "#### Please use event/batch/twoPass/skim when setting --engine <option>. Supplied value ({0}) does not match ####\nEXITING".format(args.engine)
+        quit()
+    if( args.skimDir is not None and args.engine != "batch" ):
+        print "#### Please use --engine batch when writing skims with --skimDir ####\nEXITING"
+        quit()
+    if( args.storeDir is not None and not(args.engine == "batch" or args.engine == "twoPass") ):
+        print "#### Please use --engine batch/twoPass when reading waveforms with --storeDir ####\nEXITING"
+        quit()
+    if( args.checkpointEvery > 0 and args.engine == "twoPass" ):
+        print "#### Please use --engine event/batch/skim with --checkpointEvery, twoPass only reads waveforms after its first pass over all entries ####\nEXITING"
+        quit()
+    if( not(args.fitEngine == "root" or args.fitEngine == "batch" or args.fitEngine == "ratio") ):
+        print "#### Please use root/batch/ratio when setting --fitEngine <option>. Supplied value ({0}) does not match ####\nEXITING".format(args.fitEngine)
+        quit()
+    if( args.ratioCalibration is not None and args.fitEngine != "ratio" ):
+        print "#### Please use --fitEngine ratio with --ratioCalibration ####\nEXITING"
+        quit()
+    if( args.fitEngine == "ratio" and args.engine == "event" ):
+        print "#### Please use --engine batch/twoPass with --fitEngine ratio ####\nEXITING"
+        quit()
+    if( args.nWorkers < 1 ):
+        print "#### Please use a positive number when setting --nWorkers <n>. Supplied value ({0}) does not match ####\nEXITING".format(args.nWorkers)
+        quit()
+    if( args.nWorkers > 1 and (args.skimDir is not None or args.checkpointEvery > 0 or args.resume) ):
+        print "#### --nWorkers is not supported with --skimDir, --checkpointEvery, or --resume, which need one process per runType ####\nEXITING"
+        quit()
+
+    if(args.test is None):
+        args.test = True
+        print "#### TEST MODE - running over 10k events per runType only ####"
+    else:
+        args.test = False
+
+    if args.treeName is None:
+        args.treeName = 'skim' if args.engine == 'skim' else 'pulse'
+    if args.skimDir is not None and not os.path.isdir(args.skimDir):
+        os.system( 'mkdir -p {0}'.format(args.skimDir) )
+
+    topDir = args.topDir
+    if topDir is None:
+        topDir = '04-23-18_plots_{0}'.format(args.vetoOpt)
+    if not os.path.isdir(topDir): # make once here so run processes don't race creating it
+        os.system( 'mkdir {0}'.format(topDir) )
+
+    # *** 1. one task per runType, each writes to topDir/runType. with --nWorkers, tasks run one after another in this process and barClass
+    # shards each runType over nWorkers processes (worker processes of a pool cannot start their own pools)
+    runs = readManifest(args.manifest)
+    if len(runs) == 0:
+        print "#### No runs found in manifest {0} ####\nEXITING".format(args.manifest)
+        quit()
+    stores = {}
+    for runType, files in runs:
+        print '-- {0}: {1} file(s)'.format(runType, len(files))
+        stores[runType] = None
+        if args.storeDir is not None:
+            if os.path.isfile('{0}/{1}/store.json'.format(args.storeDir, runType)):
+                stores[runType] = '{0}/{1}'.format(args.storeDir, runType)
+            else:
+                print '#### no waveform store {0}/{1}, reading {1} waveforms from tree ####'.format(args.storeDir, runType)
+
+    tasks = [ (runType, files, args.treeName, topDir, args.vetoOpt, args.test, args.engine, args.chunkSize, args.fitEngine, args.nWorkers, args.cacheDir, args.checkpointEvery, args.resume, args.timeStages, None if args.skimDir is None else '{0}/{1}_skim.root'.format(args.skimDir, runType), stores[runType], args.ratioCalibration) for runType, files in runs ]
+
+    start = time.time()
+    if args.nWorkers > 1:
+        results = [processRun(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool( max(1, min(args.nProcesses, len(tasks))) )
+        results = pool.map(processRun, tasks, chunksize=1)
+        pool.close()
+        pool.join()
+
+    # *** 2. combined summary
+    printThroughputSummary(results, time.time() - start)
@@ -0,0 +1,133 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 28, 2018
+#Purpose: HTTP server on localhost serving JSON snapshots of booked histograms and stage counters while barClass is still looping over events
+
+import time, json, threading
+import BaseHTTPServer, SocketServer
+
+# snapshot key of run counters (events processed, entry range, stage timers), never a histogram name
+countersKey = ':counters'
+
+
+def getHistogramSnapshot(h):
+    """ function to return dictionary of binning, contents, and errors of TH1D, TH2D, or TProfile h (plus entries per bin for profiles), without under/overflow"""
+    xAxis, yAxis = h.GetXaxis(), h.GetYaxis()
+    snapshot = {'class' : h.ClassName(), 'title' : h.GetTitle(), 'entries' : h.GetEntries(), 'mean' : h.GetMean(), 'rms' : h.GetRMS(),
+                'xEdges' : [xAxis.GetBinLowEdge(i) for i in range(1, h.GetNbinsX() + 2)]}
+    if h.GetDimension() == 2: # contents[iy][ix]
+        snapshot['yEdges'] = [yAxis.GetBinLowEdge(i) for i in range(1, h.GetNbinsY() + 2)]
+        snapshot['contents'] = [[h.GetBinContent(ix, iy) for ix in range(1, h.GetNbinsX() + 1)] for iy in range(1, h.GetNbinsY() + 1)]
+        snapshot['errors'] = [[h.GetBinError(ix, iy) for ix in range(1, h.GetNbinsX() + 1)] for iy in range(1, h.GetNbinsY() + 1)]
+    else:
+        snapshot['contents'] = [h.GetBinContent(i) for i in range(1, h.GetNbinsX() + 1)]
+        snapshot['errors'] = [h.GetBinError(i) for i in range(1, h.GetNbinsX() + 1)]
+        snapshot['underflow'], snapshot['overflow'] = h.GetBinContent(0), h.GetBinContent(h.GetNbinsX() + 1)
+    if h.InheritsFrom('TProfile'):
+        snapshot['binEntries'] = [h.GetBinEntries(i) for i in range(1, h.GetNbinsX() + 1)]
+    return snapshot
+
+
+class threadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ HTTP server answering each request in its own thread, so a request waiting for the event loop does not stall other clients"""
+    daemon_threads = True
+
+
+class snapshotServer:
+    def __init__(self, port, histNames, timeout=30.):
+        self.histNames = sorted(histNames)
+        self.timeout = timeout # seconds a request waits for the event loop to copy a snapshot, then the last copy is served as stale
+        self.condition = threading.Condition()
+        self.pending = set() # keys requested since the last publish, only these are copied by the event loop
+        self.snapshots = {} # key -> (time copied, snapshot)
+        self.running = True
+
+        # histograms are only touched by the event loop thread, the server thread only reads copies made in publish
+        server = self
+        class snapshotHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.handleRequest(self)
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = threadingHTTPServer(('127.0.0.1', port), snapshotHandler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        print "-- serving histogram snapshots on http://127.0.0.1:{0}/ (histogram/<name>, counters)".format(self.port)
+
+    # =============================
+
+    def publish(self, histograms, getCounters):
+        """ function called by the event loop between events/chunks: copy requested histograms and counters (getCounters()) for the server thread.
+        returns at once if nothing was requested, so it can stay in the hot path"""
+        if not self.pending:
+            return
+
+        with self.condition:
+            keys = list(self.pending)
+            self.pending.clear()
+        # copies made outside the lock, requests arriving meanwhile are served at the next publish
+        copies = dict( (key, getCounters() if key == countersKey else getHistogramSnapshot(histograms[key])) for key in keys )
+        with self.condition:
+            now = time.time()
+            for key, snapshot in copies.items():
+                self.snapshots[key] = (now, snapshot)
+            self.condition.notify_all()
+
+    # =============================
+
+    def request(self, key):
+        """ function called by the server thread: wait for the event loop to copy key. returns (snapshot, stale), snapshot None if never copied"""
+        requestTime = time.time()
+        with self.condition:
+            self.pending.add(key)
+            while self.running and self.snapshots.get(key, (0, None))[0] < requestTime and time.time() - requestTime < self.timeout:
+                self.condition.wait( max(0.01, self.timeout - (time.time() - requestTime)) )
+            copied, snapshot = self.snapshots.get(key, (0, None))
+            return snapshot, copied < requestTime
+
+    # =============================
+
+    def handleRequest(self, handler):
+        """ function to answer GET /, /histogram/<name>, and /counters with JSON"""
+        path = handler.path.split('?')[0].strip('/')
+        if path == '':
+            self.sendJSON(handler, 200, {'histograms' : self.histNames, 'running' : self.running})
+            return
+        if path == 'counters':
+            key = countersKey
+        elif path.startswith('histogram/') and path[len('histogram/'):] in self.histNames:
+            key = path[len('histogram/'):]
+        else:
+            self.sendJSON(handler, 404, {'error' : 'unknown path /{0}, use /histogram/<name> with a name listed at / or /counters'.format(path)})
+            return
+
+        snapshot, stale = self.request(key)
+        if snapshot is None:
+            self.sendJSON(handler, 503, {'error' : 'event loop did not copy {0} within {1} s'.format(key, self.timeout) if self.running else 'run finished'})
+            return
+        self.sendJSON(handler, 200, {'name' : key, 'stale' : stale, 'snapshot' : snapshot})
+
+    # =============================
+
+    def sendJSON(self, handler, status, content):
+        """ function to send content as JSON response with HTTP status"""
+        body = json.dumps(content)
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    # =============================
+
+    def close(self):
+        """ function to stop serving, answering waiting requests"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,111 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 21, 2018
+#Purpose: Wall time and call counts of hot-path stages (tree reading, threshold search, fits, ...), with summary table and JSON report
+
+import time, json
+
+
+class stageTimers:
+    def __init__(self, enabled=False):
+        self.enabled = enabled # if False, start() returns None and stop() returns at once, so timers can stay in the hot path
+        self.stages = [] # stage names in order of first use
+        self.seconds = {}
+        self.calls = {}
+        self.items = {}
+
+    # =============================
+
+    def start(self):
+        """ function to return start time for stop(), None if timers are off"""
+        if self.enabled:
+            return time.time()
+        return None
+
+    # =============================
+
+    def stop(self, stage, start, nItems=1):
+        """ function to add time since start to stage, counting one call handling nItems items (events, waveforms, ...)"""
+        if start is None:
+            return
+        self.add(stage, time.time() - start, 1, nItems)
+
+    # =============================
+
+    def add(self, stage, seconds, calls, items):
+        """ function to add seconds, calls, and items to stage"""
+        if stage not in self.seconds:
+            self.stages.append(stage)
+            self.seconds[stage] = 0.
+            self.calls[stage] = 0
+            self.items[stage] = 0
+        self.seconds[stage] += seconds
+        self.calls[stage] += calls
+        self.items[stage] += items
+
+    # =============================
+
+    def timeIterator(self, stage, iterable):
+        """ function to return iterable whose next() calls (e.g. reading the next chunk) are timed as stage, counting len(item) items. iterable itself if timers are off"""
+        if not self.enabled:
+            return iterable
+        return self.timedIterator(stage, iterable)
+
+    # =============================
+
+    def timedIterator(self, stage, iterable):
+        """ generator for timeIterator"""
+        iterator = iter(iterable)
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.stop(stage, start, len(item))
+            yield item
+
+    # =============================
+
+    def getStats(self):
+        """ function to return list of (stage, seconds, calls, items), e.g. to send timers of worker processes back to the main process"""
+        return [(stage, self.seconds[stage], self.calls[stage], self.items[stage]) for stage in self.stages]
+
+    # =============================
+
+    def addStats(self, stats):
+        """ function to add list of (stage, seconds, calls, items) from getStats of another instance"""
+        for stage, seconds, calls, items in stats:
+            self.add(stage, seconds, calls, items)
+
+    # =============================
+
+    def getReport(self, nEvents, wallSeconds, info={}):
+        """ function to return dictionary with events/s, fits/s, and per-stage seconds, calls, and items, plus info (runType, engine, ...)"""
+        report = dict(info)
+        report['nEvents'] = nEvents
+        report['wallSeconds'] = wallSeconds
+        report['eventsPerSecond'] = nEvents / max(wallSeconds, 1e-9)
+        report['fitsPerSecond'] = self.items.get('fit', 0) / max(wallSeconds, 1e-9)
+        report['stages'] = [{'stage' : stage, 'seconds' : seconds, 'calls' : calls, 'items' : items} for stage, seconds, calls, items in self.getStats()]
+        return report
+
+    # =============================
+
+    def printReport(self, nEvents, wallSeconds):
+        """ function to print summary table of all stages. stages of parallel workers are summed, so their fraction of wall time can exceed 100%"""
+        print "==== Stage timers ({0} events, {1:0.1f} s) ====".format(nEvents, wallSeconds)
+        print "{0:16s} {1:>10s} {2:>10s} {3:>10s} {4:>8s} {5:>12s} {6:>12s}".format("stage", "time [s]", "calls", "items", "% wall", "us/call", "items/s")
+        for stage, seconds, calls, items in self.getStats():
+            print "{0:16s} {1:10.2f} {2:10d} {3:10d} {4:8.1f} {5:12.1f} {6:12.1f}".format(stage, seconds, calls, items, 100*seconds/max(wallSeconds, 1e-9), 1e6*seconds/max(calls, 1), items/max(seconds, 1e-9))
+        other = wallSeconds - sum(self.seconds.values())
+        if other > 0:
+            print "{0:16s} {1:10.2f} {2:>10s} {3:>10s} {4:8.1f}".format("other", other, "", "", 100*other/max(wallSeconds, 1e-9))
+        print "events/s: {0:0.1f}, fits/s: {1:0.1f}".format(nEvents / max(wallSeconds, 1e-9), self.items.get('fit', 0) / max(wallSeconds, 1e-9))
+
+    # =============================
+
+    def writeReport(self, fileName, nEvents, wallSeconds, info={}):
+        """ function to write getReport as JSON to fileName"""
+        json.dump(self.getReport(nEvents, wallSeconds, info), open(fileName, 'w'), indent=1, sort_keys=True)
@@ -0,0 +1,176 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 22, 2018
+#Purpose: Generator of synthetic DRS pulse trees with the layout of the FNAL testbeam files, for benchmarks and tests without the real data
+
+import os, sys, argparse
+import numpy
+from root_numpy import array2root
+from edgeFitter import landau
+from barGeometry import barGeometry, runGeometries
+
+# same branches, shapes, and types as the 'pulse' tree of the testbeam files
+eventType = [('i_evt', numpy.uint32), ('channel', numpy.int16, (36, 1024)), ('time', numpy.float32, (4, 1024)),
+             ('amp', numpy.float32, (36,)), ('t_peak', numpy.float32, (36,)),
+             ('x_dut', numpy.float32, (3,)), ('y_dut', numpy.float32, (3,)), ('xSlope', numpy.float32), ('ySlope', numpy.float32)]
+
+# generator settings, all can be changed from the command line
+defaultOptions = {
+    'sipmShape'     : 'landau', # pulse shape of SiPMs: landau or expo (exponential rise and decay)
+    'sipmRise'      : 1.0,      # ns, landau sigma or exponential rise time
+    'sipmFall'      : 10.0,     # ns, exponential decay time (expo only)
+    'sipmWidth'     : 0.15,     # width of SiPM amplitude distribution relative to sipmMPV
+    'mcpShape'      : 'landau', # pulse shape of MCPs 0 and 9
+    'mcpRise'       : 0.25,     # ns
+    'mcpFall'       : 1.0,      # ns
+    'mcpAmp'        : 120,      # mV, mean MCP amplitude
+    'mcpDelay'      : 2.0,      # ns, MCP peak after SiPM arrival
+    'noise'         : 2.0,      # mV, gaussian noise of every sample
+    'crossTalk'     : 0.03,     # fraction of hit bar amplitude seen by SiPMs of neighbouring bars
+    'attenuation'   : 100.,     # mm, light attenuation length along bar
+    'lightSpeed'    : 70.,      # mm/ns, signal speed along bar
+    'jitter'        : 0.03,     # ns, time resolution of each SiPM and MCP
+    'triggerTime'   : 60.,      # ns, arrival of particle in DRS window
+    'triggerJitter' : 2.0,      # ns, event-by-event spread of triggerTime
+    'sampleTime'    : 0.2,      # ns, DRS sampling (5 GS/s)
+    'slopeSigma'    : 0.0003,   # spread of track slopes, the analysis keeps |slope| < 0.0004
+    'xBeam'         : (-5, 35), # mm, uniform beam spot in x
+    'yBeam'         : (0, 35),  # mm, uniform beam spot in y
+    'bars'          : None,     # bars in beam, None for all bars of the run type geometry
+}
+
+
+def pulseShape(shape, dt, rise, fall):
+    """ function to return pulse of unit height for times dt (ns) after arrival. landau: TF1 landau with sigma rise, expo: (1 - exp(-dt/rise))*exp(-dt/fall)"""
+    dt = numpy.asarray(dt, dtype=numpy.float64)
+    if shape == 'landau':
+        mpvOffset = 3*rise # most probable value, landau is ~0 at arrival
+        return landau( (dt - mpvOffset)/rise ) / landau( numpy.array([-0.22278]) )[0]
+    elif shape == 'expo':
+        tPeak = rise*numpy.log(1 + fall/rise)
+        peak = (1 - numpy.exp(-tPeak/rise))*numpy.exp(-tPeak/fall)
+        with numpy.errstate(over='ignore'):
+            return numpy.where(dt > 0, (1 - numpy.exp(-dt/rise))*numpy.exp(-dt/fall), 0) / peak
+
+    raise ValueError('pulse shape {0} not supported, use landau or expo'.format(shape))
+
+
+def getPeakOffset(shape, rise, fall):
+    """ function to return time of pulse maximum after arrival"""
+    if shape == 'landau':
+        return 3*rise - 0.22278*rise
+    return rise*numpy.log(1 + fall/rise)
+
+
+def generateChunk(nEvents, firstEvent, runType, options, rng):
+    """ function to return structured array (eventType) of nEvents synthetic events with i_evt starting at firstEvent"""
+    geometry = barGeometry(runType) # bar positions, channels, and most probable SiPM amplitude, same as barClass
+    events = numpy.zeros(nEvents, dtype=eventType)
+    events['i_evt'] = numpy.arange(firstEvent, firstEvent + nEvents)
+
+    # *** 1. track position and slopes, same in all three telescope planes
+    x = rng.uniform(options['xBeam'][0], options['xBeam'][1], nEvents)
+    y = rng.uniform(options['yBeam'][0], options['yBeam'][1], nEvents)
+    events['x_dut'] = x[:, numpy.newaxis]
+    events['y_dut'] = y[:, numpy.newaxis]
+    events['xSlope'] = rng.normal(0, options['slopeSigma'], nEvents)
+    events['ySlope'] = rng.normal(0, options['slopeSigma'], nEvents)
+
+    # *** 2. DRS time axes, 4 groups with small offsets
+    sampleTimes = numpy.arange(1024)*options['sampleTime']
+    events['time'] = sampleTimes + 0.01*numpy.arange(4)[:, numpy.newaxis]
+
+    # *** 3. pulse height and arrival time of every channel, 0 height if not hit
+    height = numpy.zeros((nEvents, 36))
+    arrival = numpy.zeros((nEvents, 36))
+    t0 = options['triggerTime'] + rng.normal(0, options['triggerJitter'], nEvents)
+    xMin, xMax = geometry.xBoundaries[0], geometry.xBoundaries[-1]
+    for barNum in (options['bars'] if options['bars'] is not None else geometry.bars):
+        r, l, mcp, drs_time = geometry.channels[barNum]
+        hit = (numpy.abs(y - geometry.yBoundaries[barNum - 1]) <= geometry.yIntegralOffset) & (x >= xMin) & (x <= xMax)
+
+        # landau-like (moyal) energy deposit, light attenuated towards each end of the bar
+        deposit = geometry.sipmMPV*( 1 - options['sipmWidth']*numpy.log(rng.normal(0, 1, nEvents)**2 + 1e-12) )
+        deposit = numpy.where(hit, deposit, 0)
+        height[:, r] += deposit*numpy.exp( -(xMax - x)/options['attenuation'] )
+        height[:, l] += deposit*numpy.exp( -(x - xMin)/options['attenuation'] )
+        arrival[:, r] = numpy.where(hit, t0 + (xMax - x)/options['lightSpeed'] + rng.normal(0, options['jitter'], nEvents), arrival[:, r])
+        arrival[:, l] = numpy.where(hit, t0 + (x - xMin)/options['lightSpeed'] + rng.normal(0, options['jitter'], nEvents), arrival[:, l])
+
+        # cross talk into SiPMs of neighbouring bars
+        for neighbour in [barNum - 1, barNum + 1]:
+            if neighbour in geometry.channels:
+                for channel in geometry.channels[neighbour][:2]:
+                    height[:, channel] += options['crossTalk']*deposit
+                    arrival[:, channel] = numpy.where(hit & (arrival[:, channel] == 0), t0 + rng.normal(0, options['jitter'], nEvents), arrival[:, channel])
+
+    # MCPs see every particle
+    for mcp in geometry.mcpDRSChannels:
+        height[:, mcp] = numpy.clip(rng.normal(options['mcpAmp'], 0.25*options['mcpAmp'], nEvents), 0, None)
+        arrival[:, mcp] = t0 + options['mcpDelay'] - getPeakOffset(options['mcpShape'], options['mcpRise'], options['mcpFall']) + rng.normal(0, options['jitter'], nEvents)
+    height = numpy.clip(height, 0, 1000) # DRS range
+
+    # *** 4. waveforms: negative pulses plus noise, in DRS counts (mV)
+    waveforms = rng.normal(0, options['noise'], (nEvents, 36, 1024))
+    for channel in range(36):
+        hit = numpy.flatnonzero(height[:, channel] > 0)
+        if len(hit) == 0:
+            continue
+        group = channel/9
+        isMCP = channel in geometry.mcpDRSChannels
+        shape, rise, fall = (options['mcpShape'], options['mcpRise'], options['mcpFall']) if isMCP else (options['sipmShape'], options['sipmRise'], options['sipmFall'])
+        dt = events['time'][hit, group] - arrival[hit, channel][:, numpy.newaxis]
+        waveforms[hit, channel] -= height[hit, channel][:, numpy.newaxis]*pulseShape(shape, dt, rise, fall)
+
+    events['channel'] = numpy.clip(numpy.round(waveforms), -32768, 32767)
+
+    # *** 5. amplitude and peak time as reconstructed by the DAQ
+    pulse = -events['channel'].astype(numpy.float32)
+    peak = pulse.argmax(axis=2)
+    events['amp'] = pulse.max(axis=2)
+    events['t_peak'] = events['time'][numpy.arange(nEvents)[:, numpy.newaxis], numpy.arange(36)/9, peak]
+
+    return events
+
+
+def writeSyntheticTree(fileName, nEvents, runType='all5exposure', options=None, seed=1, chunkSize=500):
+    """ function to write nEvents synthetic events to TTree 'pulse' in fileName, generated and written in chunks of chunkSize events"""
+    settings = dict(defaultOptions)
+    if options is not None:
+        settings.update(options)
+    rng = numpy.random.RandomState(seed)
+
+    for first in range(0, nEvents, chunkSize):
+        chunk = generateChunk(min(chunkSize, nEvents - first), first, runType, settings, rng)
+        array2root(chunk, fileName, 'pulse', mode='recreate' if first == 0 else 'update')
+        print "{0} of {1} events written to {2}".format(first + len(chunk), nEvents, fileName)
+
+
+if __name__ == '__main__':
+    # *** 0. setup parser for command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", help="output root file", default='synthetic_pulse.root')
+    parser.add_argument("--nEvents", help="number of events", type=int, default=10000)
+    parser.add_argument("--runType", help="bar layout and SiPM amplitudes: all5exposure/bottomBars_66V/topBars_66V", default='all5exposure')
+    parser.add_argument("--seed", help="random seed, same seed gives same file", type=int, default=1)
+    parser.add_argument("--chunkSize", help="number of events generated and written at once", type=int, default=500)
+    parser.add_argument("--bars", help="comma-separated list of bars in beam (default: all bars of run type)", default=None)
+    for option, value in sorted(defaultOptions.items()):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            parser.add_argument("--{0}".format(option), help="generator setting (default {0})".format(value), type=float, default=value)
+        elif isinstance(value, str):
+            parser.add_argument("--{0}".format(option), help="generator setting (default {0})".format(value), default=value)
+    args = parser.parse_args()
+
+    if args.runType not in runGeometries:
+        print "#### Please use {0} when setting --runType <option>. Supplied value ({1}) does not match ####\nEXITING".format('/'.join(sorted(runGeometries)), args.runType)
+        quit()
+    for shapeOption in ['sipmShape', 'mcpShape']:
+        if getattr(args, shapeOption) not in ['landau', 'expo']:
+            print "#### Please use landau/expo when setting --{0} <option>. Supplied value ({1}) does not match ####\nEXITING".format(shapeOption, getattr(args, shapeOption))
+            quit()
+
+    options = dict( (option, getattr(args, option)) for option in defaultOptions if hasattr(args, option) )
+    options['bars'] = None if args.bars is None else [int(barNum) for barNum in args.bars.split(',')]
+    writeSyntheticTree(args.output, args.nEvents, args.runType, options, args.seed, args.chunkSize)
@@ -0,0 +1,169 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 16, 2018
+#Purpose: Sidecar cache of reconstructed per-event, per-channel SiPM times, keyed by input files and fit configuration
+
+import os, sys, argparse, glob, hashlib, time, fcntl
+import numpy
+
+# key = entry*maxChannels + DRS channel
+maxChannels = 64
+
+
+def getFileIdentity(files):
+    """ function to return list of 'name|size|mtime' strings identifying input files, only name for files not on local disk"""
+    identity = []
+    for f in files:
+        if os.path.isfile(f):
+            stat = os.stat(f)
+            identity.append( '{0}|{1}|{2}'.format(os.path.abspath(f), stat.st_size, int(stat.st_mtime)) )
+        else:
+            identity.append( f )
+    return identity
+
+
+def getHash(text):
+    """ function to return short hash of text"""
+    return hashlib.sha1(text).hexdigest()[:12]
+
+
+def getCacheFileName(cacheDir, files, fitConfig):
+    """ function to return cache file for list of input files (chained in this order) and dictionary of fit parameters"""
+    fileKey = getHash( '\n'.join(getFileIdentity(files)) )
+    configKey = getHash( repr(sorted(fitConfig.items())) )
+    return '{0}/timing_{1}_{2}.npz'.format(cacheDir, fileKey, configKey)
+
+
+class timingCache:
+    def __init__(self, cacheDir, files, fitConfig):
+        self.cacheDir = cacheDir
+        self.fileName = getCacheFileName(cacheDir, files, fitConfig)
+        self.files = getFileIdentity(files)
+        self.fitConfig = repr(sorted(fitConfig.items()))
+        self.nHits = 0
+        self.nMisses = 0
+        self.newKeys = []
+        self.newTimes = []
+
+        if not os.path.isdir(self.cacheDir):
+            os.system( 'mkdir -p {0}'.format(self.cacheDir) )
+        self.keys, self.times, self.status = self.readCache()
+        print "-- timing cache {0}: {1} channel times".format(self.fileName, len(self.keys))
+
+    # =============================
+
+    def readCache(self):
+        """ function to return sorted (keys, times, fit status) stored in cache file, empty arrays if there is none"""
+        if not os.path.isfile(self.fileName):
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0), numpy.zeros(0, dtype=numpy.int8)
+
+        cache = numpy.load(self.fileName)
+        return cache['keys'], cache['times'], cache['status']
+
+    # =============================
+
+    def lookup(self, entries, channels):
+        """ function to return (times, found) for arrays of tree entries and DRS channels of the same shape. times of channels not in cache are 0"""
+        keys = numpy.asarray(entries, dtype=numpy.int64)*maxChannels + numpy.asarray(channels, dtype=numpy.int64)
+        times = numpy.zeros(keys.shape)
+        found = numpy.zeros(keys.shape, dtype=bool)
+        if len(self.keys) > 0:
+            index = numpy.minimum( numpy.searchsorted(self.keys, keys), len(self.keys) - 1 )
+            found = self.keys[index] == keys
+            times[found] = self.times[index[found]]
+
+        self.nHits += found.sum()
+        self.nMisses += (~found).sum()
+        return times, found
+
+    # =============================
+
+    def store(self, entries, channels, times):
+        """ function to add reconstructed times (0 if fit failed) of tree entries and DRS channels, written by save()"""
+        self.newKeys.append( (numpy.asarray(entries, dtype=numpy.int64)*maxChannels + numpy.asarray(channels, dtype=numpy.int64)).ravel() )
+        self.newTimes.append( numpy.asarray(times, dtype=numpy.float64).ravel() )
+
+    # =============================
+
+    def save(self):
+        """ function to merge new times into cache file. re-read, merge, and atomic replace are done holding an exclusive lock on the cache's lock file,
+        so processes sharing a cache (e.g. --nWorkers shards) keep each other's new times"""
+        print "-- timing cache: {0} channel times from cache, {1} refitted".format(self.nHits, self.nMisses)
+        if len(self.newKeys) == 0:
+            return
+
+        lock = open('{0}.lock'.format(self.fileName[:-4]), 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            self.mergeAndWrite()
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    # =============================
+
+    def mergeAndWrite(self):
+        """ function to merge new times into times currently in cache file and replace it, only called by save() holding the lock"""
+        keys, times, status = self.readCache()
+        keys = numpy.concatenate([keys] + self.newKeys)
+        times = numpy.concatenate([times] + self.newTimes)
+        status = numpy.concatenate([status] + [(t != 0).astype(numpy.int8) for t in self.newTimes])
+
+        # keep latest time of each key
+        unique, last = numpy.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last
+        self.keys, self.times, self.status = unique, times[last], status[last]
+        self.newKeys = []
+        self.newTimes = []
+
+        tmpName = '{0}.{1}.tmp.npz'.format(self.fileName[:-4], os.getpid())
+        numpy.savez(tmpName, keys=self.keys, times=self.times, status=self.status, files=numpy.array(self.files), fitConfig=numpy.array(self.fitConfig))
+        os.rename(tmpName, self.fileName)
+
+
+def printCacheReport(cacheDir):
+    """ function to print size, number of channel times, and input files of all caches in cacheDir"""
+    totalBytes = 0
+    print "==== Timing cache report: {0} ====".format(cacheDir)
+    for fileName in sorted(glob.glob('{0}/timing_*.npz'.format(cacheDir))):
+        cache = numpy.load(fileName)
+        size = os.path.getsize(fileName)
+        totalBytes += size
+        status = cache['status']
+        print "{0}: {1:0.1f} MB, {2} channel times ({3} good fits), last written {4}".format(os.path.basename(fileName), size/1e6, len(status), int(status.sum()), time.ctime(os.path.getmtime(fileName)))
+        print "    files: {0}".format(', '.join(f.split('|')[0] for f in cache['files']))
+        print "    fit:   {0}".format(cache['fitConfig'])
+    print "total: {0:0.1f} MB".format(totalBytes/1e6)
+
+
+def pruneCache(cacheDir, maxAgeDays=None):
+    """ function to remove caches whose input files changed or disappeared since they were written, and caches not written for maxAgeDays"""
+    for fileName in sorted(glob.glob('{0}/timing_*.npz'.format(cacheDir))):
+        files = [f for f in numpy.load(fileName)['files']]
+        stale = getFileIdentity([f.split('|')[0] for f in files]) != files
+        old = maxAgeDays is not None and time.time() - os.path.getmtime(fileName) > maxAgeDays*86400
+        if stale or old:
+            print "removing {0} ({1})".format(fileName, 'input files changed' if stale else 'older than {0} days'.format(maxAgeDays))
+            os.remove(fileName)
+
+
+def clearCache(cacheDir):
+    """ function to remove all caches (and their lock files) in cacheDir"""
+    for fileName in glob.glob('{0}/timing_*.npz'.format(cacheDir)) + glob.glob('{0}/timing_*.lock'.format(cacheDir)):
+        os.remove(fileName)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cacheDir", help="timing cache directory", default='timingCache')
+    parser.add_argument("--prune", help="remove caches of changed input files", action='store_true')
+    parser.add_argument("--maxAgeDays", help="with --prune, also remove caches not written for this many days", type=float, default=None)
+    parser.add_argument("--clear", help="remove all caches", action='store_true')
+    args = parser.parse_args()
+
+    if args.clear:
+        clearCache(args.cacheDir)
+    elif args.prune:
+        pruneCache(args.cacheDir, args.maxAgeDays)
+    printCacheReport(args.cacheDir)
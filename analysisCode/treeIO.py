@@ -0,0 +1,123 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 2, 2018
+#Purpose: Helper functions for reading testbeam pulse trees as numpy arrays
+
+import numpy
+from ROOT import TFile, TChain
+from root_numpy import tree2array, array2root
+
+# branches of the pulse tree needed by each analysis mode. everything else (channelFilter, linearTime*, ...) is never read
+branchProfiles = {
+    'leakage' : ['amp', 'x_dut', 'y_dut', 'xSlope', 'ySlope'],
+    'scalar'  : ['amp', 'x_dut', 'y_dut', 'xSlope', 'ySlope', 't_peak', 'i_evt'],
+    'timing'  : ['amp', 'x_dut', 'y_dut', 'xSlope', 'ySlope', 't_peak', 'i_evt', 'time', 'channel'],
+}
+
+# rows of skim tree 'skim', one per event and bar (consecutive rows per event, one for each bar of the run type geometry). fitStatus: -1 not fitted, else
+# 1*(right time good) + 2*(left time good). vetoBits: bit i set if bar is vetoed with barClass.skimVetoOptions[i]. hitBar: bar of the track, 0 if none, and
+# fiducial: track inside in-bar area of the row's bar (barGeometry.getHitBars, getFiducial)
+skimType = [('entry', numpy.int64), ('i_evt', numpy.uint32), ('bar', numpy.int8),
+            ('ampR', numpy.float32), ('ampL', numpy.float32), ('ampMCP', numpy.float32), ('x', numpy.float32), ('y', numpy.float32),
+            ('xSlope', numpy.float32), ('ySlope', numpy.float32), ('timeR', numpy.float32), ('timeL', numpy.float32), ('timeMCP', numpy.float32),
+            ('fitStatus', numpy.int8), ('passSignal', numpy.bool_), ('passSlope', numpy.bool_), ('vetoBits', numpy.int8),
+            ('hitBar', numpy.int8), ('fiducial', numpy.bool_)]
+branchProfiles['skim'] = [name for name, dtype in skimType]
+
+
+def readChunks(tree, branches, chunkSize, start=0, stop=None):
+    """ generator returning structured numpy arrays of branches for consecutive chunks of chunkSize entries in [start, stop)"""
+    if stop is None:
+        stop = tree.GetEntries()
+
+    first = start
+    while first < stop:
+        last = min(first + chunkSize, stop)
+        yield tree2array(tree, branches=branches, start=first, stop=last)
+        first = last
+
+
+def setBranchProfile(tree, branches):
+    """ function to disable all branches of tree except branches"""
+    tree.SetBranchStatus("*", 0)
+    for branch in branches:
+        tree.SetBranchStatus(branch, 1)
+
+
+def getZipBytesPerEvent(tree, branches=None):
+    """ function to return compressed (i.e. read from disk) bytes per event of branches, all branches if None"""
+    if tree.GetEntries() == 0:
+        return 0.
+    tree.LoadTree(0)
+    firstTree = tree.GetTree() # first file of a TChain is taken as representative
+    if branches is None:
+        branches = [b.GetName() for b in firstTree.GetListOfBranches()]
+
+    zipBytes = sum( firstTree.GetBranch(branch).GetZipBytes("*") for branch in branches if firstTree.GetBranch(branch) )
+    return zipBytes / float(firstTree.GetEntries())
+
+
+def getBytesRead():
+    """ function to return total bytes read from all ROOT files so far"""
+    return TFile.GetFileBytesRead()
+
+
+def printIOReport(tree, branches, nEvents, bytesRead):
+    """ function to print bytes read per event (bytesRead in total for nEvents) with branch profile vs. reading all branches"""
+    allBytes = getZipBytesPerEvent(tree)
+    profileBytes = getZipBytesPerEvent(tree, branches)
+    measured = bytesRead / float(max(nEvents, 1))
+
+    print "==== I/O report ({0} events) ====".format(nEvents)
+    print "all branches:       {0:10.0f} bytes/event (on disk)".format(allBytes)
+    print "profile branches:   {0:10.0f} bytes/event (on disk), {1}".format(profileBytes, ', '.join(branches))
+    print "measured:           {0:10.0f} bytes/event read".format(measured)
+    if profileBytes > 0:
+        print "expected I/O saving: x{0:0.1f}".format(allBytes/profileBytes)
+
+
+def readWaveforms(tree, entries, channels, groups):
+    """ function to read time and channel branches only for given entries, copying only DRS channels and time groups that are needed. returns structured array like tree2array"""
+    waveforms = numpy.zeros(len(entries), dtype=[('time', numpy.float32, (4, 1024)), ('channel', numpy.int16, (36, 1024))])
+    setBranchProfile(tree, ['time', 'channel'])
+
+    for k, entry in enumerate(entries):
+        tree.GetEntry(int(entry))
+        time = tree.time
+        time.SetSize(4*1024)
+        channel = tree.channel
+        channel.SetSize(36*1024)
+        waveforms['time'][k, groups] = numpy.frombuffer(time, dtype=numpy.float32, count=4*1024).reshape(4, 1024)[groups]
+        waveforms['channel'][k, channels] = numpy.frombuffer(channel, dtype=numpy.int16, count=36*1024).reshape(36, 1024)[channels]
+
+    return waveforms
+
+
+def mergeFields(a, b):
+    """ function to merge the fields of two structured arrays with the same number of rows"""
+    merged = numpy.zeros(len(a), dtype=a.dtype.descr + b.dtype.descr)
+    for array in (a, b):
+        for name in array.dtype.names:
+            merged[name] = array[name]
+    return merged
+
+
+def getTreeFiles(tree):
+    """ function to return list of file names holding a TTree or TChain"""
+    if isinstance(tree, TChain):
+        return [element.GetTitle() for element in tree.GetListOfFiles()]
+    return [tree.GetCurrentFile().GetName()]
+
+
+def buildChain(files, treeName='pulse'):
+    """ function to return TChain of treeName over list of files"""
+    chain = TChain(treeName)
+    for f in files:
+        chain.Add(f)
+    return chain
+
+
+def writeSkimRows(rows, fileName, first):
+    """ function to append skim rows to tree 'skim' of fileName, recreating the file for the first rows"""
+    array2root(rows, fileName, 'skim', mode='recreate' if first else 'update')
@@ -0,0 +1,95 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: June 4, 2018
+#Purpose: Validate batched leading-edge fits (fitEngine batch, edgeFitter) against one TGraph + TF1 fit per waveform (fitEngine root) on the same waveforms of a run
+
+import os, sys, argparse, tempfile, shutil
+import numpy
+from ROOT import gROOT
+from barClass import barClass
+from barGeometry import runGeometries
+from treeIO import readChunks, buildChain
+
+
+def getSelectedWaveforms(bar, chunk):
+    """ function to return (event index in chunk, DRS channel, DRS time group) of SiPM waveforms of bars passing the signal threshold on both sides, and their MCP waveforms"""
+    selected = []
+    amp = chunk['amp']
+    for barNum in bar.bars:
+        r, l, mcp, drs_time = bar.getChannelsForBar(barNum)
+        for iEvt in numpy.flatnonzero( (amp[:, r] > bar.signalThreshold) & (amp[:, l] > bar.signalThreshold) ):
+            selected += [(iEvt, r, drs_time), (iEvt, l, drs_time), (iEvt, mcp, drs_time)]
+
+    return numpy.array(selected, dtype=int).reshape(-1, 3)
+
+
+def compareTimes(rootTimes, batchTimes, isMCP, tolerance):
+    """ function to print agreement of root and batch times (0 if wonky) for SiPM and MCP waveforms. returns mask of failing waveforms:
+    |difference| above tolerance, or a time from root only (batch fit lost)"""
+    both = (rootTimes != 0) & (batchTimes != 0)
+    diff = numpy.abs(rootTimes - batchTimes)
+    failed = (both & (diff > tolerance)) | ((rootTimes != 0) & (batchTimes == 0))
+
+    print "==== fitEngine batch vs. root ({0} waveforms, tolerance {1:0.1f} ps) ====".format(len(rootTimes), 1000*tolerance)
+    print "{0:6s} {1:>8s} {2:>8s} {3:>8s} {4:>8s} {5:>10s} {6:>10s} {7:>10s} {8:>10s}".format("type", "both", "root", "batch", "failed", "p50 [ps]", "p90 [ps]", "p99 [ps]", "max [ps]")
+    for name, rows in [('SiPM', ~isMCP), ('MCP', isMCP)]:
+        d = 1000*diff[rows & both]
+        percentiles = numpy.percentile(d, [50, 90, 99, 100]) if len(d) > 0 else numpy.zeros(4)
+        print "{0:6s} {1:8d} {2:8d} {3:8d} {4:8d} {5:10.2f} {6:10.2f} {7:10.2f} {8:10.2f}".format(name, (rows & both).sum(), (rows & (rootTimes != 0) & (batchTimes == 0)).sum(),
+                                                                                                 (rows & (rootTimes == 0) & (batchTimes != 0)).sum(), (rows & failed).sum(), *percentiles)
+
+    return failed
+
+
+if __name__ == '__main__':
+    # *** 0. setup parser for command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="pulse tree file(s), comma-separated", required=True)
+    parser.add_argument("--treeName", help="name of tree in input files", default='pulse')
+    parser.add_argument("--runType", help="run type of input, one of {0}".format(', '.join(sorted(runGeometries))), required=True)
+    parser.add_argument("--nEvents", help="number of events, from first entry", type=int, default=5000)
+    parser.add_argument("--fitFunction", help="fit function of both engines (default: barClass value)", default=None)
+    parser.add_argument("--tolerance", help="allowed |time difference| in ns", type=float, default=0.01)
+    parser.add_argument("--maxFailed", help="allowed fraction of waveforms outside tolerance or without batch time", type=float, default=0.01)
+    args = parser.parse_args()
+
+    if args.runType not in runGeometries:
+        print "#### Please use one of {0} when setting --runType <type>. Supplied value ({1}) does not match ####\nEXITING".format(', '.join(sorted(runGeometries)), args.runType)
+        quit()
+
+    gROOT.SetBatch(True)
+    topDir = tempfile.mkdtemp(prefix='validateEdgeFitter_') # fit snapshots of both engines go here
+    rootBar = barClass(None, args.runType, topDir, None, fitEngine='root', runAnalysis=False)
+    batchBar = barClass(None, args.runType, topDir, None, fitEngine='batch', runAnalysis=False)
+    if args.fitFunction is not None:
+        rootBar.fitFunction = batchBar.fitFunction = args.fitFunction
+
+    # *** 1. same waveforms and startFit for both engines
+    rootTimes, batchTimes, isMCP = [], [], []
+    for chunk in readChunks(buildChain(args.input.split(','), args.treeName), ['amp', 'i_evt', 'time', 'channel'], 1000, 0, args.nEvents):
+        selected = getSelectedWaveforms(batchBar, chunk)
+        if len(selected) == 0:
+            continue
+        iEvts, drs_channels, drs_times = selected[:, 0], selected[:, 1], selected[:, 2]
+        channels = chunk['channel'][iEvts, drs_channels]
+        startFits = batchBar.getStartFitForChunk(channels, drs_channels)
+
+        # *** 2. fit one by one with ROOT and all at once with edgeFitter
+        for k, iEvt in enumerate(iEvts):
+            rootTimes.append( rootBar.getTimingForChannel(chunk['time'][iEvt].ravel(), chunk['channel'][iEvt].ravel(), drs_times[k], drs_channels[k], chunk['i_evt'][iEvt], startFits[k]) )
+        batchTimes.append( batchBar.getBatchTimingForWaveforms(chunk['time'][iEvts, drs_times], channels, drs_channels, startFits, chunk['i_evt'][iEvts]) )
+        isMCP.append( batchBar.geometry.isMCPChannel(drs_channels) )
+
+    shutil.rmtree(topDir, True)
+    if len(rootTimes) == 0:
+        print "#### No waveforms above signal threshold in first {0} events of {1} ####\nEXITING".format(args.nEvents, args.input)
+        quit()
+
+    # *** 3. compare
+    rootTimes, batchTimes, isMCP = numpy.array(rootTimes, dtype=numpy.float64), numpy.concatenate(batchTimes), numpy.concatenate(isMCP)
+    batchBar.printEdgeFitReport()
+    failed = compareTimes(rootTimes, batchTimes, isMCP, args.tolerance)
+
+    print "{0} of {1} waveforms differ".format(failed.sum(), len(failed))
+    sys.exit(1 if failed.mean() > args.maxFailed else 0)
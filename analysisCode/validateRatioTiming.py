@@ -0,0 +1,108 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 24, 2018
+#Purpose: Validate numpy ratio-method timing (ratioTiming) against the C++ RecoWaveForm of DRS-UVa on the same events
+
+import os, sys, argparse
+import numpy
+from array import array
+from ROOT import TFile, gInterpreter
+from treeIO import readChunks, buildChain
+from ratioTiming import recoWaveforms, getChannelDRS, defaultCalibration
+
+# (numpy field, C++ accessor, SimpleCheck branch prefix, tolerance, relative?) of compared quantities. SimpleCheck stores |aReco| and |amp(imin)|
+comparisons = [('tReco',   'tReco',   'recoTime_',     0.001, False), # 1 ps
+               ('aReco',   'aReco',   'recoAmp_',      1e-3,  True),
+               ('ampMin',  None,      'maxSample_',    1e-6,  False),
+               ('pedMean', 'pedMean', 'pedestalMean_', 1e-6,  False),
+               ('pedRMS',  'pedRMS',  'pedestalRMS_',  1e-6,  False),
+               ('nRatios', 'nRatios', 'nRatios_',      0,     False)]
+
+
+def getCppResults(samples, times, calibration, headerFile):
+    """ function to run C++ RecoWaveForm (compiled from headerFile by cling) on each waveform and return dictionary of quantity -> array"""
+    gInterpreter.ProcessLine('#include "{0}"'.format(os.path.abspath(headerFile)))
+    from ROOT import ChannelDRS, RecoWaveForm
+
+    parT, parA = array('d', calibration['parTvsR']), array('d', calibration['parAvsR'])
+    ch = ChannelDRS(len(parT), parT, len(parA), parA, calibration['ratioMin'], calibration['ratioMax'], calibration['ampThreshold'], calibration['timeStep'], calibration['ratioStep'])
+    results = dict( (name, numpy.zeros(len(samples))) for name, accessor, branch, tolerance, relative in comparisons )
+    for k in range(len(samples)):
+        reco = RecoWaveForm(array('d', samples[k].astype(numpy.float64)), array('d', times[k].astype(numpy.float64)), ch)
+        for name, accessor, branch, tolerance, relative in comparisons:
+            results[name][k] = reco.amp(reco.imin()) if accessor is None else getattr(reco, accessor)()
+
+    return results
+
+
+def getSimpleCheckResults(fileName, channel, nEvents):
+    """ function to return dictionary of quantity -> array for the first nEvents events of tree ch<channel>_Tree written by BTL_Analysis (pulse::SimpleCheck)"""
+    f = TFile(fileName, 'READ')
+    tree = f.Get('ch{0}_Tree'.format(channel))
+    if not tree:
+        print "#### No tree ch{0}_Tree in {1}, run BTL_Analysis with SimpleCheck({0}, \"ch{0}\") ####\nEXITING".format(channel, fileName)
+        quit()
+
+    results = dict( (name, numpy.zeros(nEvents)) for name, accessor, branch, tolerance, relative in comparisons )
+    for k in range( min(nEvents, tree.GetEntries()) ):
+        tree.GetEntry(k)
+        for name, accessor, branch, tolerance, relative in comparisons:
+            results[name][k] = getattr(tree, '{0}ch{1}'.format(branch, channel))
+    f.Close()
+
+    return results
+
+
+def compareResults(reco, reference, absolute):
+    """ function to print max difference and number of events outside tolerance of each quantity. absolute: compare |aReco| and |ampMin| (SimpleCheck). returns number of failing events"""
+    nFailed = numpy.zeros(len(reco), dtype=bool)
+    print "==== numpy ratio method vs. C++ RecoWaveForm ({0} waveforms, {1} with tReco) ====".format(len(reco), (reco['tReco'] < 1e9).sum())
+    print "{0:10s} {1:>14s} {2:>12s} {3:>10s}".format("quantity", "max |diff|", "tolerance", "failed")
+    for name, accessor, branch, tolerance, relative in comparisons:
+        values = reco[name].astype(numpy.float64)
+        if absolute and name in ('aReco', 'ampMin'):
+            values = numpy.abs(values)
+        diff = numpy.abs(values - reference[name])
+        if relative:
+            diff = diff / numpy.maximum(numpy.abs(reference[name]), 1)
+        failed = diff > tolerance
+        nFailed |= failed
+        print "{0:10s} {1:14.3g} {2:12.3g} {3:10d}".format(name, diff.max() if len(diff) > 0 else 0, tolerance, failed.sum())
+        for k in numpy.flatnonzero(failed)[:5]:
+            print "    event {0}: numpy {1}, C++ {2}".format(k, values[k], reference[name][k])
+
+    return nFailed.sum()
+
+
+if __name__ == '__main__':
+    # *** 0. setup parser for command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="pulse tree file", required=True)
+    parser.add_argument("--channel", help="DRS channel to reconstruct", type=int, default=10)
+    parser.add_argument("--group", help="DRS time group of channel (default: channel/8, as in DRS-UVa/pulse.cc)", type=int, default=None)
+    parser.add_argument("--nEvents", help="number of events, from first entry", type=int, default=2000)
+    parser.add_argument("--cppTree", help="compare to output of BTL_Analysis (simpleCheck.root) instead of running RecoWaveForm through PyROOT", default=None)
+    parser.add_argument("--header", help="RecoWaveForm header compiled for comparison", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'DRS-UVa', 'RecoWaveForm.h'))
+    args = parser.parse_args()
+
+    group = args.group if args.group is not None else args.channel/8
+    if( group < 0 or group > 3 ):
+        print "#### Please use 0-3 when setting --group <n>. Supplied value ({0}) does not match ####\nEXITING".format(group)
+        quit()
+
+    # *** 1. same waveforms for both reconstructions
+    chunks = list( readChunks(buildChain([args.input]), ['time', 'channel'], 1000, 0, args.nEvents) )
+    samples = numpy.concatenate([chunk['channel'][:, args.channel] for chunk in chunks])
+    times = numpy.concatenate([chunk['time'][:, group] for chunk in chunks])
+
+    # *** 2. reconstruct and compare
+    reco = recoWaveforms(samples, times, getChannelDRS(defaultCalibration))[0]
+    if args.cppTree is None:
+        reference = getCppResults(samples, times, defaultCalibration, args.header)
+    else:
+        reference = getSimpleCheckResults(args.cppTree, args.channel, len(samples))
+    nFailed = compareResults(reco, reference, args.cppTree is not None)
+
+    print "{0} of {1} waveforms differ".format(nFailed, len(samples))
+    sys.exit(1 if nFailed > 0 else 0)
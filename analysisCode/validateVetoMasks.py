@@ -0,0 +1,117 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 30, 2018
+#Purpose: Validate veto decisions of barClass (returnVetoDecision, getVetoMasks from barGeometry veto channels) against the original if-chain of returnVetoDecision
+
+import os, sys, argparse, tempfile, shutil
+import numpy
+from ROOT import gROOT
+from barClass import barClass
+from barGeometry import runGeometries, vetoOptions, fiveBarChannels
+
+
+def getLegacyVetoDecision(amp, barNum, vetoOption, vetoThreshold):
+    """ function to return veto decision of the original barClass.returnVetoDecision (March 2018 five-bar module), frozen here as reference"""
+
+    if vetoOption == 'none':
+        return False
+
+    if vetoOption == 'singleAdj':
+        if barNum == 1 and amp[3] < vetoThreshold:
+            return False
+        if barNum == 2 and amp[5] < vetoThreshold:
+            return False
+        if barNum == 3 and amp[10] < vetoThreshold:
+            return False
+        if barNum == 4 and amp[5] < vetoThreshold:
+            return False
+        if barNum == 5 and amp[10] < vetoThreshold:
+            return False
+    if vetoOption == 'doubleAdj':
+        if barNum == 1 and amp[3] < vetoThreshold and amp[4] < vetoThreshold:
+            return False
+        if barNum == 2 and amp[5] < vetoThreshold and amp[6] < vetoThreshold:
+            return False
+        if barNum == 3 and amp[10] < vetoThreshold and amp[11] < vetoThreshold:
+            return False
+        if barNum == 4 and amp[5] < vetoThreshold and amp[6] < vetoThreshold:
+            return False
+        if barNum == 5 and amp[10] < vetoThreshold and amp[11] < vetoThreshold:
+            return False
+
+    if vetoOption == 'allAdj':
+        if barNum == 1 and amp[3] < vetoThreshold and amp[4] < vetoThreshold:
+            return False
+        if barNum == 2 and amp[5] < vetoThreshold and amp[6] < vetoThreshold and amp[1] < vetoThreshold and amp[2] < vetoThreshold:
+            return False
+        if barNum == 3 and amp[10] < vetoThreshold and amp[11] < vetoThreshold and amp[3] < vetoThreshold and amp[4] < vetoThreshold:
+            return False
+        if barNum == 4 and amp[5] < vetoThreshold and amp[6] < vetoThreshold and amp[12] < vetoThreshold and amp[13] < vetoThreshold:
+            return False
+        if barNum == 5 and amp[10] < vetoThreshold and amp[11] < vetoThreshold:
+            return False
+
+    if vetoOption == 'all':
+        if barNum == 1 and amp[3] < vetoThreshold and amp[4] < vetoThreshold and amp[5] < vetoThreshold and amp[6] < vetoThreshold and amp[10] < vetoThreshold and amp[11] < vetoThreshold and amp[12] < vetoThreshold and amp[13] < vetoThreshold:
+            return False
+        if barNum == 2 and amp[1] < vetoThreshold and amp[2] < vetoThreshold and amp[5] < vetoThreshold and amp[6] < vetoThreshold and amp[10] < vetoThreshold and amp[11] < vetoThreshold and amp[12] < vetoThreshold and amp[13] < vetoThreshold:
+            return False
+        if barNum == 3 and amp[1] < vetoThreshold and amp[2] < vetoThreshold and amp[3] < vetoThreshold and amp[4] < vetoThreshold and amp[10] < vetoThreshold and amp[11] < vetoThreshold and amp[12] < vetoThreshold and amp[13] < vetoThreshold:
+            return False
+        if barNum == 4 and amp[1] < vetoThreshold and amp[2] < vetoThreshold and amp[3] < vetoThreshold and amp[4] < vetoThreshold and amp[5] < vetoThreshold and amp[6] < vetoThreshold and amp[12] < vetoThreshold and amp[13] < vetoThreshold:
+            return False
+        if barNum == 5 and amp[1] < vetoThreshold and amp[2] < vetoThreshold and amp[3] < vetoThreshold and amp[4] < vetoThreshold and amp[5] < vetoThreshold and amp[6] < vetoThreshold and amp[10] < vetoThreshold and amp[11] < vetoThreshold:
+            return False
+
+
+    # if it gets here, means nothing returned, i.e. no logic was settled. veto event
+    return True
+
+
+def getTestAmplitudes(nEvents, vetoThreshold, rng):
+    """ function to return amp arrays (nEvents x 36 DRS channels) mixing noise, signals, values at and next to vetoThreshold, and NaN"""
+    values = numpy.array([0., vetoThreshold - 1e-3, vetoThreshold, vetoThreshold + 1e-3, 1000., numpy.nan])
+    amp = values[rng.randint(0, len(values), (nEvents, 36))]
+    quiet = rng.uniform(0, 1, nEvents) < 0.5 # half of events with all channels below threshold except a few, so every bar is sometimes not vetoed
+    amp[quiet] = numpy.where(rng.uniform(0, 1, (quiet.sum(), 36)) < 0.05, amp[quiet], 0.)
+    return amp.astype(numpy.float32)
+
+
+class ampEvent:
+    def __init__(self, amp):
+        self.amp = amp
+
+
+if __name__ == '__main__':
+    # *** 0. setup parser for command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nEvents", help="number of random events per run type", type=int, default=20000)
+    parser.add_argument("--seed", help="random seed", type=int, default=1)
+    args = parser.parse_args()
+
+    gROOT.SetBatch(True)
+    rng = numpy.random.RandomState(args.seed)
+    topDir = tempfile.mkdtemp(prefix='validateVetoMasks_')
+    nMismatches = 0
+
+    # *** 1. compare array masks and event-loop decisions with the original if-chain, for every run type, option (plus an unknown one), and bar
+    for runType in sorted(runGeometries):
+        if runGeometries[runType]['channels'] != fiveBarChannels:
+            print "-- {0}: not the five-bar module of the original if-chain, skipped".format(runType)
+            continue
+        bar = barClass(None, runType, topDir, None, runAnalysis=False)
+        amp = getTestAmplitudes(args.nEvents, bar.vetoThreshold, rng)
+        for vetoOption in vetoOptions + ['unknown']:
+            masks = bar.getVetoMasks(amp, vetoOption)
+            for k, barNum in enumerate(bar.bars):
+                legacy = numpy.array([getLegacyVetoDecision(amp[i], barNum, vetoOption, bar.vetoThreshold) for i in range(len(amp))])
+                decisions = numpy.array([bar.returnVetoDecision(ampEvent(amp[i]), barNum, vetoOption) for i in range(len(amp))])
+                nBad = (masks[:, k] != legacy).sum() + (decisions != legacy).sum()
+                nMismatches += nBad
+                print "{0:15s} {1:10s} bar {2}: {3:0.1f}% vetoed, {4} mismatches".format(runType, vetoOption, barNum, 100.*legacy.mean(), nBad)
+
+    shutil.rmtree(topDir, True)
+    if nMismatches > 0:
+        sys.exit( "#### {0} veto decisions differ from the original if-chain ####\nEXITING".format(nMismatches) )
+    print "-- all veto decisions agree with the original if-chain"
@@ -0,0 +1,159 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 23, 2018
+#Purpose: Memory-mapped numpy copy of the DRS waveforms of a pulse tree, with event number index, for random access to single waveforms without reading the tree
+
+import os, sys, argparse, json
+import numpy
+from numpy.lib.format import open_memmap
+from treeIO import readChunks, buildChain, getTreeFiles
+from timingCache import getFileIdentity
+
+# file holding number of events, input files, and index settings, written last so a store without it is incomplete
+storeInfoFile = 'store.json'
+
+
+def writeWaveformStore(tree, storeDir, chunkSize=1000):
+    """ function to copy i_evt, time[4][1024], and channel[36][1024] of all entries of tree to .npy files in storeDir, plus index event number -> entry.
+    entries are tree (or TChain) entries, so stores are only valid for the same files in the same order"""
+    if not os.path.isdir(storeDir):
+        os.system( 'mkdir -p {0}'.format(storeDir) )
+    if os.path.isfile('{0}/{1}'.format(storeDir, storeInfoFile)):
+        os.remove('{0}/{1}'.format(storeDir, storeInfoFile))
+
+    nEvents = tree.GetEntries()
+    events = open_memmap('{0}/i_evt.npy'.format(storeDir), mode='w+', dtype=numpy.uint32, shape=(nEvents,))
+    times = open_memmap('{0}/time.npy'.format(storeDir), mode='w+', dtype=numpy.float32, shape=(nEvents, 4, 1024))
+    channels = open_memmap('{0}/channel.npy'.format(storeDir), mode='w+', dtype=numpy.int16, shape=(nEvents, 36, 1024))
+
+    first = 0
+    for chunk in readChunks(tree, ['i_evt', 'time', 'channel'], chunkSize):
+        events[first:first + len(chunk)] = chunk['i_evt']
+        times[first:first + len(chunk)] = chunk['time']
+        channels[first:first + len(chunk)] = chunk['channel']
+        first += len(chunk)
+        print "{0} of {1} events copied to {2}".format(first, nEvents, storeDir)
+    for array in (events, times, channels):
+        array.flush()
+
+    # dense index: entry of each event number, -1 if absent. chains of several runs repeat event numbers, the first entry is kept
+    index = numpy.full(int(events.max()) + 1 if nEvents > 0 else 0, -1, dtype=numpy.int64)
+    entries = numpy.arange(nEvents, dtype=numpy.int64)
+    index[events[::-1]] = entries[::-1]
+    numpy.save('{0}/eventIndex.npy'.format(storeDir), index)
+    nDuplicates = nEvents - (index >= 0).sum()
+    if nDuplicates > 0:
+        print "#### {0} entries repeat an earlier event number, only the first is found by event number ####".format(nDuplicates)
+
+    info = {'nEvents' : nEvents, 'files' : getFileIdentity(getTreeFiles(tree)), 'treeName' : tree.GetName(), 'nDuplicates' : int(nDuplicates)}
+    json.dump(info, open('{0}/{1}'.format(storeDir, storeInfoFile), 'w'), indent=1, sort_keys=True)
+
+
+class waveformStore:
+    def __init__(self, storeDir):
+        self.storeDir = storeDir
+        if not os.path.isfile('{0}/{1}'.format(storeDir, storeInfoFile)):
+            raise IOError('no complete waveform store in {0}, write it with waveformStore.py --input <files> --storeDir {0}'.format(storeDir))
+
+        info = json.load( open('{0}/{1}'.format(storeDir, storeInfoFile)) )
+        self.nEvents = info['nEvents']
+        self.files = info['files']
+        # arrays stay on disk, only pages of requested waveforms are read
+        self.events = numpy.load('{0}/i_evt.npy'.format(storeDir), mmap_mode='r')
+        self.times = numpy.load('{0}/time.npy'.format(storeDir), mmap_mode='r')
+        self.channels = numpy.load('{0}/channel.npy'.format(storeDir), mmap_mode='r')
+        self.eventIndex = numpy.load('{0}/eventIndex.npy'.format(storeDir), mmap_mode='r')
+
+    # =============================
+
+    def isValidFor(self, tree):
+        """ function to return True if store was written from the files of tree, unchanged since"""
+        return getFileIdentity(getTreeFiles(tree)) == self.files
+
+    # =============================
+
+    def getEntry(self, event):
+        """ function to return tree entry of event number event"""
+        if event < 0 or event >= len(self.eventIndex) or self.eventIndex[event] < 0:
+            raise KeyError('event {0} not in waveform store {1}'.format(event, self.storeDir))
+        return int(self.eventIndex[event])
+
+    # =============================
+
+    def getWaveform(self, event, drs_channel):
+        """ function to return (time, samples) arrays of DRS channel drs_channel for event number event"""
+        entry = self.getEntry(event)
+        return self.times[entry, drs_channel/9], self.channels[entry, drs_channel]
+
+    # =============================
+
+    def getChunk(self, first, last, branches=['i_evt', 'time', 'channel']):
+        """ function to return structured array with branches (i_evt, time, and/or channel) of entries [first, last), like tree2array"""
+        arrays = {'i_evt' : self.events, 'time' : self.times, 'channel' : self.channels}
+        chunk = numpy.zeros(last - first, dtype=[(branch, arrays[branch].dtype, arrays[branch].shape[1:]) for branch in branches])
+        for branch in branches:
+            chunk[branch] = arrays[branch][first:last]
+        return chunk
+
+    # =============================
+
+    def readWaveforms(self, entries, channels, groups):
+        """ function to return time and channel of given entries with only DRS channels and time groups that are needed filled, like treeIO.readWaveforms"""
+        waveforms = numpy.zeros(len(entries), dtype=[('time', numpy.float32, (4, 1024)), ('channel', numpy.int16, (36, 1024))])
+        entries = numpy.asarray(entries, dtype=numpy.int64)
+        for group in groups:
+            waveforms['time'][:, group] = self.times[entries, group]
+        for channel in channels:
+            waveforms['channel'][:, channel] = self.channels[entries, channel]
+        return waveforms
+
+
+if __name__ == '__main__':
+    # *** 0. setup parser for command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--storeDir", help="directory of waveform store", required=True)
+    parser.add_argument("--input", help="comma-separated list of pulse tree files to convert (chained in this order)", default=None)
+    parser.add_argument("--treeName", help="name of tree in input files", default='pulse')
+    parser.add_argument("--chunkSize", help="number of events copied at once", type=int, default=1000)
+    parser.add_argument("--event", help="event number to inspect", type=int, default=None)
+    parser.add_argument("--channel", help="DRS channel to inspect, or comma-separated list", default=None)
+    parser.add_argument("--output", help="with --event: draw waveforms to this file instead of printing samples", default=None)
+    args = parser.parse_args()
+
+    if( args.input is None and args.event is None ):
+        print "#### Please set --input <files> to write or --event <number> to inspect a store ####\nEXITING"
+        quit()
+    if( args.event is not None and args.channel is None ):
+        print "#### Please set --channel <number> with --event <number> ####\nEXITING"
+        quit()
+
+    # *** 1. convert input files
+    if args.input is not None:
+        writeWaveformStore(buildChain(args.input.split(','), args.treeName), args.storeDir, args.chunkSize)
+
+    # *** 2. inspect waveforms of one event
+    if args.event is not None:
+        store = waveformStore(args.storeDir)
+        drs_channels = [int(c) for c in args.channel.split(',')]
+        if args.output is None:
+            for drs_channel in drs_channels:
+                time, samples = store.getWaveform(args.event, drs_channel)
+                print "event {0} (entry {1}), channel {2}: min {3} at {4:0.2f} ns".format(args.event, store.getEntry(args.event), drs_channel, samples.min(), time[samples.argmin()])
+                for t, sample in zip(time, samples):
+                    print "{0:10.3f} {1:8d}".format(t, sample)
+        else:
+            from ROOT import gROOT, TCanvas, TGraph, TLegend
+            gROOT.SetBatch(True)
+            c0 = TCanvas("c0", "c0", 800, 600)
+            leg = TLegend(0.7, 0.15, 0.88, 0.15 + 0.05*len(drs_channels))
+            graphs = []
+            for k, drs_channel in enumerate(drs_channels):
+                time, samples = store.getWaveform(args.event, drs_channel)
+                graphs.append( TGraph(len(time), time.astype(numpy.float64), samples.astype(numpy.float64)) )
+                graphs[-1].SetLineColor(k + 1)
+                graphs[-1].SetTitle("event {0};time [ns];amplitude [mV]".format(args.event))
+                graphs[-1].Draw("AL" if k == 0 else "L")
+                leg.AddEntry(graphs[-1], "channel {0}".format(drs_channel), "l")
+            leg.Draw()
+            c0.Print(args.output)
@@ -0,0 +1,97 @@
+# !/usr/bin/python
+
+#Author: Ben Tannenwald
+#Date: May 4, 2018
+#Purpose: Vectorized helper functions for DRS waveforms stored as (events x 1024) sample arrays
+
+import numpy
+
+
+def firstTrueIndex(mask):
+    """ function to return index of first True along last axis of boolean array (mask), -1 if there is none"""
+    first = mask.argmax(axis=-1)
+    first[ ~mask.any(axis=-1) ] = -1
+    return first
+
+
+def findFirstCrossing(samples, threshold):
+    """ function to return index of first sample with |sample| > threshold for each waveform in samples (events x 1024), -1 if never crossed. threshold can be a number or one value per waveform"""
+    samples = numpy.atleast_2d(samples)
+    threshold = numpy.asarray(threshold, dtype=numpy.float64)
+    if threshold.ndim == 1:
+        threshold = threshold[:, numpy.newaxis]
+
+    return firstTrueIndex( numpy.abs(samples.astype(numpy.float64)) > threshold )
+
+
+def findPercentCrossing(samples, fraction):
+    """ function to return index of first sample above fraction of waveform maximum for each waveform in samples (events x 1024), -1 if never crossed or maximum <= 0"""
+    samples = numpy.atleast_2d(samples).astype(numpy.float64)
+    maxADC = samples.max(axis=-1)
+
+    first = firstTrueIndex( samples > fraction*maxADC[:, numpy.newaxis] )
+    first[ maxADC <= 0 ] = -1
+    return first
+
+
+def findCrossingTime(isCrossed, tStart, tStop, step, tolerance):
+    """ function to return first time between tStart and tStop (either direction) where isCrossed(t) becomes True, None if it never does. Brackets in steps of step then bisects down to tolerance"""
+    if isCrossed(tStart):
+        return tStart
+
+    direction = 1 if tStop >= tStart else -1
+    tLast = tStart
+    while True:
+        tNext = tLast + direction*step
+        if direction*(tNext - tStop) > 0:
+            tNext = tStop
+        if isCrossed(tNext):
+            break
+        if tNext == tStop:
+            return None
+        tLast = tNext
+
+    # bisection inside bracket [tLast, tNext]
+    while abs(tNext - tLast) > tolerance:
+        tMid = 0.5*(tLast + tNext)
+        if isCrossed(tMid):
+            tNext = tMid
+        else:
+            tLast = tMid
+
+    return tNext
+
+
+def findCrossingTimes(isCrossed, tStart, tStop, step, tolerance):
+    """ vectorized findCrossingTime with one bracket per row: isCrossed takes an array of one time per row and returns a boolean array. returns array of crossing times, nan where never crossed"""
+    tStart = numpy.asarray(tStart, dtype=numpy.float64)
+    tStop = numpy.asarray(tStop, dtype=numpy.float64)*numpy.ones(tStart.shape)
+    direction = numpy.where(tStop >= tStart, 1., -1.)
+
+    crossing = numpy.full(tStart.shape, numpy.nan)
+    atStart = isCrossed(tStart)
+    crossing[atStart] = tStart[atStart]
+
+    # bracket in steps of step for all rows at once
+    tLast = tStart.copy()
+    tNext = tStart.copy()
+    active = ~atStart
+    found = numpy.zeros(tStart.shape, dtype=bool)
+    while active.any():
+        tTry = numpy.where(active, tLast + direction*step, tLast)
+        tTry = numpy.where(direction*(tTry - tStop) > 0, tStop, tTry)
+        crossed = active & isCrossed(tTry)
+        tNext[crossed] = tTry[crossed]
+        found |= crossed
+        active &= ~crossed & (tTry != tStop)
+        tLast = numpy.where(active, tTry, tLast)
+
+    # bisection inside brackets [tLast, tNext]
+    while found.any() and numpy.abs(tNext - tLast)[found].max() > tolerance:
+        tMid = 0.5*(tLast + tNext)
+        crossed = isCrossed(tMid)
+        tNext = numpy.where(found & crossed, tMid, tNext)
+        tLast = numpy.where(found & ~crossed, tMid, tLast)
+
+    crossing[found] = tNext[found]
+    return crossing